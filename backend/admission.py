@@ -0,0 +1,445 @@
+"""
+Контроль допуска запросов к ML симуляторам
+
+Перед запуском симулятора по параметрам (и форме сохраненного датасета)
+оценивается, сколько секунд CPU и памяти займет запрос. Если оценка
+выше бюджета, запрос по очереди понижается (прореживание точек ответа,
+выборка для силуэта, mini-batch K-means, более грубая сетка границы),
+а если и это не помогает - отклоняется с 413.
+
+Коэффициенты подобраны по замерам на одном ядре (sklearn 1.x, numpy
+с OpenBLAS) и дают порядок величины, а не точное время.
+"""
+import os
+import time
+
+from fastapi import HTTPException
+
+from ml_workers import set_job_context, MAX_WORKERS
+
+CPU_BUDGET_SECONDS = float(os.getenv("ML_CPU_BUDGET_SECONDS", "5"))
+MEMORY_BUDGET_BYTES = int(os.getenv("ML_MEMORY_BUDGET_MB", "512")) * 1024 * 1024
+# Дороже этого запрос уходит в полосу low, даже если симулятор интерактивный
+INTERACTIVE_CPU_SECONDS = float(os.getenv("ML_INTERACTIVE_CPU_SECONDS", "0.5"))
+
+# До скольких точек прореживается ответ при понижении
+DOWNGRADE_DISPLAY_POINTS = 5000
+# Размер выборки для силуэта при понижении
+SILHOUETTE_SAMPLE_SIZE = 5000
+# Память под блок попарных расстояний при подсчете силуэта
+SILHOUETTE_WORKING_MEMORY_MB = 64
+# Разрешение сетки границы kNN без понижения и после него
+KNN_BOUNDARY_RESOLUTION = 100
+DOWNGRADE_BOUNDARY_RESOLUTION = 50
+
+# Коэффициенты модели стоимости (секунды на единицу работы)
+_GENERATE_PER_VALUE = 3e-8           # генерация данных, на n * d
+_LOGISTIC_PER_SAMPLE = 7e-7          # liblinear, на n
+_KNN_TREE_PER_QUERY_LOG = 2e-7       # KD-дерево (d <= 3), на запрос * log2(n_train)
+_KNN_BRUTE_PER_DISTANCE = 5e-10      # d > 3, дерево вырождается в перебор: на запрос * n_train * d
+_KMEANS_PER_POINT_CLUSTER = 5e-8     # Lloyd, на n * k * n_init
+_MINIBATCH_PER_POINT = 1.5e-6        # MiniBatchKMeans, на n
+_SILHOUETTE_PER_PAIR = 1.2e-8        # силуэт, на n^2
+_LSTSQ_PER_POINT = 1e-7              # линейная регрессия, на n
+_RESPONSE_PER_VALUE = 6e-7           # tolist и валидация ответа, на значение
+_RUN_OVERHEAD = 1e-2                 # проверки sklearn и разбиение, на прогон ансамбля
+_GD_PER_VALUE = 2e-8                 # градиентный спуск, на n * (d + 1) * learning rate * эпоху
+_GD_PER_BATCH = 2e-5                 # накладные расходы мини-батча (перестановка, индексация)
+_POLYNOMIAL_PER_POINT_DEGREE = 1.2e-7  # ортогонализация и матрицы Вандермонда, на n * степень
+_PREPROCESS_PER_VALUE = 2.5e-8       # шаг предобработки, на n * d
+_GRAPH_PER_EDGE = 1.5e-7             # граф соседей DBSCAN, на ребро
+_STREAM_RLS_PER_POINT = 4e-8         # потоковая регрессия RLS: генерация, оценка и обновление, на точку
+_STREAM_SGD_PER_POINT = 1.7e-7       # то же для SGD (partial_fit), на точку
+_STREAM_RLS_PER_CHUNK = 6e-5         # накладные расходы чанка RLS (решение 2x2, выборка точек)
+_STREAM_SGD_PER_CHUNK = 6.5e-4       # накладные расходы partial_fit на чанк
+
+# Память: значения в ответе (list + JSON) и массивы numpy
+_BYTES_PER_RESPONSE_VALUE = 110
+_BYTES_PER_ARRAY_VALUE = 8
+# Ребро графа соседей: индекс и расстояние в графе плюс временные массивы при построении и разметке
+_BYTES_PER_EDGE = 48
+
+
+class CostEstimate:
+    """
+    Оценка стоимости запроса
+
+    options - аргументы для функции вычисления (понижения, которые
+    не выражаются через параметры запроса), downgrades - названия
+    примененных понижений для заголовков ответа.
+    """
+
+    def __init__(self, cpu_seconds: float = 0.0, memory_bytes: float = 0.0, budget_factor: float = 1.0):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        # Во сколько раз бюджет больше обычного (фоновые задания)
+        self.budget_factor = budget_factor
+        self.options = {}
+        self.downgrades = []
+
+    def __add__(self, other: "CostEstimate") -> "CostEstimate":
+        total = CostEstimate(
+            self.cpu_seconds + other.cpu_seconds,
+            self.memory_bytes + other.memory_bytes,
+            max(self.budget_factor, other.budget_factor)
+        )
+        total.downgrades = sorted(set(self.downgrades) | set(other.downgrades))
+        return total
+
+    @property
+    def over_budget(self) -> bool:
+        return (self.cpu_seconds > CPU_BUDGET_SECONDS * self.budget_factor
+                or self.memory_bytes > MEMORY_BUDGET_BYTES * self.budget_factor)
+
+    def headers(self, cpu_seconds: float = None, wall_seconds: float = None) -> dict:
+        """Заголовки ответа: оценка и (если известна) фактическая стоимость"""
+        headers = {
+            "X-Cost-Estimated-CPU": f"{self.cpu_seconds:.3f}",
+            "X-Cost-Estimated-Memory-MB": f"{self.memory_bytes / 1024 / 1024:.1f}",
+        }
+        if cpu_seconds is not None:
+            headers["X-Cost-Actual-CPU"] = f"{cpu_seconds:.3f}"
+        if wall_seconds is not None:
+            headers["X-Cost-Actual-Wall"] = f"{wall_seconds:.3f}"
+        if self.downgrades:
+            headers["X-Cost-Downgrades"] = ",".join(self.downgrades)
+        return headers
+
+
+def admit(estimate: CostEstimate):
+    """
+    Отклоняет запрос, если даже после понижений он не укладывается в бюджет
+
+    Допущенный, но дорогой запрос переводится в полосу low пула воркеров.
+    """
+    if estimate.cpu_seconds > INTERACTIVE_CPU_SECONDS:
+        set_job_context(lane="low")
+    if estimate.over_budget:
+        raise HTTPException(
+            status_code=413,
+            detail=(
+                f"Request is too expensive: estimated {estimate.cpu_seconds:.1f} s CPU and "
+                f"{estimate.memory_bytes / 1024 / 1024:.0f} MB memory, budget is "
+                f"{CPU_BUDGET_SECONDS * estimate.budget_factor:.1f} s and "
+                f"{MEMORY_BUDGET_BYTES * estimate.budget_factor / 1024 / 1024:.0f} MB"
+            )
+        )
+
+
+def run_measured(func, *args, **kwargs):
+    """
+    Выполняет func и возвращает (результат, CPU секунды, wall секунды)
+
+    CPU считается для текущего потока воркера, поэтому работа во
+    внутренних потоках BLAS/OpenMP в него не попадает.
+    """
+    cpu_started = time.thread_time()
+    wall_started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.thread_time() - cpu_started, time.perf_counter() - wall_started
+
+
+def _data_shape(params, data, default_features: int):
+    if data is not None:
+        X = data[0]
+        return X.shape[0], X.shape[1] if X.ndim > 1 else 1
+    return params.n_samples, default_features
+
+
+def _check_positive(**values):
+    for name, value in values.items():
+        if value < 1:
+            raise HTTPException(status_code=400, detail=f"{name} must be positive")
+
+
+def _display_points(params, n_samples: int) -> int:
+    if params.max_display_points is None:
+        return n_samples
+    return min(n_samples, params.max_display_points)
+
+
+def _limit_display(params):
+    """Прореживание точек ответа: метрики по-прежнему считаются по всем данным"""
+    return params.model_copy(update={"max_display_points": DOWNGRADE_DISPLAY_POINTS})
+
+
+def estimate_linear_regression(n_points: int, budget_factor: float = 1.0) -> CostEstimate:
+    _check_positive(n_points=n_points)
+    return CostEstimate(
+        budget_factor=budget_factor,
+        cpu_seconds=(_LSTSQ_PER_POINT + 3 * _RESPONSE_PER_VALUE) * n_points,
+        # x, y и predicted_y в ответе плюс матрица признаков
+        memory_bytes=n_points * (3 * _BYTES_PER_RESPONSE_VALUE + 4 * _BYTES_PER_ARRAY_VALUE)
+    )
+
+
+def _ensemble_cost(single: CostEstimate, repeats: int) -> CostEstimate:
+    """Стоимость repeats прогонов, идущих параллельно на воркерах пула"""
+    return CostEstimate(
+        (single.cpu_seconds + _RUN_OVERHEAD) * repeats,
+        single.memory_bytes * min(repeats, MAX_WORKERS),
+        single.budget_factor
+    )
+
+
+def _fit_cost(model_type: str, n_train: int, n_queries: int, d: int, k: int = 5) -> float:
+    """CPU на обучение модели по n_train точкам и предсказание для n_queries"""
+    if model_type == "knn":
+        if d <= 3:
+            return _KNN_TREE_PER_QUERY_LOG * n_queries * max(n_train, 2).bit_length() * max(k, 1) ** 0.5
+        return _KNN_BRUTE_PER_DISTANCE * n_queries * n_train * d
+    if model_type == "logistic":
+        # Предсказание, как и обучение, линейно по числу точек
+        return _LOGISTIC_PER_SAMPLE * (n_train + n_queries) * max(d, 2) ** 0.5
+    return _LSTSQ_PER_POINT * (n_train + n_queries) * d
+
+
+def _classification_cost(params, model_type: str, n: int, d: int, k: int, resolution: int,
+                         budget_factor: float, repeats: int = None) -> CostEstimate:
+    n_train = int(n * 0.7)
+    n_test = n - n_train
+    cpu = _GENERATE_PER_VALUE * n * d
+    boundary = 0
+    if model_type == "knn" and repeats is None and (d == 2 or params.projection == "pca"):
+        boundary = resolution ** 2
+    cpu += _fit_cost(model_type, n_train, n_test + boundary, d, k)
+
+    shown = _display_points(params, n) if repeats is None else 0
+    cpu += _RESPONSE_PER_VALUE * 2 * shown * (d + 1)
+    # x, x_train и x_test с метками в ответе; исходные данные и разбиение в памяти
+    memory = (2 * shown * (d + 1) * _BYTES_PER_RESPONSE_VALUE
+              + 3 * n * (d + 1) * _BYTES_PER_ARRAY_VALUE)
+    estimate = CostEstimate(cpu, memory, budget_factor)
+    return estimate if repeats is None else _ensemble_cost(estimate, repeats)
+
+
+def estimate_classification(params, model_type: str, data=None, k: int = 5, budget_factor: float = 1.0,
+                            repeats: int = None):
+    """
+    Оценка для логистической регрессии и kNN
+
+    Возвращает (params, estimate): params могут быть заменены на
+    пониженные, estimate.options передаются в функцию вычисления.
+    repeats - число прогонов ансамбля: они считают только метрики, без
+    точек ответа и границы решений, поэтому и понижать нечего.
+    """
+    n, d = _data_shape(params, data, params.n_features)
+    _check_positive(n_samples=n, n_features=d, k=k)
+    if repeats is not None:
+        return params, _classification_cost(params, model_type, n, d, k, 0, budget_factor, repeats)
+
+    resolution = KNN_BOUNDARY_RESOLUTION
+    downgrades = []
+    estimate = _classification_cost(params, model_type, n, d, k, resolution, budget_factor)
+
+    if estimate.over_budget and _display_points(params, n) > DOWNGRADE_DISPLAY_POINTS:
+        params = _limit_display(params)
+        estimate = _classification_cost(params, model_type, n, d, k, resolution, budget_factor)
+        downgrades.append("max_display_points")
+    if estimate.over_budget and model_type == "knn":
+        resolution = DOWNGRADE_BOUNDARY_RESOLUTION
+        estimate = _classification_cost(params, model_type, n, d, k, resolution, budget_factor)
+        downgrades.append("boundary_resolution")
+
+    estimate.downgrades = downgrades
+    if model_type == "knn":
+        estimate.options = {"boundary_resolution": resolution}
+    return params, estimate
+
+
+def _clustering_cost(params, n: int, d: int, silhouette_sample, minibatch: bool,
+                     budget_factor: float, repeats: int = None) -> CostEstimate:
+    k = params.n_clusters
+    cpu = _GENERATE_PER_VALUE * n * d
+    if minibatch:
+        cpu += _MINIBATCH_PER_POINT * n
+    else:
+        # Теплый старт заранее не гарантирован - считаем по худшему случаю n_init=10
+        cpu += _KMEANS_PER_POINT_CLUSTER * n * k * 10
+    m = min(n, silhouette_sample or n)
+    cpu += _SILHOUETTE_PER_PAIR * m * m
+
+    shown = _display_points(params, n) if repeats is None else 0
+    cpu += _RESPONSE_PER_VALUE * shown * (d + 1)
+    memory = (shown * (d + 1) * _BYTES_PER_RESPONSE_VALUE
+              + 2 * n * (d + 1) * _BYTES_PER_ARRAY_VALUE
+              + min(m * m * _BYTES_PER_ARRAY_VALUE, SILHOUETTE_WORKING_MEMORY_MB * 1024 * 1024))
+    estimate = CostEstimate(cpu, memory, budget_factor)
+    return estimate if repeats is None else _ensemble_cost(estimate, repeats)
+
+
+def estimate_clustering(params, data=None, budget_factor: float = 1.0, repeats: int = None):
+    """
+    Оценка для K-means
+
+    Понижения по очереди: прореживание ответа, силуэт по выборке,
+    MiniBatchKMeans вместо полного K-means. Для ансамбля (repeats
+    прогонов без точек ответа) остаются только два последних.
+    """
+    n_features = params.n_features if params.dataset_shape == "blobs" else 2
+    n, d = _data_shape(params, data, n_features)
+    _check_positive(n_samples=n, n_features=d, n_clusters=params.n_clusters)
+    if params.n_clusters > n:
+        raise HTTPException(status_code=400, detail="n_clusters must not exceed the number of samples")
+
+    silhouette_sample, minibatch = None, False
+    downgrades = []
+    estimate = _clustering_cost(params, n, d, silhouette_sample, minibatch, budget_factor, repeats)
+
+    if estimate.over_budget and repeats is None and _display_points(params, n) > DOWNGRADE_DISPLAY_POINTS:
+        params = _limit_display(params)
+        estimate = _clustering_cost(params, n, d, silhouette_sample, minibatch, budget_factor)
+        downgrades.append("max_display_points")
+    if estimate.over_budget and n > SILHOUETTE_SAMPLE_SIZE:
+        silhouette_sample = SILHOUETTE_SAMPLE_SIZE
+        estimate = _clustering_cost(params, n, d, silhouette_sample, minibatch, budget_factor, repeats)
+        downgrades.append("silhouette_sample")
+    if estimate.over_budget:
+        minibatch = True
+        estimate = _clustering_cost(params, n, d, silhouette_sample, minibatch, budget_factor, repeats)
+        downgrades.append("minibatch")
+
+    estimate.downgrades = downgrades
+    estimate.options = {"silhouette_sample": silhouette_sample, "minibatch": minibatch}
+    return params, estimate
+
+
+def estimate_cross_validation(params, data_params, data=None, budget_factor: float = 1.0) -> CostEstimate:
+    """
+    Оценка для кросс-валидации: n_splits обучений на (k-1)/k данных
+
+    data_params - параметры данных (классификации или регрессии), data -
+    сохраненный датасет. Фолды идут параллельно, и каждый воркер
+    копирует свою обучающую часть.
+    """
+    if params.model_type == "linear_regression":
+        n, d = data_params.n_points, 1
+    else:
+        n, d = _data_shape(data_params, data, data_params.n_features)
+    _check_positive(n_samples=n, n_features=d, k=params.k)
+    n_test = n // params.n_splits
+    fold = _fit_cost(params.model_type, n - n_test, n_test, d, params.k) + _RUN_OVERHEAD
+    cpu = _GENERATE_PER_VALUE * n * d + fold * params.n_splits
+    memory = (2 * n * (d + 1) + params.n_splits * n
+              + min(params.n_splits, MAX_WORKERS) * n * (d + 1)) * _BYTES_PER_ARRAY_VALUE
+    return CostEstimate(cpu, memory, budget_factor)
+
+
+def estimate_polynomial_curve(params, budget_factor: float = 1.0) -> CostEstimate:
+    """Оценка для кривой по степени полинома: одно QR-разложение до max_degree"""
+    n, degree = params.data.n_points, params.max_degree
+    _check_positive(n_points=n, n_curve_points=params.n_curve_points)
+    # train/test точки и кривая для каждой степени
+    shown = 4 * n + degree * params.n_curve_points
+    cpu = _POLYNOMIAL_PER_POINT_DEGREE * n * degree + _RESPONSE_PER_VALUE * shown
+    memory = 2 * n * (degree + 1) * _BYTES_PER_ARRAY_VALUE + shown * _BYTES_PER_RESPONSE_VALUE
+    return CostEstimate(cpu, memory, budget_factor)
+
+
+def estimate_gradient_descent(params, data_params, data=None, budget_factor: float = 1.0) -> CostEstimate:
+    """Оценка для градиентного спуска: n_epochs эпох сразу для всех learning rate"""
+    if params.model_type == "logistic":
+        n, d = _data_shape(data_params, data, data_params.n_features)
+    else:
+        n, d = data_params.n_points, 1
+    _check_positive(n_samples=n, n_features=d, n_epochs=params.n_epochs)
+    n_rates = len(params.learning_rates)
+    n_batches = -(-n // (params.batch_size or n))
+    epoch = _GD_PER_VALUE * n * (d + 1) * n_rates + _GD_PER_BATCH * n_batches
+    # В событиях: loss каждой эпохи и веса раз в snapshot_stride эпох
+    shown = params.n_epochs * n_rates * (1 + (d + 1) / max(params.snapshot_stride, 1))
+    cpu = _GENERATE_PER_VALUE * n * d + epoch * params.n_epochs + _RESPONSE_PER_VALUE * shown
+    # Признаки со столбцом единиц и предсказания, остатки и градиенты для всех learning rate
+    memory = (n * (d + 1) + 3 * n * n_rates) * _BYTES_PER_ARRAY_VALUE
+    return CostEstimate(cpu, memory, budget_factor)
+
+
+def estimate_streaming_regression(params, budget_factor: float = 1.0) -> CostEstimate:
+    """Оценка для потоковой регрессии: весь поток, чанк за чанком (память - один чанк)"""
+    _check_positive(n_points=params.n_points, chunk_size=params.chunk_size)
+    n_chunks = -(-params.n_points // params.chunk_size)
+    n_events = -(-n_chunks // max(params.report_every, 1))
+    if params.method == "sgd":
+        cpu = _STREAM_SGD_PER_POINT * params.n_points + _STREAM_SGD_PER_CHUNK * n_chunks
+    else:
+        cpu = _STREAM_RLS_PER_POINT * params.n_points + _STREAM_RLS_PER_CHUNK * n_chunks
+    # В каждом событии - выборка точек последнего чанка (x и y)
+    cpu += _RESPONSE_PER_VALUE * 2 * params.sample_points * n_events
+    # x, y, z, остатки и временные массивы чанка
+    memory = 6 * min(params.chunk_size, params.n_points) * _BYTES_PER_ARRAY_VALUE
+    return CostEstimate(cpu, memory, budget_factor)
+
+
+def estimate_preprocessing(params, data=None, budget_factor: float = 1.0) -> CostEstimate:
+    """Оценка для предпросмотра предобработки (каждый шаг - проход по столбцам)"""
+    n, d = _data_shape(params, data, params.n_features)
+    _check_positive(n_samples=n, n_features=d)
+    steps = len(params.preprocessing.steps) if params.preprocessing is not None else 0
+    cpu = _GENERATE_PER_VALUE * n * d + _PREPROCESS_PER_VALUE * n * d * max(steps, 1)
+    memory = (steps + 2) * n * d * _BYTES_PER_ARRAY_VALUE
+    return CostEstimate(cpu, memory, budget_factor)
+
+
+def estimate_dataset(n_samples: int, n_features: int, budget_factor: float = 1.0) -> CostEstimate:
+    """Оценка для генерации сохраняемого датасета"""
+    _check_positive(n_samples=n_samples, n_features=n_features)
+    return CostEstimate(
+        budget_factor=budget_factor,
+        cpu_seconds=_GENERATE_PER_VALUE * n_samples * n_features,
+        # Генераторы sklearn держат промежуточные массивы того же размера, что X и y
+        memory_bytes=2 * n_samples * (n_features + 1) * _BYTES_PER_ARRAY_VALUE
+    )
+
+
+def _density_cost(data_params, n: int, d: int, silhouette_sample, edges: int,
+                  budget_factor: float) -> CostEstimate:
+    # Граф соседей: запрос по дереву для каждой точки и найденные ребра
+    cpu = _GENERATE_PER_VALUE * n * d + _KNN_TREE_PER_QUERY_LOG * n * max(n, 2).bit_length()
+    cpu += _GRAPH_PER_EDGE * edges
+    m = min(n, silhouette_sample or n)
+    cpu += _SILHOUETTE_PER_PAIR * m * m
+    shown = _display_points(data_params, n)
+    cpu += _RESPONSE_PER_VALUE * shown * (d + 1)
+    memory = (shown * (d + 1) * _BYTES_PER_RESPONSE_VALUE
+              + 2 * n * (d + 1) * _BYTES_PER_ARRAY_VALUE
+              + min(m * m * _BYTES_PER_ARRAY_VALUE, SILHOUETTE_WORKING_MEMORY_MB * 1024 * 1024)
+              + edges * _BYTES_PER_EDGE)
+    return CostEstimate(cpu, memory, budget_factor)
+
+
+def estimate_density_clustering(params, data_params, data=None, edges=None, budget_factor: float = 1.0):
+    """
+    Оценка для DBSCAN
+
+    Возвращает (data_params, estimate), как estimate_clustering.
+    edges - ожидаемое число ребер графа (с запасом по радиусу, без
+    запаса); None - еще не оценено, тогда считаются только запросы к
+    дереву. Понижения: прореживание ответа, силуэт по выборке, граф
+    ровно радиуса eps (движение ползунка eps вверх перестроит его).
+    """
+    n_features = data_params.n_features if data_params.dataset_shape == "blobs" else 2
+    n, d = _data_shape(data_params, data, n_features)
+    _check_positive(n_samples=n, n_features=d, min_samples=params.min_samples)
+
+    silhouette_sample = None
+    with_headroom, exact = edges or (0, 0)
+    graph_edges = with_headroom
+    downgrades = []
+    estimate = _density_cost(data_params, n, d, silhouette_sample, graph_edges, budget_factor)
+
+    if estimate.over_budget and _display_points(data_params, n) > DOWNGRADE_DISPLAY_POINTS:
+        data_params = _limit_display(data_params)
+        estimate = _density_cost(data_params, n, d, silhouette_sample, graph_edges, budget_factor)
+        downgrades.append("max_display_points")
+    if estimate.over_budget and n > SILHOUETTE_SAMPLE_SIZE:
+        silhouette_sample = SILHOUETTE_SAMPLE_SIZE
+        estimate = _density_cost(data_params, n, d, silhouette_sample, graph_edges, budget_factor)
+        downgrades.append("silhouette_sample")
+    if estimate.over_budget and exact < with_headroom:
+        graph_edges = exact
+        estimate = _density_cost(data_params, n, d, silhouette_sample, graph_edges, budget_factor)
+        downgrades.append("graph_radius")
+
+    estimate.downgrades = downgrades
+    estimate.options = {"silhouette_sample": silhouette_sample, "exact_radius": graph_edges < with_headroom}
+    return data_params, estimate
@@ -0,0 +1,265 @@
+"""
+Потоковая загрузка CSV в хранилище датасетов
+
+CSV читается блоками ограниченного размера (pandas chunksize), поэтому
+память не зависит от размера файла. За один проход:
+- типы столбцов уточняются по мере чтения (integer -> float -> categorical);
+- считаются статистики: количество, пропуски, mean/std (формулы Чана
+  для объединения блоков), min/max и гистограмма с расширяемым диапазоном;
+- значения числовых столбцов дописываются в сырые файлы по столбцам,
+  из которых в конце собирается X.npy для memory-mapping.
+"""
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+CSV_CHUNK_ROWS = int(os.getenv("ML_CSV_CHUNK_ROWS", "10000"))
+HISTOGRAM_BINS = 20
+MAX_TOP_VALUES = 50
+MAX_TARGET_CLASSES = 50
+
+
+class StreamingHistogram:
+    """
+    Гистограмма за один проход без заранее известного диапазона
+
+    Диапазон задается первым блоком; если следующие значения выходят за
+    него, ширина бинов удваивается (соседние бины сливаются), а диапазон
+    расширяется в нужную сторону.
+    """
+
+    def __init__(self, n_bins: int = HISTOGRAM_BINS):
+        self.n_bins = n_bins
+        self.lo = None
+        self.width = None
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+
+    def update(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        vmin, vmax = float(values.min()), float(values.max())
+        if self.lo is None:
+            self.lo = vmin
+            self.width = (vmax - vmin) / self.n_bins or 1.0
+        while vmin < self.lo or vmax > self.lo + self.width * self.n_bins:
+            self._double(extend_low=vmin < self.lo)
+        idx = np.clip(((values - self.lo) / self.width).astype(np.int64), 0, self.n_bins - 1)
+        self.counts += np.bincount(idx, minlength=self.n_bins)
+
+    def _double(self, extend_low: bool):
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        empty = np.zeros(self.n_bins // 2, dtype=np.int64)
+        if extend_low:
+            self.lo -= self.width * self.n_bins
+            self.counts = np.concatenate([empty, merged])
+        else:
+            self.counts = np.concatenate([merged, empty])
+        self.width *= 2
+
+    def to_dict(self):
+        if self.lo is None:
+            return None
+        edges = self.lo + self.width * np.arange(self.n_bins + 1)
+        return {"edges": edges.tolist(), "counts": self.counts.tolist()}
+
+
+class ColumnStats:
+    """Статистики одного столбца, накапливаемые по блокам"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.missing = 0
+        self.non_numeric = 0
+        self.integral = True
+        self.n_numeric = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = StreamingHistogram()
+        self.top_values = Counter()
+        self.top_values_truncated = False
+
+    @property
+    def dtype(self) -> str:
+        if self.non_numeric:
+            return "categorical"
+        if self.n_numeric == 0:
+            return "empty"
+        return "integer" if self.integral else "float"
+
+    def update(self, raw: pd.Series, parsed: np.ndarray):
+        self.count += len(raw)
+        missing = raw.isna().to_numpy()
+        self.missing += int(missing.sum())
+        valid = ~np.isnan(parsed)
+        self.non_numeric += int((~missing & ~valid).sum())
+
+        values = parsed[valid]
+        if len(values):
+            # Объединяем mean/M2 блока с накопленными (параллельный алгоритм Чана)
+            n_b = len(values)
+            mean_b = float(values.mean())
+            m2_b = float(((values - mean_b) ** 2).sum())
+            n = self.n_numeric + n_b
+            delta = mean_b - self.mean
+            self.mean += delta * n_b / n
+            self.m2 += m2_b + delta ** 2 * self.n_numeric * n_b / n
+            self.n_numeric = n
+
+            vmin, vmax = float(values.min()), float(values.max())
+            self.min = vmin if self.min is None else min(self.min, vmin)
+            self.max = vmax if self.max is None else max(self.max, vmax)
+            self.integral = self.integral and bool(np.all(values == np.round(values)))
+            self.histogram.update(values)
+
+        # Частоты значений считаем, пока столбец похож на категориальный
+        if not self.top_values_truncated:
+            self.top_values.update(raw.dropna().value_counts().to_dict())
+            if len(self.top_values) > MAX_TOP_VALUES:
+                self.top_values.clear()
+                self.top_values_truncated = True
+
+    def summary(self) -> dict:
+        numeric = self.dtype in ("integer", "float")
+        return {
+            "name": self.name,
+            "dtype": self.dtype,
+            "count": self.count,
+            "missing": self.missing,
+            "mean": self.mean if numeric else None,
+            "std": float(np.sqrt(self.m2 / self.n_numeric)) if numeric else None,
+            "min": self.min if numeric else None,
+            "max": self.max if numeric else None,
+            "histogram": self.histogram.to_dict() if numeric else None,
+            "top_values": (
+                {str(k): int(v) for k, v in self.top_values.most_common(10)}
+                if not self.top_values_truncated else None
+            ),
+        }
+
+
+def ingest_csv(file, out_dir: str, target_column: str = None, chunk_rows: int = CSV_CHUNK_ROWS) -> dict:
+    """
+    Читает CSV блоками и записывает X.npy (и y.npy) в out_dir
+
+    В X попадают числовые столбцы (кроме целевого), пропуски остаются NaN.
+    Целевой столбец кодируется целыми числами в порядке появления значений.
+    Строки без значения целевого столбца в датасет не попадают (их число -
+    dropped_rows); статистики столбцов считаются по всему файлу.
+    """
+    stats = None
+    raw_files = {}
+    target_codes = {}
+    target_file = None
+    n_rows = 0
+
+    try:
+        reader = pd.read_csv(file, chunksize=chunk_rows, dtype=str, skipinitialspace=True)
+        for chunk in reader:
+            if stats is None:
+                columns = [str(c) for c in chunk.columns]
+                if target_column is not None and target_column not in columns:
+                    raise ValueError(f"Target column '{target_column}' not found")
+                stats = {name: ColumnStats(name) for name in columns}
+                for i, name in enumerate(columns):
+                    if name != target_column:
+                        raw_files[name] = open(os.path.join(out_dir, f"col_{i}.f64"), "wb")
+                if target_column is not None:
+                    target_file = open(os.path.join(out_dir, "target.i64"), "wb")
+            chunk.columns = list(stats.keys())
+
+            for name, column_stats in stats.items():
+                raw = chunk[name]
+                parsed = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=np.float64)
+                column_stats.update(raw, parsed)
+                if name in raw_files:
+                    parsed.tofile(raw_files[name])
+
+            if target_file is not None:
+                # Коды значений блока переводим в сквозные коды по всему файлу
+                local_codes, uniques = pd.factorize(chunk[target_column])
+                codes = np.full(len(chunk), -1, dtype=np.int64)
+                if len(uniques):
+                    for value in uniques:
+                        target_codes.setdefault(value, len(target_codes))
+                    if len(target_codes) > MAX_TARGET_CLASSES:
+                        raise ValueError(
+                            f"Target column has more than {MAX_TARGET_CLASSES} classes"
+                        )
+                    mapping = np.array([target_codes[value] for value in uniques], dtype=np.int64)
+                    known = local_codes >= 0
+                    codes[known] = mapping[local_codes[known]]
+                codes.tofile(target_file)
+
+            n_rows += len(chunk)
+    finally:
+        for fh in raw_files.values():
+            fh.close()
+        if target_file is not None:
+            target_file.close()
+
+    if stats is None or n_rows == 0:
+        raise ValueError("CSV file is empty")
+
+    # Строки без метки отбрасываем: иначе классификаторы приняли бы -1 за отдельный класс
+    keep = None
+    if target_file is not None:
+        target_path = os.path.join(out_dir, "target.i64")
+        y = np.fromfile(target_path, dtype=np.int64)
+        os.remove(target_path)
+        if (y < 0).any():
+            keep = y >= 0
+            y = y[keep]
+        if len(y) == 0:
+            raise ValueError(f"Target column '{target_column}' has no values")
+        np.save(os.path.join(out_dir, "y.npy"), y)
+    n_samples = n_rows if keep is None else int(keep.sum())
+
+    # Собираем X из числовых столбцов, читая сырые файлы через memmap
+    feature_columns = [
+        name for name in raw_files if stats[name].dtype in ("integer", "float")
+    ]
+    if not feature_columns:
+        raise ValueError("CSV file has no numeric feature columns")
+
+    X = np.lib.format.open_memmap(
+        os.path.join(out_dir, "X.npy"), mode="w+", dtype=np.float64,
+        shape=(n_samples, len(feature_columns))
+    )
+    column_index = {name: i for i, name in enumerate(stats)}
+    feature_means = [stats[name].mean for name in feature_columns]
+    feature_missing = [stats[name].missing for name in feature_columns]
+    for j, name in enumerate(feature_columns):
+        raw_path = os.path.join(out_dir, f"col_{column_index[name]}.f64")
+        column = np.memmap(raw_path, dtype=np.float64, mode="r", shape=(n_rows,))
+        if keep is not None:
+            # Средние для заполнения пропусков - по строкам, оставшимся в датасете
+            column = column[keep]
+            missing = np.isnan(column)
+            feature_missing[j] = int(missing.sum())
+            feature_means[j] = float(column[~missing].mean()) if feature_missing[j] < len(column) else 0.0
+        X[:, j] = column
+    X.flush()
+    del X
+
+    for i, name in enumerate(stats):
+        raw_path = os.path.join(out_dir, f"col_{i}.f64")
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+    return {
+        "n_rows": n_samples,
+        "dropped_rows": n_rows - n_samples,
+        # Средние и число пропусков нужны, чтобы заполнить NaN при использовании датасета
+        "feature_means": feature_means,
+        "feature_missing": feature_missing,
+        "n_features": len(feature_columns),
+        "feature_columns": feature_columns,
+        "target_column": target_column,
+        "classes": list(target_codes),
+        "columns": [column_stats.summary() for column_stats in stats.values()],
+    }
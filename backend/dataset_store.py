@@ -0,0 +1,147 @@
+"""
+Хранилище датасетов для ML симуляторов
+
+Сгенерированные (или загруженные) массивы один раз записываются в .npy
+файлы и при чтении открываются через memory-mapping, поэтому один датасет
+можно использовать во всех симуляторах без повторной генерации.
+Метаданные и владелец хранятся в таблице datasets. Квота на диске у
+каждого пользователя своя: при ее превышении удаляются его датасеты, к
+которым он дольше всего не обращался, чужие датасеты не затрагиваются.
+"""
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ml_cache import LRUCache
+from models import Dataset
+
+DATASET_DIR = os.getenv("ML_DATASET_DIR", "./datasets")
+# Квота на пользователя
+DATASET_QUOTA_BYTES = int(os.getenv("ML_DATASET_QUOTA_MB", "512")) * 1024 * 1024
+
+
+class DatasetStore:
+    """Реестр датасетов: массивы на диске, метаданные в БД"""
+
+    def __init__(self, root: str = DATASET_DIR, quota_bytes: int = DATASET_QUOTA_BYTES):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        # Уже открытые memmap массивы, чтобы не открывать файлы на каждый запрос
+        self._opened = LRUCache(maxsize=32)
+
+    def _path(self, dataset_id: str) -> str:
+        return os.path.join(self.root, dataset_id)
+
+    def new_dataset_dir(self):
+        """Создает временный каталог для нового датасета, возвращает (id, путь)"""
+        dataset_id = uuid.uuid4().hex
+        tmp_path = self._path(f".tmp-{dataset_id}")
+        os.makedirs(tmp_path, exist_ok=True)
+        return dataset_id, tmp_path
+
+    def discard(self, tmp_path: str):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def write(self, arrays: dict):
+        """
+        Записывает массивы во временный каталог нового датасета, возвращает (id, путь)
+
+        Запись идет долго для больших массивов, поэтому вызывается в пуле
+        воркеров, а register - уже в обработчике запроса.
+        """
+        dataset_id, tmp_path = self.new_dataset_dir()
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+        return dataset_id, tmp_path
+
+    def register(self, db: Session, dataset_id: str, tmp_path: str, owner_id: int,
+                 kind: str, params: dict = None) -> Dataset:
+        """Регистрирует датасет, уже записанный в tmp_path (X.npy и, возможно, y.npy)"""
+        size_bytes = sum(
+            os.path.getsize(os.path.join(tmp_path, file_name)) for file_name in os.listdir(tmp_path)
+        )
+        X = np.load(os.path.join(tmp_path, "X.npy"), mmap_mode="r")
+        n_samples = int(X.shape[0])
+        n_features = int(X.shape[1]) if X.ndim > 1 else 1
+        del X
+
+        # Переименование атомарно: читатели не увидят недописанный датасет
+        os.replace(tmp_path, self._path(dataset_id))
+
+        record = Dataset(
+            id=dataset_id,
+            owner_id=owner_id,
+            kind=kind,
+            n_samples=n_samples,
+            n_features=n_features,
+            size_bytes=size_bytes,
+            params=json.dumps(params, default=str) if params is not None else None,
+            created_at=datetime.utcnow(),
+            last_accessed_at=datetime.utcnow()
+        )
+        db.add(record)
+        db.commit()
+        db.refresh(record)
+
+        self._evict(db, owner_id, keep_id=dataset_id)
+        return record
+
+    def get_record(self, db: Session, dataset_id: str, owner_id: int):
+        """Метаданные датасета, если он существует и принадлежит пользователю"""
+        return db.query(Dataset).filter(
+            Dataset.id == dataset_id,
+            Dataset.owner_id == owner_id
+        ).first()
+
+    def list_records(self, db: Session, owner_id: int):
+        return db.query(Dataset).filter(
+            Dataset.owner_id == owner_id
+        ).order_by(Dataset.created_at.desc()).all()
+
+    def load(self, db: Session, record: Dataset) -> dict:
+        """Открывает массивы датасета только для чтения через memory-mapping"""
+        record.last_accessed_at = datetime.utcnow()
+        db.commit()
+
+        arrays = self._opened.get(record.id)
+        if arrays is None:
+            path = self._path(record.id)
+            arrays = {
+                file_name[:-len(".npy")]: np.load(os.path.join(path, file_name), mmap_mode="r")
+                for file_name in os.listdir(path)
+                if file_name.endswith(".npy")
+            }
+            self._opened.set(record.id, arrays)
+        return arrays
+
+    def delete(self, db: Session, record: Dataset):
+        self._opened.pop(record.id)
+        shutil.rmtree(self._path(record.id), ignore_errors=True)
+        db.delete(record)
+        db.commit()
+
+    def _evict(self, db: Session, owner_id: int, keep_id: str):
+        """Удаляет давно неиспользуемые датасеты владельца, пока он не уложится в квоту"""
+        records = db.query(Dataset).filter(
+            Dataset.owner_id == owner_id
+        ).order_by(Dataset.last_accessed_at).all()
+        total = sum(r.size_bytes or 0 for r in records)
+        for record in records:
+            if total <= self.quota_bytes:
+                break
+            if record.id == keep_id:
+                continue
+            total -= record.size_bytes or 0
+            self.delete(db, record)
+
+
+dataset_store = DatasetStore()
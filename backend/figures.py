@@ -0,0 +1,212 @@
+"""
+Готовые Plotly фигуры для ответов ML симуляторов
+
+Фронтенд может не собирать трейсы из сырых массивов, а сразу передать
+фигуру в Plotly. Точки прореживаются (с сохранением долей классов),
+граница решений отдается контуром, а цвета квантуются: один трейс
+с одним цветом на класс или кластер.
+"""
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+
+from ml_data import stratified_indices
+
+MAX_FIGURE_POINTS = 5000
+PALETTE = qualitative.Plotly
+NOISE_COLOR = "#9ca3af"
+
+_LAYOUT = dict(
+    hovermode="closest",
+    legend=dict(orientation="h", y=-0.2),
+    paper_bgcolor="rgba(0,0,0,0)",
+    margin=dict(l=40, r=20, b=40, t=40)
+)
+
+
+def _color(label: int) -> str:
+    return NOISE_COLOR if label < 0 else PALETTE[label % len(PALETTE)]
+
+
+def _to_dict(fig: go.Figure) -> dict:
+    # Через JSON, чтобы в ответе были только стандартные типы
+    return json.loads(fig.to_json())
+
+
+def _sample(points: np.ndarray, labels: np.ndarray, limit: int = MAX_FIGURE_POINTS):
+    idx, _ = stratified_indices(labels, limit, np.random.default_rng(0))
+    return points[idx], labels[idx]
+
+
+def _class_traces(points, labels, name: str, marker: dict, limit: int = MAX_FIGURE_POINTS):
+    """Точки по одному трейсу на класс, каждый со своим цветом"""
+    points, labels = _sample(np.asarray(points, dtype=float), np.asarray(labels), limit)
+    traces = []
+    for label in np.unique(labels):
+        mask = labels == label
+        traces.append(go.Scattergl(
+            x=points[mask, 0].tolist(),
+            y=points[mask, 1].tolist(),
+            mode="markers",
+            name=f"{name} {label}" if label >= 0 else "Шум",
+            marker=dict(color=_color(int(label)), **marker)
+        ))
+    return traces
+
+
+def _boundary_trace(decision_boundary, n_classes: int):
+    """Сетка предсказаний [x, y, класс] как контур с дискретной шкалой"""
+    grid = np.asarray(decision_boundary, dtype=float)
+    xs = np.unique(grid[:, 0])
+    ys = np.unique(grid[:, 1])
+    z = grid[:, 2].reshape(len(ys), len(xs))
+    n_classes = max(n_classes, 2)
+    # Ступенчатая шкала: каждому классу ровно один цвет палитры
+    colorscale = []
+    for c in range(n_classes):
+        colorscale.append([c / n_classes, _color(c)])
+        colorscale.append([(c + 1) / n_classes, _color(c)])
+    return go.Contour(
+        x=xs.tolist(), y=ys.tolist(), z=z.tolist(),
+        zmin=-0.5, zmax=n_classes - 0.5,
+        contours=dict(start=0.5, end=n_classes - 1.5, size=1, coloring="fill"),
+        line=dict(width=1, color="#111827"),
+        colorscale=colorscale, opacity=0.25, showscale=False,
+        hoverinfo="skip", name="Граница решений"
+    )
+
+
+def _segments_trace(segments):
+    """Отрезки [x1, y1, x2, y2] одним трейсом линий с разрывами"""
+    xs, ys = [], []
+    for x1, y1, x2, y2 in segments:
+        xs += [x1, x2, None]
+        ys += [y1, y2, None]
+    return go.Scatter(
+        x=xs, y=ys, mode="lines", name="Граница решений",
+        line=dict(color="#111827", width=1.5)
+    )
+
+
+def linear_regression_figure(result) -> dict:
+    x = np.asarray(result.x)
+    idx = np.arange(len(x))
+    if len(x) > MAX_FIGURE_POINTS:
+        idx = np.linspace(0, len(x) - 1, MAX_FIGURE_POINTS).astype(int)
+    fig = go.Figure([
+        go.Scattergl(
+            x=x[idx].tolist(), y=np.asarray(result.y)[idx].tolist(),
+            mode="markers", name="Данные", marker=dict(color=PALETTE[0], size=6)
+        ),
+        go.Scatter(
+            x=x[idx].tolist(), y=np.asarray(result.predicted_y)[idx].tolist(),
+            mode="lines", name="Модель", line=dict(color=PALETTE[1], width=3)
+        )
+    ])
+    fig.update_layout(title="Линейная регрессия", xaxis_title="x", yaxis_title="y", **_LAYOUT)
+    return _to_dict(fig)
+
+
+def interactive_linear_regression_figure(result: dict) -> dict:
+    fig = go.Figure([
+        go.Scatter(
+            x=result["x"], y=result["y"],
+            mode="markers", name="Данные", marker=dict(color=PALETTE[0], size=6)
+        ),
+        go.Scatter(
+            x=result["x"], y=result["y_line"],
+            mode="lines", name=f"y = {result['slope']:g}x + {result['intercept']:g}",
+            line=dict(color=PALETTE[1], width=3)
+        )
+    ])
+    fig.update_layout(title="Подбор прямой", xaxis_title="x", yaxis_title="y", **_LAYOUT)
+    return _to_dict(fig)
+
+
+def classification_figure(result, title: str) -> dict:
+    traces = []
+    n_classes = len(np.unique(result.y)) if result.y else 2
+    if result.boundary_segments:
+        traces.append(_segments_trace(result.boundary_segments))
+    elif result.decision_boundary:
+        traces.append(_boundary_trace(result.decision_boundary, n_classes))
+    traces += _class_traces(result.x_train, result.y_train, "Train, класс", dict(size=7))
+    traces += _class_traces(
+        result.x_test, result.y_test, "Test, класс",
+        dict(size=9, symbol="diamond", line=dict(width=1, color="#111827"))
+    )
+    fig = go.Figure(traces)
+    fig.update_layout(title=title, xaxis_title="Признак 1", yaxis_title="Признак 2", **_LAYOUT)
+    return _to_dict(fig)
+
+
+def clustering_figure(result, title: str = "K-means кластеризация") -> dict:
+    traces = _class_traces(result.x, result.labels, "Кластер", dict(size=6))
+    centroids = getattr(result, "centroids", None)
+    if centroids:
+        centroids = np.asarray(centroids)
+        traces.append(go.Scatter(
+            x=centroids[:, 0].tolist(), y=centroids[:, 1].tolist(),
+            mode="markers", name="Центроиды",
+            marker=dict(color="#111827", size=14, symbol="x")
+        ))
+    fig = go.Figure(traces)
+    fig.update_layout(title=title, xaxis_title="Признак 1", yaxis_title="Признак 2", **_LAYOUT)
+    return _to_dict(fig)
+
+
+def polynomial_curve_figure(result) -> dict:
+    degrees = [d.degree for d in result.degrees]
+    fig = go.Figure([
+        go.Scatter(x=degrees, y=[d.train_mse for d in result.degrees],
+                   mode="lines+markers", name="Train MSE", line=dict(color=PALETTE[0])),
+        go.Scatter(x=degrees, y=[d.test_mse for d in result.degrees],
+                   mode="lines+markers", name="Test MSE", line=dict(color=PALETTE[1]))
+    ])
+    fig.update_layout(title="Ошибка от степени полинома", xaxis_title="Степень",
+                      yaxis_title="MSE", **_LAYOUT)
+    return _to_dict(fig)
+
+
+def cross_validation_figure(result) -> dict:
+    folds = [f"Фолд {f.fold}" for f in result.folds]
+    traces = [
+        go.Bar(x=folds, y=[f.metrics[name] for f in result.folds], name=name,
+               marker=dict(color=PALETTE[i % len(PALETTE)]))
+        for i, name in enumerate(result.mean_metrics)
+    ]
+    fig = go.Figure(traces)
+    fig.update_layout(title="Метрики по фолдам", barmode="group", **_LAYOUT)
+    return _to_dict(fig)
+
+
+def ensemble_figure(result, title: str) -> dict:
+    """Распределение каждой метрики по сидам - диаграмма размаха"""
+    traces = [
+        go.Box(y=values, name=name, boxmean=True, marker=dict(color=PALETTE[i % len(PALETTE)]))
+        for i, (name, values) in enumerate(result.values.items())
+    ]
+    fig = go.Figure(traces)
+    fig.update_layout(title=f"{title}: {result.n_seeds} сидов", showlegend=False, **_LAYOUT)
+    return _to_dict(fig)
+
+
+def metrics_comparison_figure(result: dict) -> dict:
+    """Метрики, усредненные по сценариям, на сбалансированных и несбалансированных данных"""
+    names = ["accuracy", "precision", "recall", "f1"]
+    scenarios = result["scenarios"]
+    traces = [
+        go.Bar(
+            x=names, y=[float(np.mean([s[kind][name] for s in scenarios])) for name in names],
+            name=label, marker=dict(color=PALETTE[i])
+        )
+        for i, (kind, label) in enumerate([
+            ("balanced", "Сбалансированные данные"), ("imbalanced", "Несбалансированные данные")
+        ])
+    ]
+    fig = go.Figure(traces)
+    fig.update_layout(title="Метрики при дисбалансе классов", barmode="group",
+                      yaxis=dict(range=[0, 1]), **_LAYOUT)
+    return _to_dict(fig)
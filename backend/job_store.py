@@ -0,0 +1,215 @@
+"""
+Фоновые задания ML симуляторов
+
+Долгие симуляции (большие датасеты, пакеты, кросс-валидация) запускаются
+как задания: клиент сразу получает id и дальше опрашивает статус или
+подписывается на события. Статус и прогресс хранятся в таблице
+simulation_jobs, результат - в JSON файле на диске, и то и другое
+удаляется после истечения срока хранения.
+
+Одинаковые запуски одного пользователя (тот же симулятор и параметры)
+считаются один раз: пока расчет идет, новые задания присоединяются к
+нему, а после завершения сразу получают готовый результат. Расчеты
+выполняются в процессе сервера, поэтому задания, прерванные его
+перезапуском, при старте помечаются как failed.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import SimulationJob
+from ml_workers import run_in_pool
+
+JOB_DIR = os.getenv("ML_JOB_DIR", "./jobs")
+JOB_RESULT_TTL = float(os.getenv("ML_JOB_RESULT_TTL", str(24 * 3600)))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobStore:
+    """Реестр заданий: статус в БД, результаты на диске, расчеты в event loop"""
+
+    def __init__(self, root: str = JOB_DIR, ttl_seconds: float = JOB_RESULT_TTL):
+        self.root = root
+        self.ttl = timedelta(seconds=ttl_seconds)
+        # Идущие в этом процессе расчеты: params_hash -> asyncio.Task
+        self._tasks = {}
+
+    def _result_path(self, params_hash: str) -> str:
+        return os.path.join(self.root, f"{params_hash}.json")
+
+    def submit(self, db: Session, owner_id: int, kind: str, params, run) -> SimulationJob:
+        """
+        Создает задание (или возвращает уже существующее такое же)
+
+        run(on_progress) - корутина, считающая результат; on_progress(доля)
+        обновляет прогресс всех заданий с этими параметрами.
+        """
+        params_json = json.dumps(jsonable_encoder(params), sort_keys=True)
+        # Владелец входит в ключ: результаты разных пользователей не смешиваются
+        params_hash = hashlib.sha1(f"{owner_id}:{kind}:{params_json}".encode()).hexdigest()
+        self._purge(db)
+
+        own = db.query(SimulationJob).filter(
+            SimulationJob.owner_id == owner_id,
+            SimulationJob.params_hash == params_hash,
+            SimulationJob.status != "failed"
+        ).order_by(SimulationJob.created_at.desc()).first()
+        if own is not None and (
+            (own.status == "done" and os.path.exists(self._result_path(params_hash)))
+            or params_hash in self._tasks
+        ):
+            return own
+
+        now = datetime.utcnow()
+        job = SimulationJob(
+            id=uuid.uuid4().hex,
+            owner_id=owner_id,
+            kind=kind,
+            params_hash=params_hash,
+            params=params_json,
+            status="queued",
+            progress=0.0,
+            created_at=now,
+            updated_at=now
+        )
+
+        finished = db.query(SimulationJob).filter(
+            SimulationJob.params_hash == params_hash,
+            SimulationJob.status == "done"
+        ).first()
+        if finished is not None and os.path.exists(self._result_path(params_hash)):
+            # Тот же расчет уже сделан - результат общий
+            job.status, job.progress = "done", 1.0
+            job.finished_at, job.expires_at = now, now + self.ttl
+        elif params_hash in self._tasks:
+            # Присоединяемся к идущему расчету: его обновления применяются ко всем заданиям по хэшу
+            running = db.query(SimulationJob).filter(
+                SimulationJob.params_hash == params_hash,
+                SimulationJob.status.in_(ACTIVE_STATUSES)
+            ).first()
+            if running is not None:
+                job.status, job.progress = running.status, running.progress
+
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        if job.status == "queued" and params_hash not in self._tasks:
+            self._tasks[params_hash] = asyncio.create_task(self._run(params_hash, run))
+        return job
+
+    def fail_interrupted(self, db: Session):
+        """Помечает как failed задания, которые остались активными после перезапуска"""
+        now = datetime.utcnow()
+        db.query(SimulationJob).filter(
+            SimulationJob.status.in_(ACTIVE_STATUSES)
+        ).update({
+            "status": "failed", "error": "Interrupted by server restart",
+            "updated_at": now, "finished_at": now, "expires_at": now + self.ttl
+        }, synchronize_session=False)
+        db.commit()
+
+    def _update(self, db: Session, params_hash: str, **fields):
+        fields["updated_at"] = datetime.utcnow()
+        db.query(SimulationJob).filter(
+            SimulationJob.params_hash == params_hash,
+            SimulationJob.status.in_(ACTIVE_STATUSES)
+        ).update(fields, synchronize_session=False)
+        db.commit()
+
+    def _write_result(self, params_hash: str, result):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._result_path(params_hash)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(result, f)
+        # Переименование атомарно: читатели не увидят недописанный файл
+        os.replace(f"{path}.tmp", path)
+
+    async def _run(self, params_hash: str, run):
+        db = SessionLocal()
+        try:
+            self._update(db, params_hash, status="running")
+            result = await run(lambda progress: self._update(db, params_hash, progress=progress))
+            await run_in_pool(self._write_result, params_hash, jsonable_encoder(result))
+            now = datetime.utcnow()
+            self._update(
+                db, params_hash, status="done", progress=1.0,
+                finished_at=now, expires_at=now + self.ttl
+            )
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else (str(e) or type(e).__name__)
+            now = datetime.utcnow()
+            self._update(
+                db, params_hash, status="failed", error=str(detail),
+                finished_at=now, expires_at=now + self.ttl
+            )
+        finally:
+            self._tasks.pop(params_hash, None)
+            db.close()
+
+    def get(self, db: Session, job_id: str, owner_id: int):
+        """Задание, если оно существует, не истекло и принадлежит пользователю"""
+        self._purge(db)
+        return db.query(SimulationJob).filter(
+            SimulationJob.id == job_id,
+            SimulationJob.owner_id == owner_id
+        ).first()
+
+    def list(self, db: Session, owner_id: int):
+        self._purge(db)
+        return db.query(SimulationJob).filter(
+            SimulationJob.owner_id == owner_id
+        ).order_by(SimulationJob.created_at.desc()).all()
+
+    def load_result(self, job: SimulationJob):
+        if job.status != "done":
+            return None
+        try:
+            with open(self._result_path(job.params_hash)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def delete(self, db: Session, job: SimulationJob):
+        """Удаляет задание; расчет и результат удаляются, если они больше никому не нужны"""
+        params_hash = job.params_hash
+        db.delete(job)
+        db.commit()
+        if db.query(SimulationJob).filter(SimulationJob.params_hash == params_hash).count() == 0:
+            task = self._tasks.pop(params_hash, None)
+            if task is not None:
+                task.cancel()
+            self._remove_result(params_hash)
+
+    def _remove_result(self, params_hash: str):
+        try:
+            os.remove(self._result_path(params_hash))
+        except FileNotFoundError:
+            pass
+
+    def _purge(self, db: Session):
+        """Удаляет истекшие задания и результаты, на которые больше нет заданий"""
+        expired = db.query(SimulationJob).filter(
+            SimulationJob.expires_at < datetime.utcnow()
+        ).all()
+        if not expired:
+            return
+        hashes = {job.params_hash for job in expired}
+        for job in expired:
+            db.delete(job)
+        db.commit()
+        for params_hash in hashes:
+            if db.query(SimulationJob).filter(SimulationJob.params_hash == params_hash).count() == 0:
+                self._remove_result(params_hash)
+
+
+job_store = JobStore()
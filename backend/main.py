@@ -5,10 +5,12 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel
 import uvicorn
 
-from database import get_db, engine
+from database import get_db, engine, SessionLocal
 from models import Base
-from routers import auth, lessons, ml_simulator
+from routers import auth, lessons, ml_simulator, datasets, jobs, usage
 from schemas import Token
+from job_store import job_store
+from usage import UsageMiddleware
 
 # Создаем таблицы
 Base.metadata.create_all(bind=engine)
@@ -19,6 +21,15 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.on_event("startup")
+def fail_interrupted_jobs():
+    """Задания, которые шли до перезапуска, уже не завершатся"""
+    db = SessionLocal()
+    try:
+        job_store.fail_interrupted(db)
+    finally:
+        db.close()
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +38,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Учет ресурсов симуляторов: одна запись на запрос /api/ml/*
+app.add_middleware(UsageMiddleware)
 
 # Схема для логина через JSON
 class LoginRequest(BaseModel):
@@ -37,6 +50,9 @@ class LoginRequest(BaseModel):
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(lessons.router, prefix="/api/lessons", tags=["lessons"])
 app.include_router(ml_simulator.router, prefix="/api/ml", tags=["ml-simulator"])
+app.include_router(datasets.router, prefix="/api/ml/datasets", tags=["datasets"])
+app.include_router(jobs.router, prefix="/api/ml/jobs", tags=["jobs"])
+app.include_router(usage.router, prefix="/api/ml/usage", tags=["usage"])
 
 # Исправленный эндпоинт для логина, принимающий JSON
 @app.post("/api/auth/login")
@@ -0,0 +1,105 @@
+"""
+Кэши для результатов ML симуляторов
+
+Потокобезопасный LRU кэш с необязательным TTL. Ключи строятся из параметров
+запроса, поэтому одинаковые запросы (с одинаковым random_state) отдают
+уже посчитанный результат.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from pydantic import BaseModel
+
+_MISSING = object()
+
+
+def make_key(*parts):
+    """Строит ключ кэша из параметров (pydantic моделей, словарей, чисел)"""
+    normalized = []
+    for part in parts:
+        if isinstance(part, BaseModel):
+            part = part.model_dump()
+        normalized.append(part)
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class LRUCache:
+    """
+    LRU кэш с ограничением по количеству элементов и времени жизни
+
+    Если задан max_bytes, суммарный размер значений (по функции sizeof)
+    тоже ограничен: вытесняются самые старые, а значение больше лимита
+    не кэшируется вовсе.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: float = None, max_bytes: int = None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        # Вызывается под блокировкой
+        self._data.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                self._remove(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (value, expires_at)
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._data)))
+
+    def get_or_compute(self, key, compute):
+        """Возвращает значение из кэша или вычисляет и сохраняет его"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            # Вычисляем вне блокировки, чтобы не задерживать другие потоки
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            self._remove(key)
+        return default if item is _MISSING else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,122 @@
+"""
+Генерация данных для ML симуляторов
+
+Все генераторы детерминированы по random_state из параметров запроса
+и не используют глобальное состояние NumPy. Датасеты для классификации
+и кластеризации хранятся в общем для процессов кэше (shared memory),
+поэтому возвращаемые массивы доступны только для чтения.
+"""
+import numpy as np
+from sklearn.datasets import make_classification, make_blobs, make_moons, make_circles
+
+from ml_cache import make_key
+from schemas import LinearRegressionParams, ClassificationParams, ClusteringParams
+from shared_cache import shared_arrays
+
+
+def linear_regression_data(params: LinearRegressionParams):
+    """Генерирует данные для линейной регрессии собственным генератором запроса"""
+    # Отдельный Generator вместо глобального np.random.seed: потокобезопасно и воспроизводимо
+    rng = np.random.default_rng(params.random_state)
+
+    # Создаем x координаты
+    x = np.linspace(0, 10, params.n_points)
+
+    # Генерируем y с заданными параметрами и шумом
+    y_true = params.slope * x + params.intercept
+    noise = params.noise_level * rng.standard_normal(params.n_points)
+    y = y_true + noise
+    return x, y
+
+
+def _make_classification(params: ClassificationParams):
+    # make_classification не принимает noise - шум задается долей перепутанных меток
+    return make_classification(
+        n_samples=params.n_samples,
+        n_features=params.n_features,
+        n_classes=params.n_classes,
+        n_redundant=0,
+        n_informative=params.n_features,
+        flip_y=params.noise,
+        random_state=params.random_state
+    )
+
+
+def classification_data(params: ClassificationParams, shared: bool = True):
+    """
+    Генерирует датасет для классификации по параметрам запроса
+
+    shared=False - не класть датасет в общий кэш (одноразовые датасеты
+    ансамблей не должны вытеснять популярные).
+    """
+    if not shared:
+        return _make_classification(params)
+    key = make_key(
+        "classification", params.n_samples, params.n_features, params.n_classes,
+        params.noise, params.random_state
+    )
+    return shared_arrays.get_or_create(key, lambda: _make_classification(params))
+
+
+def _make_clustering(params: ClusteringParams):
+    # Невыпуклые формы всегда двумерные и из двух кластеров, cluster_std задает шум
+    if params.dataset_shape == "moons":
+        return make_moons(
+            n_samples=params.n_samples,
+            noise=0.1 * params.cluster_std,
+            random_state=params.random_state
+        )
+    if params.dataset_shape == "circles":
+        return make_circles(
+            n_samples=params.n_samples,
+            noise=0.05 * params.cluster_std,
+            factor=0.5,
+            random_state=params.random_state
+        )
+    return make_blobs(
+        n_samples=params.n_samples,
+        n_features=params.n_features,
+        centers=params.n_centers or params.n_clusters,
+        cluster_std=params.cluster_std,
+        random_state=params.random_state
+    )
+
+
+def clustering_data(params: ClusteringParams, shared: bool = True):
+    """Генерирует датасет для кластеризации по параметрам запроса (shared - как у classification_data)"""
+    if not shared:
+        return _make_clustering(params)
+    key = make_key(
+        "clustering", params.dataset_shape, params.n_samples,
+        params.n_features if params.dataset_shape == "blobs" else 2,
+        params.n_centers or params.n_clusters, params.cluster_std, params.random_state
+    )
+    return shared_arrays.get_or_create(key, lambda: _make_clustering(params))
+
+
+def stratified_indices(labels, max_points: int, rng):
+    """
+    Стратифицированная подвыборка индексов для графика
+
+    Доля каждого класса сохраняется (квоты по методу наибольших остатков),
+    каждый класс получает хотя бы одну точку. Возвращает отсортированные
+    индексы и количество пропущенных точек по классам.
+    """
+    labels = np.asarray(labels)
+    classes, counts = np.unique(labels, return_counts=True)
+    if max_points is None or len(labels) <= max_points:
+        return np.arange(len(labels)), {int(c): 0 for c in classes}
+
+    raw = counts * max_points / len(labels)
+    quotas = np.floor(raw).astype(int)
+    leftover = max_points - quotas.sum()
+    if leftover > 0:
+        quotas[np.argsort(quotas - raw)[:leftover]] += 1
+    quotas = np.minimum(np.maximum(quotas, 1), counts)
+
+    selected = [
+        rng.choice(np.flatnonzero(labels == cls), size=quota, replace=False)
+        for cls, quota in zip(classes, quotas)
+    ]
+    omitted = {int(c): int(n - q) for c, n, q in zip(classes, counts, quotas)}
+    return np.sort(np.concatenate(selected)), omitted
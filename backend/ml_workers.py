@@ -0,0 +1,219 @@
+"""
+Пул воркеров для вычислений ML симуляторов
+
+Обучение моделей занимает CPU, поэтому тяжелые вычисления выполняются
+в отдельном пуле потоков, а не в event loop FastAPI.
+
+Задания ставятся в очередь по двум полосам: high - дешевые интерактивные
+запросы (ползунки), low - пакеты, кросс-валидация, большие датасеты.
+Внутри полосы воркеры берут задания по кругу между пользователями,
+поэтому тяжелые запросы одного пользователя не блокируют остальных.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from functools import partial
+
+from fastapi import HTTPException
+
+from usage import usage_meter, current_request
+
+MAX_WORKERS = int(os.getenv("ML_MAX_WORKERS", os.cpu_count() or 4))
+# Сколько заданий high подряд можно взять, пока в low кто-то ждет
+HIGH_PRIORITY_BURST = int(os.getenv("ML_HIGH_PRIORITY_BURST", "8"))
+
+LANES = ("high", "low")
+
+# Пользователь и полоса для заданий текущего запроса (задаются зависимостями роутера)
+_job_user = contextvars.ContextVar("ml_job_user", default=None)
+_job_lane = contextvars.ContextVar("ml_job_lane", default="low")
+
+
+def set_job_context(user_id=None, lane: str = None, endpoint: str = None):
+    """Задает пользователя, полосу и/или эндпоинт для последующих run_in_pool в этом запросе"""
+    if user_id is not None:
+        _job_user.set(user_id)
+    if lane is not None:
+        _job_lane.set(lane)
+    # Пользователь и эндпоинт нужны и записи учета запроса - она общая с UsageMiddleware
+    request = current_request()
+    if request is not None:
+        if user_id is not None:
+            request.user_id = user_id
+        if endpoint is not None:
+            request.endpoint = endpoint
+
+
+class FairScheduler:
+    """
+    Пул потоков с полосами приоритета и очередью по кругу между пользователями
+
+    В каждой полосе у пользователя своя очередь; воркер берет задание у
+    первого пользователя и переносит его в конец, так что пользователи
+    обслуживаются по очереди независимо от числа их заданий. Полоса high
+    обслуживается первой, но после HIGH_PRIORITY_BURST заданий подряд
+    берется одно задание из low, чтобы она не голодала.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, high_burst: int = HIGH_PRIORITY_BURST):
+        self.max_workers = max_workers
+        self.high_burst = high_burst
+        self._cond = threading.Condition()
+        # Полоса -> пользователь -> очередь (future, функция)
+        self._queues = {lane: OrderedDict() for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._high_streak = 0
+        for i in range(max_workers):
+            threading.Thread(target=self._worker, name=f"ml-worker-{i}", daemon=True).start()
+
+    def submit(self, user_id, lane: str, func) -> Future:
+        future = Future()
+        with self._cond:
+            self._queues[lane].setdefault(user_id, deque()).append((future, func))
+            self._cond.notify()
+        return future
+
+    def _pop(self, lane: str):
+        queue = self._queues[lane]
+        user_id, jobs = queue.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            queue[user_id] = jobs
+        return job
+
+    def _next_lane(self):
+        high, low = self._queues["high"], self._queues["low"]
+        if high and (not low or self._high_streak < self.high_burst):
+            self._high_streak += 1
+            return "high"
+        if low:
+            self._high_streak = 0
+            return "low"
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                lane = self._next_lane()
+                while lane is None:
+                    self._cond.wait()
+                    lane = self._next_lane()
+                future, func = self._pop(lane)
+                self._running[lane] += 1
+            try:
+                # Отмененное в очереди задание не запускаем
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = func()
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self._cond:
+                    self._running[lane] -= 1
+
+    def stats(self) -> dict:
+        """Глубина очереди, число пользователей в очереди и выполняемые задания по полосам"""
+        with self._cond:
+            return {
+                lane: {
+                    "queued": sum(
+                        1 for jobs in self._queues[lane].values()
+                        for future, _ in jobs if not future.cancelled()
+                    ),
+                    "users": len(self._queues[lane]),
+                    "running": self._running[lane],
+                }
+                for lane in LANES
+            }
+
+
+scheduler = FairScheduler()
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """Выполнить синхронную функцию в пуле воркеров (стоимость учитывается на пользователя)"""
+    job = partial(usage_meter.measure, current_request(), partial(func, *args, **kwargs))
+    future = scheduler.submit(_job_user.get(), _job_lane.get(), job)
+    return await asyncio.wrap_future(future)
+
+
+# Отмена устаревших запросов интерактивных симуляторов
+
+DISCONNECT_POLL_SECONDS = 0.1
+
+_local = threading.local()
+
+
+class JobCancelled(Exception):
+    """Вычисление отменено: пришел более новый запрос или клиент отключился"""
+
+
+def checkpoint():
+    """
+    Точка отмены для вычислений в пуле
+
+    Вызывается между тяжелыми шагами симулятора: поток нельзя прервать
+    снаружи, поэтому отмененное задание завершается на ближайшей проверке.
+    """
+    token = getattr(_local, "token", None)
+    if token is not None and token.is_set():
+        raise JobCancelled()
+
+
+def _run_with_token(token: threading.Event, func, *args, **kwargs):
+    _local.token = token
+    try:
+        # Задание могли отменить, пока оно ждало в очереди
+        checkpoint()
+        return func(*args, **kwargs)
+    finally:
+        _local.token = None
+
+
+class LatestWinsScheduler:
+    """
+    Выполняет в пуле только последний запрос пользователя к симулятору
+
+    Когда по тому же ключу (пользователь, симулятор) приходит новый
+    запрос, предыдущий отменяется: если он еще в очереди пула, то не
+    запустится вовсе, если уже выполняется - остановится на ближайшем
+    checkpoint(). Так же отменяется запрос, клиент которого отключился.
+    """
+
+    def __init__(self):
+        # Ключ -> (флаг отмены, задача) текущего запроса; меняется только из event loop
+        self._active = {}
+
+    def _cancel(self, scope):
+        active = self._active.pop(scope, None)
+        if active is not None:
+            token, task = active
+            token.set()
+            task.cancel()
+
+    async def run(self, scope, request, func, *args, **kwargs):
+        """Выполнить func в пуле; HTTPException 409/499, если запрос отменен"""
+        self._cancel(scope)
+        token = threading.Event()
+        task = asyncio.ensure_future(run_in_pool(_run_with_token, token, func, *args, **kwargs))
+        self._active[scope] = (token, task)
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+                if not task.done() and await request.is_disconnected():
+                    self._cancel(scope)
+                    raise HTTPException(status_code=499, detail="Client disconnected")
+            if task.cancelled() or token.is_set():
+                raise HTTPException(status_code=409, detail="Superseded by a newer request")
+            return task.result()
+        finally:
+            if self._active.get(scope, (None, None))[1] is task:
+                del self._active[scope]
+
+
+latest_wins = LatestWinsScheduler()
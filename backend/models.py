@@ -16,6 +16,9 @@ class User(Base):
     # Relationships
     progress = relationship("UserProgress", back_populates="user")
     submissions = relationship("Submission", back_populates="user")
+    datasets = relationship("Dataset", back_populates="owner")
+    jobs = relationship("SimulationJob", back_populates="owner")
+    usage = relationship("SimulatorUsage", back_populates="user")
 
 class Lesson(Base):
     __tablename__ = "lessons"
@@ -75,3 +78,53 @@ class Submission(Base):
     # Relationships
     user = relationship("User", back_populates="submissions")
     question = relationship("Question", back_populates="submissions")
+
+class Dataset(Base):
+    __tablename__ = "datasets"
+    
+    id = Column(String, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    kind = Column(String)  # classification, clustering
+    n_samples = Column(Integer)
+    n_features = Column(Integer)
+    size_bytes = Column(Integer, default=0)
+    params = Column(Text)  # JSON с параметрами генерации
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_accessed_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    owner = relationship("User", back_populates="datasets")
+
+class SimulationJob(Base):
+    __tablename__ = "simulation_jobs"
+    
+    id = Column(String, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    kind = Column(String)  # logistic-regression, cross-validation, ...
+    params_hash = Column(String, index=True)  # Одинаковые запуски - один расчет
+    params = Column(Text)  # JSON с параметрами симулятора
+    status = Column(String, default="queued")  # queued, running, done, failed
+    progress = Column(Float, default=0.0)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+    expires_at = Column(DateTime(timezone=True))
+    
+    # Relationships
+    owner = relationship("User", back_populates="jobs")
+
+class SimulatorUsage(Base):
+    __tablename__ = "simulator_usage"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    endpoint = Column(String)  # Путь эндпоинта, например /logistic-regression
+    period_start = Column(DateTime, index=True)  # Начало минуты агрегации (UTC)
+    calls = Column(Integer, default=0)
+    cpu_seconds = Column(Float, default=0.0)
+    wall_seconds = Column(Float, default=0.0)
+    peak_memory_bytes = Column(Integer, default=0)
+    
+    # Relationships
+    user = relationship("User", back_populates="usage")
@@ -0,0 +1,123 @@
+"""
+Предобработка признаков для ML симуляторов
+
+Цепочка шагов (заполнение пропусков, стандартизация, min-max
+нормализация, one-hot кодирование) применяется по столбцам и только к
+тем признакам, которые запрошены. Статистики каждого шага (средние,
+минимумы, категории и т.д.) вычисляются один раз для датасета и столбца
+и дальше берутся из кэша.
+"""
+import numpy as np
+
+from ml_cache import LRUCache, make_key
+from schemas import PreprocessingSpec, PreprocessingStep
+
+MAX_ONE_HOT_CATEGORIES = 20
+
+# Статистики шагов: ключ - датасет, столбец и цепочка шагов до текущего включительно
+stats_cache = LRUCache(maxsize=1024)
+
+
+def _fit_step(step: PreprocessingStep, column: np.ndarray) -> dict:
+    """Вычисляет статистики шага по значениям столбца"""
+    values = column[~np.isnan(column)]
+    if step.op == "impute":
+        if step.strategy == "constant" or len(values) == 0:
+            fill = step.fill_value
+        elif step.strategy == "mean":
+            fill = values.mean()
+        elif step.strategy == "median":
+            fill = np.median(values)
+        else:
+            uniques, counts = np.unique(values, return_counts=True)
+            fill = uniques[np.argmax(counts)]
+        return {"fill_value": float(fill)}
+    if step.op == "standard_scale":
+        mean = float(values.mean()) if len(values) else 0.0
+        std = float(values.std()) if len(values) else 1.0
+        return {"mean": mean, "std": std or 1.0}
+    if step.op == "minmax_scale":
+        vmin = float(values.min()) if len(values) else 0.0
+        vmax = float(values.max()) if len(values) else 1.0
+        return {"min": vmin, "max": vmax}
+    categories = np.unique(values)
+    if len(categories) > MAX_ONE_HOT_CATEGORIES:
+        raise ValueError(
+            f"Column has {len(categories)} distinct values, "
+            f"one-hot encoding supports at most {MAX_ONE_HOT_CATEGORIES}"
+        )
+    return {"categories": categories.tolist()}
+
+
+def _apply_step(step: PreprocessingStep, column: np.ndarray, stats: dict) -> np.ndarray:
+    if step.op == "impute":
+        return np.where(np.isnan(column), stats["fill_value"], column)
+    if step.op == "standard_scale":
+        return (column - stats["mean"]) / stats["std"]
+    if step.op == "minmax_scale":
+        return (column - stats["min"]) / ((stats["max"] - stats["min"]) or 1.0)
+    categories = np.asarray(stats["categories"])
+    return (column[:, None] == categories[None, :]).astype(float)
+
+
+class PreprocessingPipeline:
+    """Цепочка шагов предобработки для одного датасета"""
+
+    def __init__(self, spec: PreprocessingSpec, dataset_key: str):
+        self.spec = spec
+        self.dataset_key = dataset_key
+        # Статистики, использованные при последнем transform: столбец -> шаги
+        self.fitted = {}
+
+    def _validate(self, n_features: int):
+        requested = self.spec.columns if self.spec.columns is not None else range(n_features)
+        for step in self.spec.steps:
+            for column in (step.columns or []):
+                if not 0 <= column < n_features:
+                    raise ValueError(f"Column {column} is out of range for {n_features} features")
+        for column in requested:
+            if not 0 <= column < n_features:
+                raise ValueError(f"Column {column} is out of range for {n_features} features")
+            ops = [s.op for s in self.spec.steps if s.columns is None or column in s.columns]
+            if "one_hot" in ops[:-1]:
+                raise ValueError("one_hot must be the last step applied to a column")
+        return list(requested)
+
+    def transform(self, X: np.ndarray):
+        """
+        Возвращает преобразованную матрицу и имена признаков
+
+        Обрабатываются только запрошенные столбцы; столбцы без шагов
+        передаются как есть.
+        """
+        columns = self._validate(X.shape[1])
+        outputs, names = [], []
+        self.fitted = {}
+
+        for c in columns:
+            column = np.asarray(X[:, c], dtype=float)
+            chain = []
+            fitted = []
+            for step in self.spec.steps:
+                if step.columns is not None and c not in step.columns:
+                    continue
+                chain.append(step.model_dump())
+                key = make_key("prep-stats", self.dataset_key, c, chain)
+                stats = stats_cache.get_or_compute(key, lambda: _fit_step(step, column))
+                column = _apply_step(step, column, stats)
+                fitted.append({"op": step.op, **stats})
+            self.fitted[f"x{c}"] = fitted
+
+            if column.ndim == 2:
+                categories = fitted[-1]["categories"]
+                names.extend(f"x{c}={value:g}" for value in categories)
+                outputs.append(column)
+            else:
+                names.append(f"x{c}")
+                outputs.append(column[:, None])
+
+        return np.hstack(outputs), names
+
+
+def has_impute(spec: PreprocessingSpec) -> bool:
+    return spec is not None and any(step.op == "impute" for step in spec.steps)
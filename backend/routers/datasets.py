@@ -0,0 +1,149 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, Form
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from database import get_db
+from models import User
+from schemas import ClassificationParams, ClusteringParams, DatasetInfo, DatasetUploadResponse
+from routers.auth import get_current_user
+from ml_data import classification_data, clustering_data
+from dataset_store import dataset_store
+from csv_ingest import ingest_csv
+from ml_workers import run_in_pool, set_job_context
+from routers.ml_simulator import _within_quota
+from admission import admit, estimate_dataset
+from usage import endpoint_of
+
+async def _job_context(request: Request, current_user: User = Depends(get_current_user)):
+    """Генерация и загрузка датасетов - в полосу low очереди пользователя"""
+    set_job_context(current_user.id, "low", endpoint_of(request))
+
+router = APIRouter(dependencies=[Depends(_job_context)])
+
+def _data_params(params) -> dict:
+    # Параметры, не влияющие на данные, не сохраняем
+    return params.model_dump(exclude={"max_display_points", "dataset_id"})
+
+@router.post("/classification", response_model=DatasetInfo, dependencies=[Depends(_within_quota)])
+async def create_classification_dataset(
+    params: ClassificationParams,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Сгенерировать и сохранить датасет для классификации
+
+    Возвращенный id можно передавать как dataset_id в симуляторы
+    """
+    cost = estimate_dataset(params.n_samples, params.n_features)
+    admit(cost)
+    response.headers.update(cost.headers())
+    X, y = await run_in_pool(classification_data, params)
+    dataset_id, tmp_path = await run_in_pool(dataset_store.write, {"X": X, "y": y})
+    return dataset_store.register(
+        db, dataset_id, tmp_path, current_user.id, "classification", _data_params(params)
+    )
+
+@router.post("/clustering", response_model=DatasetInfo, dependencies=[Depends(_within_quota)])
+async def create_clustering_dataset(
+    params: ClusteringParams,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Сгенерировать и сохранить датасет для кластеризации
+    """
+    cost = estimate_dataset(params.n_samples, params.n_features if params.dataset_shape == "blobs" else 2)
+    admit(cost)
+    response.headers.update(cost.headers())
+    X, y = await run_in_pool(clustering_data, params)
+    dataset_id, tmp_path = await run_in_pool(dataset_store.write, {"X": X, "y": y})
+    return dataset_store.register(
+        db, dataset_id, tmp_path, current_user.id, "clustering", _data_params(params)
+    )
+
+@router.post("/upload", response_model=DatasetUploadResponse, dependencies=[Depends(_within_quota)])
+async def upload_csv_dataset(
+    file: UploadFile = File(...),
+    target_column: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Загрузить CSV файл как датасет
+
+    Файл читается блоками, по ходу чтения определяются типы столбцов и
+    считаются статистики. Числовые столбцы сохраняются как X, целевой
+    столбец (если указан) - как y, и датасет можно использовать в симуляторах.
+    Строки с пустым целевым столбцом отбрасываются (dropped_rows в ответе).
+    """
+    # Файл уже лежит во временном файле Starlette - проверяем размер до разбора
+    file.file.seek(0, 2)
+    if file.file.tell() > dataset_store.quota_bytes:
+        raise HTTPException(status_code=413, detail="File exceeds dataset storage quota")
+    file.file.seek(0)
+
+    dataset_id, tmp_path = dataset_store.new_dataset_dir()
+    try:
+        result = await run_in_pool(ingest_csv, file.file, tmp_path, target_column)
+    except (ValueError, UnicodeDecodeError) as e:
+        dataset_store.discard(tmp_path)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    kind = "classification" if target_column else "tabular"
+    params = {
+        "source": "csv",
+        "filename": file.filename,
+        "feature_columns": result["feature_columns"],
+        "target_column": target_column,
+        "classes": result["classes"],
+        "feature_means": result["feature_means"],
+        "feature_missing": result["feature_missing"],
+        "dropped_rows": result["dropped_rows"]
+    }
+    record = dataset_store.register(db, dataset_id, tmp_path, current_user.id, kind, params)
+
+    return DatasetUploadResponse(
+        dataset=DatasetInfo.model_validate(record),
+        n_rows=result["n_rows"],
+        dropped_rows=result["dropped_rows"],
+        feature_columns=result["feature_columns"],
+        target_column=target_column,
+        classes=result["classes"],
+        columns=result["columns"]
+    )
+
+@router.get("/", response_model=List[DatasetInfo])
+def list_datasets(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить список датасетов пользователя"""
+    return dataset_store.list_records(db, current_user.id)
+
+@router.get("/{dataset_id}", response_model=DatasetInfo)
+def get_dataset(
+    dataset_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить информацию о датасете"""
+    record = dataset_store.get_record(db, dataset_id, current_user.id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return record
+
+@router.delete("/{dataset_id}")
+def delete_dataset(
+    dataset_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Удалить датасет"""
+    record = dataset_store.get_record(db, dataset_id, current_user.id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    dataset_store.delete(db, record)
+    return {"message": "Dataset deleted"}
@@ -0,0 +1,296 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List
+import asyncio
+import os
+
+from database import get_db, SessionLocal
+from models import User
+from schemas import (
+    ClassificationParams, ClusteringParams,
+    CrossValidationParams, PolynomialCurveParams, JobInfo
+)
+from routers.auth import get_current_user
+from routers.ml_simulator import (
+    result_cache, _get_or_fit, _dataset_for, _sse_event,
+    _compute_logistic_regression, _compute_knn_classification, _compute_kmeans_clustering,
+    _compute_polynomial_curve, _run_batch, _check_batch_size,
+    _check_cross_validation, _cross_validation_data, _cross_validation, _check_polynomial_curve,
+    _within_quota
+)
+from admission import (
+    CostEstimate, admit, estimate_classification, estimate_clustering,
+    estimate_cross_validation, estimate_polynomial_curve
+)
+from ml_cache import make_key
+from ml_workers import run_in_pool, set_job_context
+from job_store import job_store
+from usage import endpoint_of
+
+# У фоновых заданий бюджет больше, чем у синхронных запросов
+JOB_BUDGET_FACTOR = float(os.getenv("ML_JOB_BUDGET_FACTOR", "10"))
+JOB_POLL_SECONDS = 0.5
+
+async def _job_context(request: Request, current_user: User = Depends(get_current_user)):
+    """Фоновые задания всегда идут в полосу low"""
+    set_job_context(current_user.id, "low", endpoint_of(request))
+
+router = APIRouter(dependencies=[Depends(_job_context)])
+
+def _job_info(job, with_result: bool = True) -> JobInfo:
+    info = JobInfo.model_validate(job)
+    if with_result:
+        info.result = job_store.load_result(job)
+    return info
+
+def _submit(db: Session, user: User, kind: str, params, run) -> JobInfo:
+    return _job_info(job_store.submit(db, user.id, kind, params, run), with_result=False)
+
+def _admit_items(batch: list, datasets: list, estimate):
+    """Оценка элементов пакета с бюджетом фоновых заданий"""
+    estimated = [estimate(params, data) for params, data in zip(batch, datasets)]
+    admit(sum((cost for _, cost in estimated), CostEstimate(budget_factor=JOB_BUDGET_FACTOR)))
+    return [params for params, _ in estimated], [cost for _, cost in estimated]
+
+@router.post("/logistic-regression", response_model=JobInfo, dependencies=[Depends(_within_quota)])
+async def submit_logistic_regression(
+    params: ClassificationParams,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Запустить логистическую регрессию как фоновое задание"""
+    data = _dataset_for(db, current_user, params)
+    params, cost = estimate_classification(params, "logistic", data, budget_factor=JOB_BUDGET_FACTOR)
+    admit(cost)
+    key = make_key("logistic", params)
+
+    async def run(on_progress):
+        return await run_in_pool(_get_or_fit, key, lambda: _compute_logistic_regression(params, data))
+
+    return _submit(db, current_user, "logistic-regression", params, run)
+
+@router.post("/knn-classification", response_model=JobInfo, dependencies=[Depends(_within_quota)])
+async def submit_knn_classification(
+    params: ClassificationParams,
+    k: int = 5,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Запустить kNN классификацию как фоновое задание"""
+    data = _dataset_for(db, current_user, params)
+    params, cost = estimate_classification(params, "knn", data, k, budget_factor=JOB_BUDGET_FACTOR)
+    admit(cost)
+    key = make_key("knn", params, k)
+
+    async def run(on_progress):
+        return await run_in_pool(
+            _get_or_fit, key, lambda: _compute_knn_classification(params, k, data, **cost.options)
+        )
+
+    return _submit(db, current_user, "knn-classification", {"params": params, "k": k}, run)
+
+@router.post("/kmeans-clustering", response_model=JobInfo, dependencies=[Depends(_within_quota)])
+async def submit_kmeans_clustering(
+    params: ClusteringParams,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Запустить K-means кластеризацию как фоновое задание"""
+    data = _dataset_for(db, current_user, params, need_labels=False)
+    params, cost = estimate_clustering(params, data, budget_factor=JOB_BUDGET_FACTOR)
+    admit(cost)
+    key = make_key("kmeans", params)
+
+    async def run(on_progress):
+        return await run_in_pool(
+            _get_or_fit, key, lambda: _compute_kmeans_clustering(params, data, **cost.options)
+        )
+
+    return _submit(db, current_user, "kmeans-clustering", params, run)
+
+@router.post("/logistic-regression/batch", response_model=JobInfo, dependencies=[Depends(_within_quota)])
+async def submit_logistic_regression_batch(
+    batch: List[ClassificationParams],
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Запустить пакет логистических регрессий как фоновое задание"""
+    _check_batch_size(batch)
+    datasets = [_dataset_for(db, current_user, params) for params in batch]
+    batch, estimates = _admit_items(
+        batch, datasets,
+        lambda params, data: estimate_classification(
+            params, "logistic", data, budget_factor=JOB_BUDGET_FACTOR
+        )
+    )
+
+    async def run(on_progress):
+        results, _ = await _run_batch(
+            "logistic", batch, datasets, estimates, _compute_logistic_regression,
+            on_progress=on_progress
+        )
+        return results
+
+    return _submit(db, current_user, "logistic-regression/batch", batch, run)
+
+@router.post("/knn-classification/batch", response_model=JobInfo, dependencies=[Depends(_within_quota)])
+async def submit_knn_classification_batch(
+    batch: List[ClassificationParams],
+    k: int = 5,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Запустить пакет kNN классификаций как фоновое задание"""
+    _check_batch_size(batch)
+    datasets = [_dataset_for(db, current_user, params) for params in batch]
+    batch, estimates = _admit_items(
+        batch, datasets,
+        lambda params, data: estimate_classification(
+            params, "knn", data, k, budget_factor=JOB_BUDGET_FACTOR
+        )
+    )
+
+    async def run(on_progress):
+        results, _ = await _run_batch(
+            "knn", batch, datasets, estimates, _compute_knn_classification, k,
+            on_progress=on_progress
+        )
+        return results
+
+    return _submit(db, current_user, "knn-classification/batch", {"batch": batch, "k": k}, run)
+
+@router.post("/kmeans-clustering/batch", response_model=JobInfo, dependencies=[Depends(_within_quota)])
+async def submit_kmeans_clustering_batch(
+    batch: List[ClusteringParams],
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Запустить пакет K-means кластеризаций как фоновое задание"""
+    _check_batch_size(batch)
+    datasets = [_dataset_for(db, current_user, params, need_labels=False) for params in batch]
+    batch, estimates = _admit_items(
+        batch, datasets,
+        lambda params, data: estimate_clustering(params, data, budget_factor=JOB_BUDGET_FACTOR)
+    )
+
+    async def run(on_progress):
+        results, _ = await _run_batch(
+            "kmeans", batch, datasets, estimates, _compute_kmeans_clustering,
+            on_progress=on_progress
+        )
+        return results
+
+    return _submit(db, current_user, "kmeans-clustering/batch", batch, run)
+
+@router.post("/cross-validation", response_model=JobInfo, dependencies=[Depends(_within_quota)])
+async def submit_cross_validation(
+    params: CrossValidationParams,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Запустить кросс-валидацию как фоновое задание (прогресс - по фолдам)"""
+    _check_cross_validation(params)
+    # Датасет открываем сразу: доступ проверяется при постановке, а задание не держит сессию запроса
+    data_params, data = _cross_validation_data(params, db, current_user)
+    admit(estimate_cross_validation(params, data_params, data, budget_factor=JOB_BUDGET_FACTOR))
+
+    async def run(on_progress):
+        return await _cross_validation(params, data_params, data, on_progress)
+
+    return _submit(db, current_user, "cross-validation", params, run)
+
+@router.post("/polynomial-degree-curve", response_model=JobInfo, dependencies=[Depends(_within_quota)])
+async def submit_polynomial_degree_curve(
+    params: PolynomialCurveParams,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Запустить расчет кривой по степени полинома как фоновое задание"""
+    _check_polynomial_curve(params)
+    admit(estimate_polynomial_curve(params, budget_factor=JOB_BUDGET_FACTOR))
+    key = make_key("polynomial-curve", params)
+
+    async def run(on_progress):
+        return await run_in_pool(
+            result_cache.get_or_compute, key, lambda: _compute_polynomial_curve(params)
+        )
+
+    return _submit(db, current_user, "polynomial-degree-curve", params, run)
+
+@router.get("/", response_model=List[JobInfo])
+def list_jobs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить список заданий пользователя (без результатов)"""
+    return [_job_info(job, with_result=False) for job in job_store.list(db, current_user.id)]
+
+@router.get("/{job_id}", response_model=JobInfo)
+def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Статус и прогресс задания; результат - когда задание выполнено"""
+    job = job_store.get(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_info(job)
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Поток событий задания (SSE)
+
+    События: progress - при изменении статуса или прогресса, затем
+    result с результатом или error с описанием ошибки.
+    """
+    user_id = current_user.id
+    if not job_store.get(db, job_id, user_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        events_db = SessionLocal()
+        try:
+            last_state = None
+            while not await request.is_disconnected():
+                # Статус обновляет другая сессия - перечитываем строку
+                events_db.expire_all()
+                job = job_store.get(events_db, job_id, user_id)
+                if job is None:
+                    yield _sse_event("error", {"detail": "Job not found"})
+                    return
+                state = (job.status, job.progress)
+                if state != last_state:
+                    yield _sse_event("progress", {"status": job.status, "progress": job.progress})
+                    last_state = state
+                if job.status == "done":
+                    yield _sse_event("result", job_store.load_result(job))
+                    return
+                if job.status == "failed":
+                    yield _sse_event("error", {"detail": job.error})
+                    return
+                await asyncio.sleep(JOB_POLL_SECONDS)
+        finally:
+            events_db.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@router.delete("/{job_id}")
+def delete_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Удалить задание (расчет останавливается, если он больше никому не нужен)"""
+    job = job_store.get(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job_store.delete(db, job)
+    return {"message": "Job deleted"}
@@ -1,43 +1,139 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from typing import List
+from functools import partial
+import asyncio
+import hashlib
+import os
+import time
 import numpy as np
-from sklearn.linear_model import LinearRegression, LogisticRegression
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.cluster import KMeans
-from sklearn.metrics import mean_squared_error, r2_score, accuracy_score, precision_score, recall_score, f1_score
-from sklearn.model_selection import train_test_split
-from sklearn.datasets import make_classification, make_blobs
+from scipy.linalg import solve_triangular
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import Voronoi, QhullError
+from sklearn.linear_model import LinearRegression, LogisticRegression, SGDRegressor
+from sklearn.neighbors import KNeighborsClassifier, KDTree, BallTree
+from sklearn import config_context
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.datasets import make_classification
+from sklearn.decomposition import PCA
+from sklearn.metrics import mean_squared_error, r2_score, accuracy_score, precision_score, recall_score, f1_score, silhouette_score
+from sklearn.metrics import pairwise_distances, pairwise_distances_argmin, adjusted_rand_score
 import json
 
 from database import get_db
 from models import User
-from schemas import LinearRegressionParams, LinearRegressionResponse, ClassificationParams, ClassificationResponse, ClusteringParams, ClusteringResponse
+from schemas import (
+    LinearRegressionParams, LinearRegressionResponse,
+    ClassificationParams, ClassificationResponse,
+    ClusteringParams, ClusteringResponse, DisplaySampling, ProjectionInfo,
+    CrossValidationParams, CrossValidationResponse, FoldResult,
+    PolynomialCurveParams, PolynomialCurveResponse, PolynomialDegreeResult,
+    GradientDescentParams, StreamingRegressionParams,
+    PredictRequest, PredictResponse,
+    PreprocessingPreviewRequest, PreprocessingPreviewResponse,
+    DensityClusteringParams, DensityClusteringResponse,
+    SchedulerMetrics, MetricDistribution, EnsembleResponse, ImbalanceSweepParams
+)
 from routers.auth import get_current_user
+from ml_cache import LRUCache, make_key
+from ml_workers import run_in_pool, latest_wins, checkpoint, scheduler, set_job_context
+from ml_data import linear_regression_data, classification_data, clustering_data, stratified_indices
+from splits import train_test_indices, kfold_indices
+from dataset_store import dataset_store
+from preprocessing import PreprocessingPipeline, has_impute
+import figures
+from admission import (
+    CostEstimate, admit, run_measured,
+    estimate_linear_regression, estimate_classification, estimate_clustering,
+    estimate_cross_validation, estimate_polynomial_curve, estimate_gradient_descent,
+    estimate_preprocessing, estimate_density_clustering, estimate_streaming_regression,
+    KNN_BOUNDARY_RESOLUTION, SILHOUETTE_WORKING_MEMORY_MB
+)
+from usage import usage_meter, endpoint_of
 
-router = APIRouter()
+async def _job_context(request: Request, current_user: User = Depends(get_current_user)):
+    """Задания запроса ставятся в очередь пользователя, по умолчанию в полосу low"""
+    set_job_context(current_user.id, "low", endpoint_of(request))
 
-@router.post("/linear-regression", response_model=LinearRegressionResponse)
-async def linear_regression_simulator(
-    params: LinearRegressionParams,
+async def _within_quota(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    """429, если пользователь исчерпал квоту CPU симуляторов - до постановки заданий в очередь"""
+    usage_meter.check_quota(db, current_user.id)
+
+async def _interactive():
+    """Дешевые интерактивные симуляторы - полоса high (дорогие запросы admit() вернет в low)"""
+    set_job_context(lane="high")
+
+router = APIRouter(dependencies=[Depends(_job_context), Depends(_within_quota)])
+
+# Кэш результатов детерминированных симуляторов (ключ - параметры запроса)
+result_cache = LRUCache(maxsize=256)
+
+# PCA проекции датасетов для графиков многомерной классификации
+projection_cache = LRUCache(maxsize=64)
+RANDOMIZED_SVD_MIN_SAMPLES = 10000
+
+# Максимальное количество наборов параметров в одном пакетном запросе
+MAX_BATCH_SIZE = 50
+# Ограничение на число прогонов в ансамбле
+MAX_ENSEMBLE_SEEDS = 100
+
+# Обученные модели для /predict: ключ - датасет и гиперпараметры
+MODEL_CACHE_TTL = float(os.getenv("ML_MODEL_CACHE_TTL", "600"))
+model_cache = LRUCache(maxsize=64, ttl=MODEL_CACHE_TTL)
+
+def _cache_model(model, model_type: str, params, *hyperparams, projection=None) -> str:
+    """Сохраняет обученную модель в кэше и возвращает ее id для /predict"""
+    # Параметры отображения не влияют на модель
+    key = make_key("model", model_type, params.model_dump(exclude={"max_display_points"}), *hyperparams)
+    model_id = hashlib.sha1(key.encode()).hexdigest()[:16]
+    model_cache.set(model_id, {"model_type": model_type, "model": model, "projection": projection})
+    return model_id
+
+# Plotly фигуры результатов: ключ - параметры запроса, значение - (результат, фигура)
+figure_cache = LRUCache(maxsize=128)
+
+def _with_figure(key: str, result, build, by_params: bool = False):
     """
-    Симулятор линейной регрессии
-    
-    Генерирует данные с заданными параметрами и обучает модель
+    Копия результата с готовой Plotly фигурой
+
+    Фигура строится один раз на объект результата из кэша; сам
+    кэшированный результат не изменяется. by_params - результат не
+    кэшируется, но однозначно задан параметрами (ключом), поэтому
+    фигура из кэша подходит и для нового объекта результата.
     """
-    # Генерируем данные
-    np.random.seed(42)  # Для воспроизводимости
-    
-    # Создаем x координаты
-    x = np.linspace(0, 10, params.n_points)
-    
-    # Генерируем y с заданными параметрами и шумом
-    y_true = params.slope * x + params.intercept
-    noise = np.random.normal(0, params.noise_level, params.n_points)
-    y = y_true + noise
-    
+    cached = figure_cache.get(key)
+    if cached is None or (cached[0] is not result and not by_params):
+        cached = (result, build(result))
+        figure_cache.set(key, cached)
+    if isinstance(result, dict):
+        return {**result, "figure": cached[1]}
+    return result.model_copy(update={"figure": cached[1]})
+
+def _with_figures(keys: list, results: list, build, by_params: bool = False) -> list:
+    """Фигуры для результатов пакета (у одинаковых элементов ключ и фигура общие)"""
+    return [_with_figure(key, result, build, by_params) for key, result in zip(keys, results)]
+
+def _get_or_fit(key: str, compute):
+    """
+    Результат симулятора из кэша
+
+    Если обученная модель для этого результата уже вытеснена из кэша
+    моделей, симулятор выполняется заново, чтобы model_id оставался рабочим.
+    """
+    result = result_cache.get(key)
+    if result is None or result.model_id not in model_cache:
+        result = compute()
+        result_cache.set(key, result)
+    return result
+
+def _compute_linear_regression(params: LinearRegressionParams) -> LinearRegressionResponse:
+    x, y = linear_regression_data(params)
+
     # Обучаем модель
     X = x.reshape(-1, 1)
     model = LinearRegression()
@@ -58,7 +154,34 @@ async def linear_regression_simulator(
         r2=float(r2)
     )
 
-@router.get("/linear-regression/example")
+@router.post("/linear-regression", response_model=LinearRegressionResponse, dependencies=[Depends(_interactive)])
+async def linear_regression_simulator(
+    params: LinearRegressionParams,
+    request: Request,
+    response: Response,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Симулятор линейной регрессии
+    
+    Генерирует данные с заданными параметрами и обучает модель.
+    Результат детерминирован по random_state и кэшируется.
+    """
+    cost = estimate_linear_regression(params.n_points)
+    admit(cost)
+    key = make_key(params)
+    result, cpu, wall = await latest_wins.run(
+        (current_user.id, "linear-regression"), request,
+        run_measured, result_cache.get_or_compute, key, lambda: _compute_linear_regression(params)
+    )
+    response.headers.update(cost.headers(cpu, wall))
+    if figure:
+        result = await run_in_pool(_with_figure, key, result, figures.linear_regression_figure)
+    return result
+
+@router.get("/linear-regression/example", dependencies=[Depends(_interactive)])
 async def get_linear_regression_example(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -90,23 +213,12 @@ async def get_linear_regression_example(
         r2=float(r2)
     )
 
-@router.post("/linear-regression/interactive")
-async def interactive_linear_regression(
-    slope: float,
-    intercept: float,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Интерактивная настройка параметров линейной регрессии
-    
-    Позволяет пользователю изменять slope и intercept в реальном времени
-    """
+def _compute_interactive_linear_regression(slope: float, intercept: float, random_state: int):
     # Генерируем данные
-    np.random.seed(42)
+    rng = np.random.default_rng(random_state)
     x = np.linspace(0, 10, 50)
     y_true = slope * x + intercept
-    noise = np.random.normal(0, 0.5, 50)
+    noise = rng.normal(0, 0.5, 50)
     y = y_true + noise
     
     # Создаем линию с заданными параметрами
@@ -120,31 +232,194 @@ async def interactive_linear_regression(
         "intercept": intercept
     }
 
-@router.post("/logistic-regression", response_model=ClassificationResponse)
-async def logistic_regression_simulator(
-    params: ClassificationParams,
+@router.post("/linear-regression/interactive", dependencies=[Depends(_interactive)])
+async def interactive_linear_regression(
+    request: Request,
+    slope: float,
+    intercept: float,
+    random_state: int = 42,
+    figure: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Симулятор логистической регрессии для бинарной классификации
+    Интерактивная настройка параметров линейной регрессии
+    
+    Позволяет пользователю изменять slope и intercept в реальном времени
     """
-    # Генерируем данные
-    X, y = make_classification(
-        n_samples=params.n_samples,
-        n_features=params.n_features,
-        n_classes=params.n_classes,
-        n_redundant=0,
-        n_informative=params.n_features,
-        noise=params.noise,
-        random_state=params.random_state
+    key = make_key("interactive", slope, intercept, random_state)
+    result = await latest_wins.run(
+        (current_user.id, "linear-regression-interactive"), request,
+        result_cache.get_or_compute,
+        key,
+        lambda: _compute_interactive_linear_regression(slope, intercept, random_state)
+    )
+    if figure:
+        result = await run_in_pool(
+            _with_figure, key, result, figures.interactive_linear_regression_figure
+        )
+    return result
+
+def _load_dataset(db: Session, user: User, dataset_id: str, need_labels: bool = True,
+                  fill_missing: bool = True):
+    """Массивы сохраненного датасета пользователя (открыты через memory-mapping)"""
+    record = dataset_store.get_record(db, dataset_id, user.id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    arrays = dataset_store.load(db, record)
+    if need_labels and "y" not in arrays:
+        raise HTTPException(status_code=400, detail="Dataset has no target column")
+    X = arrays["X"]
+
+    # В загруженных CSV пропуски хранятся как NaN - по умолчанию заполняем средними
+    meta = json.loads(record.params) if record.params else {}
+    if fill_missing and any(meta.get("feature_missing", [])):
+        X = np.where(np.isnan(X), np.asarray(meta["feature_means"]), X)
+    return X, arrays.get("y")
+
+def _dataset_for(db: Session, user: User, params, need_labels: bool = True):
+    """Сохраненный датасет из params.dataset_id или None, если данные нужно сгенерировать"""
+    if params.dataset_id is None:
+        return None
+    # Если в предобработке есть свое заполнение пропусков, NaN оставляем ему
+    fill_missing = not has_impute(params.preprocessing)
+    return _load_dataset(db, user, params.dataset_id, need_labels, fill_missing)
+
+def _dataset_key(params) -> str:
+    """Ключ датасета для кэша статистик предобработки"""
+    if getattr(params, "dataset_id", None) is not None:
+        return params.dataset_id
+    return make_key(
+        type(params).__name__,
+        params.model_dump(exclude={"max_display_points", "dataset_id", "preprocessing", "projection", "stratify"})
     )
 
-    # Разделяем данные
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.3, random_state=params.random_state
+def _preprocess(params, X):
+    """Применяет params.preprocessing к признакам (если задана)"""
+    if params.preprocessing is None:
+        return X
+    pipeline = PreprocessingPipeline(params.preprocessing, _dataset_key(params))
+    try:
+        X, _ = pipeline.transform(X)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if np.isnan(X).any():
+        raise HTTPException(
+            status_code=400,
+            detail="Features contain missing values, add an impute step"
+        )
+    return X
+
+def _classification_display(params: ClassificationParams, X, y, X_train, y_train,
+                            X_test, y_test, y_pred, y_proba=None) -> dict:
+    """
+    Готовит точки классификации для ответа
+
+    Метрики уже посчитаны по полным данным; здесь при max_display_points
+    выборка, train и test прореживаются с сохранением долей классов.
+    """
+    limit = params.max_display_points
+    if limit is None or len(y) <= limit:
+        return dict(
+            x=X.tolist(),
+            y=y.tolist(),
+            x_train=X_train.tolist(),
+            y_train=y_train.tolist(),
+            x_test=X_test.tolist(),
+            y_test=y_test.tolist(),
+            y_pred=y_pred.tolist(),
+            probabilities=y_proba.tolist() if y_proba is not None else None,
+        )
+
+    rng = np.random.default_rng(params.random_state)
+    idx, omitted = stratified_indices(y, limit, rng)
+    # train и test делят лимит пропорционально своим размерам
+    train_limit = max(1, round(limit * len(y_train) / len(y)))
+    train_idx, _ = stratified_indices(y_train, train_limit, rng)
+    test_idx, _ = stratified_indices(y_test, max(1, limit - train_limit), rng)
+
+    return dict(
+        x=X[idx].tolist(),
+        y=y[idx].tolist(),
+        x_train=X_train[train_idx].tolist(),
+        y_train=y_train[train_idx].tolist(),
+        x_test=X_test[test_idx].tolist(),
+        y_test=y_test[test_idx].tolist(),
+        y_pred=y_pred[test_idx].tolist(),
+        probabilities=y_proba[test_idx].tolist() if y_proba is not None else None,
+        sampling=DisplaySampling(
+            total_points=len(y),
+            displayed_points=len(idx),
+            omitted_per_class=omitted,
+            omitted_train=len(y_train) - len(train_idx),
+            omitted_test=len(y_test) - len(test_idx),
+        ),
+    )
+
+def _projection_for(params: ClassificationParams, X):
+    """
+    2-D PCA проекция датасета, если она запрошена и признаков больше двух
+
+    Проекция кэшируется по датасету и предобработке, поэтому повторные
+    просмотры того же датасета не пересчитывают SVD. На больших данных
+    используется рандомизированный SVD.
+    """
+    if params.projection != "pca" or X.shape[1] <= 2:
+        return None
+    key = make_key("pca", _dataset_key(params), params.preprocessing)
+
+    def fit():
+        solver = "randomized" if len(X) >= RANDOMIZED_SVD_MIN_SAMPLES else "full"
+        return PCA(n_components=2, svd_solver=solver, random_state=params.random_state).fit(X)
+
+    return projection_cache.get_or_compute(key, fit)
+
+def _projection_info(projection):
+    if projection is None:
+        return None
+    return ProjectionInfo(
+        method="pca",
+        components=projection.components_.tolist(),
+        mean=projection.mean_.tolist(),
+        explained_variance_ratio=projection.explained_variance_ratio_.tolist()
     )
 
+BOUNDARY_CHUNK_SIZE = 2500
+
+def _decision_boundary(model, plane_X, resolution: int, projection=None):
+    """
+    Сетка предсказаний для границы решений
+
+    plane_X - точки на плоскости графика. Если задана проекция, узлы сетки
+    переводятся обратно в пространство признаков перед предсказанием.
+    """
+    x_min, x_max = plane_X[:, 0].min() - 0.5, plane_X[:, 0].max() + 0.5
+    y_min, y_max = plane_X[:, 1].min() - 0.5, plane_X[:, 1].max() + 0.5
+    xx, yy = np.meshgrid(np.linspace(x_min, x_max, resolution),
+                       np.linspace(y_min, y_max, resolution))
+
+    grid = np.c_[xx.ravel(), yy.ravel()]
+    if projection is not None:
+        grid = projection.inverse_transform(grid)
+    # Предсказываем блоками, чтобы отмененный запрос не досчитывал всю сетку
+    predictions = []
+    for start in range(0, len(grid), BOUNDARY_CHUNK_SIZE):
+        checkpoint()
+        predictions.append(model.predict(grid[start:start + BOUNDARY_CHUNK_SIZE]))
+    Z = np.concatenate(predictions)
+
+    return [[float(a), float(b), int(c)] for a, b, c in zip(xx.ravel(), yy.ravel(), Z)]
+
+def _compute_logistic_regression(params: ClassificationParams, data=None) -> ClassificationResponse:
+    # Генерируем данные (или берем сохраненный датасет)
+    X, y = data if data is not None else classification_data(params)
+    X = _preprocess(params, X)
+    checkpoint()
+
+    # Разделяем данные (индексы общие для всех симуляторов на этом датасете)
+    train_idx, test_idx = train_test_indices(y, _dataset_key(params), params.random_state, params.stratify)
+    X_train, X_test, y_train, y_test = X[train_idx], X[test_idx], y[train_idx], y[test_idx]
+
     # Обучаем модель
     model = LogisticRegression(
         random_state=params.random_state,
@@ -152,6 +427,7 @@ async def logistic_regression_simulator(
         max_iter=1000       # Увеличиваем количество итераций
     )
     model.fit(X_train, y_train)
+    checkpoint()
 
     # Получаем предсказания
     y_pred = model.predict(X_test)
@@ -170,79 +446,152 @@ async def logistic_regression_simulator(
         recall = 0.0
         f1 = 0.0
 
+    # Для многомерных данных граница строится на плоскости 2-D PCA
+    projection = _projection_for(params, X)
+    plane = projection.transform if projection is not None else (lambda A: A)
+
     # Создаем сетку для границы решений (только для 2D)
     decision_boundary = None
     try:
-        if params.n_features == 2:
-            x_min, x_max = X[:, 0].min() - 0.5, X[:, 0].max() + 0.5
-            y_min, y_max = X[:, 1].min() - 0.5, X[:, 1].max() + 0.5
-            
+        if X.shape[1] == 2 or projection is not None:
             # Уменьшаем сетку для производительности
-            xx, yy = np.meshgrid(np.linspace(x_min, x_max, 50),
-                               np.linspace(y_min, y_max, 50))
-
-            Z = model.predict(np.c_[xx.ravel(), yy.ravel()])
-            Z = Z.reshape(xx.shape)
-
-            decision_boundary = []
-            for i in range(len(xx)):
-                for j in range(len(xx[i])):
-                    decision_boundary.append([float(xx[i, j]), float(yy[i, j]), int(Z[i, j])])
+            decision_boundary = _decision_boundary(model, plane(X), 50, projection)
     except Exception as e:
         print(f"Ошибка при создании границы решений: {e}")
         decision_boundary = None
 
     return ClassificationResponse(
-        x=X.tolist(),
-        y=y.tolist(),
-        x_train=X_train.tolist(),
-        y_train=y_train.tolist(),
-        x_test=X_test.tolist(),
-        y_test=y_test.tolist(),
-        y_pred=y_pred.tolist(),
         accuracy=float(accuracy),
         precision=float(precision),
         recall=float(recall),
         f1=float(f1),
         decision_boundary=decision_boundary,
-        probabilities=y_proba.tolist()
+        model_id=_cache_model(model, "logistic", params, projection=projection),
+        projection=_projection_info(projection),
+        **_classification_display(
+            params, plane(X), y, plane(X_train), y_train, plane(X_test), y_test, y_pred, y_proba
+        )
     )
 
-@router.post("/knn-classification", response_model=ClassificationResponse)
-async def knn_classification_simulator(
-    k: int = 5,
-    params: ClassificationParams = None,
+@router.post("/logistic-regression", response_model=ClassificationResponse, dependencies=[Depends(_interactive)])
+async def logistic_regression_simulator(
+    params: ClassificationParams,
+    request: Request,
+    response: Response,
+    figure: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Симулятор kNN классификации
+    Симулятор логистической регрессии для бинарной классификации
     """
-    if params is None:
-        params = ClassificationParams()
-
-    # Генерируем данные
-    X, y = make_classification(
-        n_samples=params.n_samples,
-        n_features=params.n_features,
-        n_classes=params.n_classes,
-        n_redundant=0,
-        n_informative=params.n_features,
-        noise=params.noise,
-        random_state=params.random_state
+    data = _dataset_for(db, current_user, params)
+    params, cost = estimate_classification(params, "logistic", data)
+    admit(cost)
+    key = make_key("logistic", params)
+    result, cpu, wall = await latest_wins.run(
+        (current_user.id, "logistic-regression"), request,
+        run_measured, _get_or_fit, key, lambda: _compute_logistic_regression(params, data)
     )
+    response.headers.update(cost.headers(cpu, wall))
+    if figure:
+        result = await run_in_pool(
+            _with_figure, key, result,
+            partial(figures.classification_figure, title="Логистическая регрессия")
+        )
+    return result
 
-    # Разделяем данные
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.3, random_state=params.random_state
-    )
+# Границы 1-NN по диаграмме Вороного: ключ - датасет, предобработка и разбиение (сид и стратификация)
+voronoi_cache = LRUCache(maxsize=64)
+
+def _clip_segment(p, q, lo, hi):
+    """Отсечение отрезка pq прямоугольником [lo, hi] (алгоритм Лианга-Барски)"""
+    d = q - p
+    t0, t1 = 0.0, 1.0
+    for axis in range(2):
+        for edge, sign in ((lo[axis], -1.0), (hi[axis], 1.0)):
+            denom = sign * d[axis]
+            dist = sign * (edge - p[axis])
+            if denom == 0:
+                if dist < 0:
+                    return None
+                continue
+            t = dist / denom
+            if denom > 0:
+                t1 = min(t1, t)
+            else:
+                t0 = max(t0, t)
+    if t0 > t1:
+        return None
+    return p + t0 * d, p + t1 * d
+
+def _voronoi_boundary(params: ClassificationParams, X, X_train, y_train):
+    """
+    Точная граница решений 1-NN
+
+    Граница 1-NN - это ребра диаграммы Вороного обучающих точек, разделяющие
+    ячейки разных классов. Бесконечные ребра продлеваются наружу и вместе
+    с остальными обрезаются рамкой графика. Возвращает отрезки
+    [x1, y1, x2, y2] или None, если диаграмму построить нельзя.
+    """
+    key = make_key("voronoi", _dataset_key(params), params.preprocessing, params.random_state,
+                   params.stratify)
+
+    def build():
+        points, unique_idx = np.unique(X_train, axis=0, return_index=True)
+        labels = y_train[unique_idx]
+        if len(points) < 3:
+            return None
+        try:
+            vor = Voronoi(points)
+        except QhullError:
+            return None
+
+        lo = X.min(axis=0) - 0.5
+        hi = X.max(axis=0) + 0.5
+        far = 2 * np.linalg.norm(hi - lo)
+        center = points.mean(axis=0)
+
+        segments = []
+        for (a, b), ridge in zip(vor.ridge_points, vor.ridge_vertices):
+            if labels[a] == labels[b] or (ridge[0] < 0 and ridge[1] < 0):
+                continue
+            if ridge[0] >= 0 and ridge[1] >= 0:
+                start, end = vor.vertices[ridge[0]], vor.vertices[ridge[1]]
+            else:
+                # Бесконечное ребро: идем от конечной вершины перпендикулярно отрезку ab наружу
+                start = vor.vertices[max(ridge)]
+                tangent = points[b] - points[a]
+                normal = np.array([-tangent[1], tangent[0]]) / np.linalg.norm(tangent)
+                midpoint = (points[a] + points[b]) / 2
+                direction = np.sign(np.dot(midpoint - center, normal)) * normal
+                end = start + direction * far
+            clipped = _clip_segment(start, end, lo, hi)
+            if clipped is not None:
+                segments.append([*map(float, clipped[0]), *map(float, clipped[1])])
+        return segments
+
+    return voronoi_cache.get_or_compute(key, build)
+
+def _compute_knn_classification(params: ClassificationParams, k: int, data=None,
+                                boundary_resolution: int = KNN_BOUNDARY_RESOLUTION) -> ClassificationResponse:
+    # Генерируем данные (или берем сохраненный датасет)
+    X, y = data if data is not None else classification_data(params)
+    X = _preprocess(params, X)
+    checkpoint()
+
+    # Разделяем данные (индексы общие для всех симуляторов на этом датасете)
+    train_idx, test_idx = train_test_indices(y, _dataset_key(params), params.random_state, params.stratify)
+    X_train, X_test, y_train, y_test = X[train_idx], X[test_idx], y[train_idx], y[test_idx]
 
     # Обучаем модель
     model = KNeighborsClassifier(n_neighbors=k)
     model.fit(X_train, y_train)
+    checkpoint()
 
     # Получаем предсказания
     y_pred = model.predict(X_test)
+    checkpoint()
 
     # Вычисляем метрики
     accuracy = accuracy_score(y_test, y_pred)
@@ -250,82 +599,622 @@ async def knn_classification_simulator(
     recall = recall_score(y_test, y_pred, average='weighted')
     f1 = f1_score(y_test, y_pred, average='weighted')
 
+    # Для многомерных данных граница строится на плоскости 2-D PCA
+    projection = _projection_for(params, X)
+    plane = projection.transform if projection is not None else (lambda A: A)
+
+    # Для k=1 в 2D граница точная - ребра диаграммы Вороного между разными классами
+    boundary_segments = None
+    if k == 1 and X.shape[1] == 2:
+        boundary_segments = _voronoi_boundary(params, X, X_train, y_train)
+
     # Создаем сетку для границы решений (только для 2D)
-    if params.n_features == 2:
-        x_min, x_max = X[:, 0].min() - 0.5, X[:, 0].max() + 0.5
-        y_min, y_max = X[:, 1].min() - 0.5, X[:, 1].max() + 0.5
-        xx, yy = np.meshgrid(np.linspace(x_min, x_max, 100),
-                           np.linspace(y_min, y_max, 100))
-
-        Z = model.predict(np.c_[xx.ravel(), yy.ravel()])
-        Z = Z.reshape(xx.shape)
-
-        decision_boundary = []
-        for i in range(len(xx)):
-            for j in range(len(xx[i])):
-                decision_boundary.append([float(xx[i, j]), float(yy[i, j]), int(Z[i, j])])
+    if boundary_segments is not None:
+        decision_boundary = None
+    elif X.shape[1] == 2 or projection is not None:
+        decision_boundary = _decision_boundary(model, plane(X), boundary_resolution, projection)
     else:
         decision_boundary = None
 
     return ClassificationResponse(
-        x=X.tolist(),
-        y=y.tolist(),
-        x_train=X_train.tolist(),
-        y_train=y_train.tolist(),
-        x_test=X_test.tolist(),
-        y_test=y_test.tolist(),
-        y_pred=y_pred.tolist(),
         accuracy=float(accuracy),
         precision=float(precision),
         recall=float(recall),
         f1=float(f1),
-        decision_boundary=decision_boundary
+        decision_boundary=decision_boundary,
+        boundary_segments=boundary_segments,
+        model_id=_cache_model(model, "knn", params, k, projection=projection),
+        projection=_projection_info(projection),
+        **_classification_display(
+            params, plane(X), y, plane(X_train), y_train, plane(X_test), y_test, y_pred
+        )
     )
 
-@router.post("/kmeans-clustering", response_model=ClusteringResponse)
-async def kmeans_clustering_simulator(
-    params: ClusteringParams,
+@router.post("/knn-classification", response_model=ClassificationResponse, dependencies=[Depends(_interactive)])
+async def knn_classification_simulator(
+    request: Request,
+    response: Response,
+    k: int = 5,
+    params: ClassificationParams = None,
+    figure: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Симулятор K-means кластеризации
+    Симулятор kNN классификации
     """
-    # Генерируем данные
-    X, y_true = make_blobs(
-        n_samples=params.n_samples,
-        n_features=params.n_features,
-        centers=params.n_clusters,
-        cluster_std=params.cluster_std,
-        random_state=params.random_state
+    if params is None:
+        params = ClassificationParams()
+
+    data = _dataset_for(db, current_user, params)
+    params, cost = estimate_classification(params, "knn", data, k)
+    admit(cost)
+    key = make_key("knn", params, k)
+    result, cpu, wall = await latest_wins.run(
+        (current_user.id, "knn-classification"), request,
+        run_measured, _get_or_fit, key,
+        lambda: _compute_knn_classification(params, k, data, **cost.options)
     )
+    response.headers.update(cost.headers(cpu, wall))
+    if figure:
+        result = await run_in_pool(
+            _with_figure, key, result,
+            partial(figures.classification_figure, title=f"kNN классификация (k={k})")
+        )
+    return result
 
-    # Обучаем модель
-    kmeans = KMeans(n_clusters=params.n_clusters, random_state=params.random_state, n_init=10)
+# Последние центроиды K-means для каждого датасета (без учета n_clusters)
+centroid_cache = LRUCache(maxsize=64)
+
+def _centroid_key(params: ClusteringParams) -> str:
+    """
+    Ключ датасета для теплого старта K-means
+
+    n_clusters в ключ не входит, кроме случая, когда он же задает число
+    центров сгенерированных blobs (тогда другой n_clusters - другие данные).
+    """
+    exclude = {"max_display_points", "dataset_id", "warm_start", "n_clusters"}
+    data_fields = params.model_dump(exclude=exclude)
+    if params.dataset_id is not None:
+        data_fields = {"dataset_id": params.dataset_id, "preprocessing": data_fields["preprocessing"]}
+    elif params.dataset_shape == "blobs" and params.n_centers is None:
+        data_fields["n_centers"] = params.n_clusters
+    return make_key("centroids", data_fields)
+
+def _adjust_centroids(X, centroids, n_clusters: int):
+    """
+    Подгоняет прошлые центроиды под новое число кластеров
+
+    Пока центроидов меньше нужного, кластер с наибольшей суммой квадратов
+    расстояний делится вдоль главной оси; пока больше - ближайшая пара
+    центроидов сливается в их взвешенное среднее.
+    """
+    centroids = np.array(centroids, dtype=float)
+    while len(centroids) != n_clusters:
+        labels = pairwise_distances_argmin(X, centroids)
+        if len(centroids) < n_clusters:
+            sse = np.bincount(
+                labels, weights=((X - centroids[labels]) ** 2).sum(axis=1), minlength=len(centroids)
+            )
+            i = int(np.argmax(sse))
+            points = X[labels == i] - centroids[i]
+            if len(points) < 2:
+                # Делить нечего - добавляем самую далекую от своего центра точку
+                far = int(np.argmax(((X - centroids[labels]) ** 2).sum(axis=1)))
+                centroids = np.vstack([centroids, X[far]])
+                continue
+            _, singular, vt = np.linalg.svd(points, full_matrices=False)
+            offset = vt[0] * singular[0] / np.sqrt(len(points))
+            centroids = np.vstack([np.delete(centroids, i, axis=0),
+                                   centroids[i] - offset, centroids[i] + offset])
+        else:
+            sizes = np.bincount(labels, minlength=len(centroids)).astype(float)
+            distances = ((centroids[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+            np.fill_diagonal(distances, np.inf)
+            i, j = np.unravel_index(np.argmin(distances), distances.shape)
+            total = sizes[i] + sizes[j]
+            merged = (centroids[i] * sizes[i] + centroids[j] * sizes[j]) / total if total else \
+                (centroids[i] + centroids[j]) / 2
+            centroids = np.vstack([np.delete(centroids, [i, j], axis=0), merged])
+    return centroids
+
+def _compute_kmeans_clustering(params: ClusteringParams, data=None,
+                               silhouette_sample: int = None, minibatch: bool = False) -> ClusteringResponse:
+    # Генерируем данные (или берем сохраненный датасет)
+    X, y_true = data if data is not None else clustering_data(params)
+    X = _preprocess(params, X)
+    checkpoint()
+
+    # Обучаем модель: от прошлых центроидов датасета, если они есть, иначе с нуля
+    warm_key = _centroid_key(params)
+    init = None
+    if params.warm_start:
+        previous = centroid_cache.get(warm_key)
+        if previous is not None and previous.shape[1] == X.shape[1]:
+            init = _adjust_centroids(X, previous, params.n_clusters)
+
+    # На больших данных (понижение при допуске) - MiniBatchKMeans
+    estimator = MiniBatchKMeans if minibatch else KMeans
+    if init is not None:
+        kmeans = estimator(n_clusters=params.n_clusters, init=init, n_init=1, random_state=params.random_state)
+    else:
+        kmeans = estimator(n_clusters=params.n_clusters, random_state=params.random_state,
+                           n_init=3 if minibatch else 10)
     labels = kmeans.fit_predict(X)
+    checkpoint()
     centroids = kmeans.cluster_centers_
+    centroid_cache.set(warm_key, centroids)
 
     # Вычисляем метрики
-    from sklearn.metrics import silhouette_score
-    silhouette = silhouette_score(X, labels)
+    # Попарные расстояния считаются блоками ограниченного размера
+    with config_context(working_memory=SILHOUETTE_WORKING_MEMORY_MB):
+        silhouette = silhouette_score(
+            X, labels, sample_size=silhouette_sample, random_state=params.random_state
+        )
     wcss = kmeans.inertia_
 
+    # Прореживаем точки для графика с сохранением долей кластеров
+    sampling = None
+    if params.max_display_points is not None and len(labels) > params.max_display_points:
+        rng = np.random.default_rng(params.random_state)
+        idx, omitted = stratified_indices(labels, params.max_display_points, rng)
+        sampling = DisplaySampling(
+            total_points=len(labels),
+            displayed_points=len(idx),
+            omitted_per_class=omitted
+        )
+        X, labels = X[idx], labels[idx]
+
     return ClusteringResponse(
         x=X.tolist(),
         labels=labels.tolist(),
         centroids=centroids.tolist(),
         silhouette_score=float(silhouette),
-        wcss=float(wcss)
+        wcss=float(wcss),
+        sampling=sampling,
+        model_id=_cache_model(kmeans, "kmeans", params),
+        warm_started=init is not None,
+        n_iter=int(kmeans.n_iter_)
     )
 
-@router.get("/metrics-comparison")
-async def metrics_comparison_simulator(
+@router.post("/kmeans-clustering", response_model=ClusteringResponse, dependencies=[Depends(_interactive)])
+async def kmeans_clustering_simulator(
+    params: ClusteringParams,
+    request: Request,
+    response: Response,
+    figure: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Сравнение метрик качества на разных датасетах
+    Симулятор K-means кластеризации
+    """
+    data = _dataset_for(db, current_user, params, need_labels=False)
+    params, cost = estimate_clustering(params, data)
+    admit(cost)
+    key = make_key("kmeans", params)
+    result, cpu, wall = await latest_wins.run(
+        (current_user.id, "kmeans-clustering"), request,
+        run_measured, _get_or_fit, key,
+        lambda: _compute_kmeans_clustering(params, data, **cost.options)
+    )
+    response.headers.update(cost.headers(cpu, wall))
+    if figure:
+        result = await run_in_pool(_with_figure, key, result, figures.clustering_figure)
+    return result
+
+# Пакетные запросы: несколько наборов параметров за один вызов
+
+def _check_batch_size(items: list):
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch size exceeds the limit of {MAX_BATCH_SIZE}"
+        )
+
+def _compute_linear_regression_batch(batch: List[LinearRegressionParams]) -> List[LinearRegressionResponse]:
+    """
+    Обучает линейные регрессии для всего пакета одной матричной операцией
+
+    Наборы параметров группируются по n_points: у них общий x и общая
+    матрица признаков, поэтому МНК решается сразу для всех столбцов y.
+    Стандартный шум генерируется один раз на (n_points, random_state)
+    и масштабируется под noise_level каждого набора.
+    """
+    results = [None] * len(batch)
+    groups = {}
+    for idx, params in enumerate(batch):
+        groups.setdefault(params.n_points, []).append(idx)
+
+    for n_points, indices in groups.items():
+        x = np.linspace(0, 10, n_points)
+        X = np.column_stack([np.ones(n_points), x])
+
+        # Общий стандартный шум для одинаковых random_state
+        base_noise = {}
+        Y = np.empty((n_points, len(indices)))
+        for col, idx in enumerate(indices):
+            params = batch[idx]
+            if params.random_state not in base_noise:
+                rng = np.random.default_rng(params.random_state)
+                base_noise[params.random_state] = rng.standard_normal(n_points)
+            noise = params.noise_level * base_noise[params.random_state]
+            Y[:, col] = params.slope * x + params.intercept + noise
+
+        # Один вызов МНК на все столбцы
+        coef, *_ = np.linalg.lstsq(X, Y, rcond=None)
+        Y_pred = X @ coef
+
+        # Метрики для всех столбцов сразу
+        residuals = Y - Y_pred
+        mse = np.mean(residuals ** 2, axis=0)
+        ss_res = np.sum(residuals ** 2, axis=0)
+        ss_tot = np.sum((Y - Y.mean(axis=0)) ** 2, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, 0.0)
+
+        x_list = x.tolist()
+        for col, idx in enumerate(indices):
+            results[idx] = LinearRegressionResponse(
+                x=x_list,
+                y=Y[:, col].tolist(),
+                predicted_y=Y_pred[:, col].tolist(),
+                mse=float(mse[col]),
+                r2=float(r2[col])
+            )
+    return results
+
+async def _run_batch(prefix: str, batch: list, datasets: list, estimates: list, compute, *extra,
+                     on_progress=None):
+    """
+    Раздает уникальные наборы параметров по пулу воркеров
+
+    Одинаковые наборы считаются один раз, результаты возвращаются
+    в порядке запроса. datasets - сохраненные датасеты для элементов
+    пакета (None - сгенерировать по параметрам), estimates - их оценки
+    стоимости с аргументами понижения. Возвращает результаты и
+    суммарное CPU время воркеров; on_progress(доля) вызывается после
+    каждого посчитанного набора.
+    """
+    keys = [make_key(prefix, params, *extra) for params in batch]
+    unique = {}
+    for key, params, data, cost in zip(keys, batch, datasets, estimates):
+        unique.setdefault(key, (params, data, cost))
+
+    done = 0
+
+    async def run(key, params, data, cost):
+        nonlocal done
+        measured = await run_in_pool(
+            run_measured, _get_or_fit, key,
+            partial(compute, params, *extra, data=data, **cost.options)
+        )
+        done += 1
+        if on_progress is not None:
+            on_progress(done / len(unique))
+        return measured
+
+    measured = await asyncio.gather(*[
+        run(key, params, data, cost) for key, (params, data, cost) in unique.items()
+    ])
+    computed = {key: result for key, (result, _, _) in zip(unique.keys(), measured)}
+    return [computed[key] for key in keys], sum(cpu for _, cpu, _ in measured)
+
+def _admit_batch(batch: list, datasets: list, estimate):
+    """Оценивает элементы пакета; пакет допускается, если в бюджет укладывается сумма"""
+    estimated = [estimate(params, data) for params, data in zip(batch, datasets)]
+    total = sum((cost for _, cost in estimated), CostEstimate())
+    admit(total)
+    return [params for params, _ in estimated], [cost for _, cost in estimated], total
+
+@router.post("/linear-regression/batch", response_model=List[LinearRegressionResponse])
+async def linear_regression_batch(
+    batch: List[LinearRegressionParams],
+    response: Response,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Пакетный симулятор линейной регрессии
+
+    Принимает список наборов параметров и возвращает результаты в том же порядке
+    """
+    _check_batch_size(batch)
+    total = sum((estimate_linear_regression(params.n_points) for params in batch), CostEstimate())
+    admit(total)
+    results, cpu, wall = await run_in_pool(run_measured, _compute_linear_regression_batch, batch)
+    response.headers.update(total.headers(cpu, wall))
+    if figure:
+        # Пакет считается целиком без кэша, но результат элемента задан его параметрами
+        results = await run_in_pool(
+            _with_figures, [make_key("linear-regression-batch", params) for params in batch],
+            results, figures.linear_regression_figure, by_params=True
+        )
+    return results
+
+@router.post("/logistic-regression/batch", response_model=List[ClassificationResponse])
+async def logistic_regression_batch(
+    batch: List[ClassificationParams],
+    response: Response,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Пакетный симулятор логистической регрессии
+    """
+    _check_batch_size(batch)
+    datasets = [_dataset_for(db, current_user, params) for params in batch]
+    started = time.perf_counter()
+    batch, estimates, total = _admit_batch(
+        batch, datasets, lambda params, data: estimate_classification(params, "logistic", data)
+    )
+    results, cpu = await _run_batch(
+        "logistic", batch, datasets, estimates, _compute_logistic_regression
+    )
+    response.headers.update(total.headers(cpu, time.perf_counter() - started))
+    if figure:
+        results = await run_in_pool(
+            _with_figures, [make_key("logistic", params) for params in batch], results,
+            partial(figures.classification_figure, title="Логистическая регрессия")
+        )
+    return results
+
+@router.post("/knn-classification/batch", response_model=List[ClassificationResponse])
+async def knn_classification_batch(
+    batch: List[ClassificationParams],
+    response: Response,
+    k: int = 5,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Пакетный симулятор kNN классификации
+    """
+    _check_batch_size(batch)
+    datasets = [_dataset_for(db, current_user, params) for params in batch]
+    started = time.perf_counter()
+    batch, estimates, total = _admit_batch(
+        batch, datasets, lambda params, data: estimate_classification(params, "knn", data, k)
+    )
+    results, cpu = await _run_batch(
+        "knn", batch, datasets, estimates, _compute_knn_classification, k
+    )
+    response.headers.update(total.headers(cpu, time.perf_counter() - started))
+    if figure:
+        results = await run_in_pool(
+            _with_figures, [make_key("knn", params, k) for params in batch], results,
+            partial(figures.classification_figure, title=f"kNN классификация (k={k})")
+        )
+    return results
+
+@router.post("/kmeans-clustering/batch", response_model=List[ClusteringResponse])
+async def kmeans_clustering_batch(
+    batch: List[ClusteringParams],
+    response: Response,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Пакетный симулятор K-means кластеризации
+    """
+    _check_batch_size(batch)
+    datasets = [_dataset_for(db, current_user, params, need_labels=False) for params in batch]
+    started = time.perf_counter()
+    batch, estimates, total = _admit_batch(batch, datasets, estimate_clustering)
+    results, cpu = await _run_batch(
+        "kmeans", batch, datasets, estimates, _compute_kmeans_clustering
+    )
+    response.headers.update(total.headers(cpu, time.perf_counter() - started))
+    if figure:
+        results = await run_in_pool(
+            _with_figures, [make_key("kmeans", params) for params in batch], results,
+            figures.clustering_figure
+        )
+    return results
+
+# Ансамбли: один симулятор на нескольких сидах, в ответе - распределения метрик
+
+ENSEMBLE_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+def _check_ensemble(n_seeds: int):
+    if n_seeds < 2 or n_seeds > MAX_ENSEMBLE_SEEDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"n_seeds must be between 2 and {MAX_ENSEMBLE_SEEDS}"
+        )
+
+def _classification_ensemble(model_type: str, params: ClassificationParams, k: int, data, seeds) -> list:
+    """Метрики классификатора для каждого сида (без точек ответа и границы)"""
+    runs = []
+    for seed in seeds:
+        checkpoint()
+        seed_params = params.model_copy(update={"random_state": seed})
+        # Датасеты прогонов одноразовые - в общий кэш их не кладем
+        X, y = data if data is not None else classification_data(seed_params, shared=False)
+        X = _preprocess(seed_params, X)
+        train_idx, test_idx = train_test_indices(y, _dataset_key(seed_params), seed, params.stratify)
+        X_train, X_test, y_train, y_test = X[train_idx], X[test_idx], y[train_idx], y[test_idx]
+        if model_type == "knn":
+            model = KNeighborsClassifier(n_neighbors=k)
+        else:
+            model = LogisticRegression(random_state=seed, solver='liblinear', max_iter=1000)
+        model.fit(X_train, y_train)
+        y_pred = model.predict(X_test)
+        runs.append({
+            "accuracy": accuracy_score(y_test, y_pred),
+            "precision": precision_score(y_test, y_pred, average='weighted', zero_division=0),
+            "recall": recall_score(y_test, y_pred, average='weighted', zero_division=0),
+            "f1": f1_score(y_test, y_pred, average='weighted', zero_division=0)
+        })
+    return runs
+
+def _clustering_ensemble(params: ClusteringParams, data, seeds,
+                         silhouette_sample: int = None, minibatch: bool = False) -> list:
+    """Метрики K-means для каждого сида; adjusted_rand - если известны истинные метки"""
+    runs = []
+    for seed in seeds:
+        checkpoint()
+        seed_params = params.model_copy(update={"random_state": seed})
+        X, y_true = data if data is not None else clustering_data(seed_params, shared=False)
+        X = _preprocess(seed_params, X)
+        estimator = MiniBatchKMeans if minibatch else KMeans
+        kmeans = estimator(n_clusters=params.n_clusters, random_state=seed, n_init=3 if minibatch else 10)
+        labels = kmeans.fit_predict(X)
+        with config_context(working_memory=SILHOUETTE_WORKING_MEMORY_MB):
+            silhouette = silhouette_score(X, labels, sample_size=silhouette_sample, random_state=seed)
+        run = {
+            "silhouette_score": silhouette,
+            "wcss": kmeans.inertia_,
+            "n_iter": kmeans.n_iter_
+        }
+        if y_true is not None:
+            run["adjusted_rand"] = adjusted_rand_score(y_true, labels)
+        runs.append(run)
+    return runs
+
+def _metric_distributions(runs: list) -> dict:
+    """Среднее, разброс и квантили всех метрик сразу - по матрице прогоны x метрики"""
+    names = list(runs[0])
+    values = np.array([[run[name] for name in names] for run in runs], dtype=float)
+    mean = values.mean(axis=0)
+    std = values.std(axis=0, ddof=1)
+    low, high = values.min(axis=0), values.max(axis=0)
+    q05, q25, median, q75, q95 = np.quantile(values, ENSEMBLE_QUANTILES, axis=0)
+    return {
+        name: MetricDistribution(
+            mean=mean[i], std=std[i], min=low[i], q05=q05[i], q25=q25[i],
+            median=median[i], q75=q75[i], q95=q95[i], max=high[i]
+        )
+        for i, name in enumerate(names)
+    }
+
+async def _run_ensemble(key: str, params, n_seeds: int, compute):
+    """
+    Раздает сиды ансамбля по воркерам пула
+
+    Сиды random_state, random_state + 1, ... делятся на столько частей,
+    сколько воркеров в пуле; compute(сиды) возвращает метрики прогонов.
+    Возвращает результат и суммарное CPU время воркеров.
+    """
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached, 0.0
+    seeds = list(range(params.random_state, params.random_state + n_seeds))
+    chunks = [seeds[i::scheduler.max_workers] for i in range(min(n_seeds, scheduler.max_workers))]
+    measured = await asyncio.gather(*[run_in_pool(run_measured, compute, chunk) for chunk in chunks])
+    by_seed = {seed: run for chunk, (runs, _, _) in zip(chunks, measured) for seed, run in zip(chunk, runs)}
+    runs = [by_seed[seed] for seed in seeds]
+    result = EnsembleResponse(
+        n_seeds=n_seeds,
+        seeds=seeds,
+        metrics=_metric_distributions(runs),
+        values={name: [float(run[name]) for run in runs] for name in runs[0]}
+    )
+    result_cache.set(key, result)
+    return result, sum(cpu for _, cpu, _ in measured)
+
+@router.post("/logistic-regression/ensemble", response_model=EnsembleResponse)
+async def logistic_regression_ensemble(
+    params: ClassificationParams,
+    response: Response,
+    n_seeds: int = 20,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ансамбль логистических регрессий по n_seeds сидам
+
+    Сид задает датасет, разбиение и инициализацию модели (у сохраненного
+    датасета - только разбиение). Возвращаются распределения метрик
+    (среднее, std, квантили), а не n_seeds полных ответов.
+    """
+    _check_ensemble(n_seeds)
+    data = _dataset_for(db, current_user, params)
+    started = time.perf_counter()
+    params, cost = estimate_classification(params, "logistic", data, repeats=n_seeds)
+    admit(cost)
+    key = make_key("logistic-ensemble", params, n_seeds)
+    result, cpu = await _run_ensemble(
+        key, params, n_seeds,
+        partial(_classification_ensemble, "logistic", params, None, data)
+    )
+    response.headers.update(cost.headers(cpu, time.perf_counter() - started))
+    if figure:
+        result = await run_in_pool(
+            _with_figure, key, result, partial(figures.ensemble_figure, title="Ансамбль логистических регрессий")
+        )
+    return result
+
+@router.post("/knn-classification/ensemble", response_model=EnsembleResponse)
+async def knn_classification_ensemble(
+    params: ClassificationParams,
+    response: Response,
+    k: int = 5,
+    n_seeds: int = 20,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ансамбль kNN классификаций по n_seeds сидам (распределения метрик)
     """
+    _check_ensemble(n_seeds)
+    data = _dataset_for(db, current_user, params)
+    started = time.perf_counter()
+    params, cost = estimate_classification(params, "knn", data, k, repeats=n_seeds)
+    admit(cost)
+    key = make_key("knn-ensemble", params, k, n_seeds)
+    result, cpu = await _run_ensemble(
+        key, params, n_seeds,
+        partial(_classification_ensemble, "knn", params, k, data)
+    )
+    response.headers.update(cost.headers(cpu, time.perf_counter() - started))
+    if figure:
+        result = await run_in_pool(
+            _with_figure, key, result, partial(figures.ensemble_figure, title=f"Ансамбль kNN (k={k})")
+        )
+    return result
+
+@router.post("/kmeans-clustering/ensemble", response_model=EnsembleResponse)
+async def kmeans_clustering_ensemble(
+    params: ClusteringParams,
+    response: Response,
+    n_seeds: int = 20,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ансамбль K-means кластеризаций по n_seeds сидам
+
+    Кроме силуэта, WCSS и числа итераций для сгенерированных данных
+    считается adjusted_rand - согласие с истинными кластерами.
+    """
+    _check_ensemble(n_seeds)
+    data = _dataset_for(db, current_user, params, need_labels=False)
+    started = time.perf_counter()
+    params, cost = estimate_clustering(params, data, repeats=n_seeds)
+    admit(cost)
+    key = make_key("kmeans-ensemble", params, n_seeds, cost.options)
+    result, cpu = await _run_ensemble(
+        key, params, n_seeds,
+        partial(_clustering_ensemble, params, data, **cost.options)
+    )
+    response.headers.update(cost.headers(cpu, time.perf_counter() - started))
+    if figure:
+        result = await run_in_pool(
+            _with_figure, key, result, partial(figures.ensemble_figure, title="Ансамбль K-means")
+        )
+    return result
+
+def _compute_metrics_comparison() -> dict:
     # Создаем различные сценарии
     scenarios = []
 
@@ -347,10 +1236,19 @@ async def metrics_comparison_simulator(
         # Обучаем простую модель
         model = LogisticRegression(random_state=42 + i)
 
+        # Стратифицированное разбиение: в test несбалансированного датасета
+        # доля редкого класса та же, что и во всем датасете
+        train_balanced, test_balanced = train_test_indices(
+            y_balanced, make_key("metrics-comparison", "balanced", i), 42 + i, test_size=0.25
+        )
+        train_imbalanced, test_imbalanced = train_test_indices(
+            y_imbalanced, make_key("metrics-comparison", "imbalanced", i), 42 + i, test_size=0.25
+        )
+
         # Оцениваем на сбалансированных данных
-        model.fit(X_balanced[:150], y_balanced[:150])
-        y_pred_balanced = model.predict(X_balanced[150:])
-        y_true_balanced = y_balanced[150:]
+        model.fit(X_balanced[train_balanced], y_balanced[train_balanced])
+        y_pred_balanced = model.predict(X_balanced[test_balanced])
+        y_true_balanced = y_balanced[test_balanced]
 
         acc_balanced = accuracy_score(y_true_balanced, y_pred_balanced)
         prec_balanced = precision_score(y_true_balanced, y_pred_balanced, zero_division=0)
@@ -358,9 +1256,9 @@ async def metrics_comparison_simulator(
         f1_balanced = f1_score(y_true_balanced, y_pred_balanced, zero_division=0)
 
         # Оцениваем на несбалансированных данных
-        model.fit(X_imbalanced[:150], y_imbalanced[:150])
-        y_pred_imbalanced = model.predict(X_imbalanced[150:])
-        y_true_imbalanced = y_imbalanced[150:]
+        model.fit(X_imbalanced[train_imbalanced], y_imbalanced[train_imbalanced])
+        y_pred_imbalanced = model.predict(X_imbalanced[test_imbalanced])
+        y_true_imbalanced = y_imbalanced[test_imbalanced]
 
         acc_imbalanced = accuracy_score(y_true_imbalanced, y_pred_imbalanced)
         prec_imbalanced = precision_score(y_true_imbalanced, y_pred_imbalanced, zero_division=0)
@@ -384,3 +1282,1053 @@ async def metrics_comparison_simulator(
         })
 
     return {"scenarios": scenarios}
+
+@router.get("/metrics-comparison")
+async def metrics_comparison_simulator(
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Сравнение метрик качества на разных датасетах
+    """
+    result = await run_in_pool(_compute_metrics_comparison)
+    if figure:
+        # Сиды сценариев фиксированы - результат всегда один и тот же
+        result = await run_in_pool(
+            _with_figure, make_key("metrics-comparison"), result,
+            figures.metrics_comparison_figure, by_params=True
+        )
+    return result
+
+# Сетка сценариев дисбаланса для урока о метриках
+
+MAX_SWEEP_SCENARIOS = 100
+MAX_SWEEP_SAMPLES = 100_000
+MAX_SWEEP_SEEDS = 20
+MIN_SWEEP_SAMPLES = 20
+
+# Сценарии сеток - в своем кэше: одна сетка занимает до MAX_SWEEP_SCENARIOS мест
+# и не должна вытеснять результаты интерактивных симуляторов из result_cache
+scenario_cache = LRUCache(maxsize=4 * MAX_SWEEP_SCENARIOS)
+
+def _check_imbalance_sweep(params: ImbalanceSweepParams):
+    if not params.minority_fractions or not params.sample_sizes:
+        raise HTTPException(status_code=400, detail="Provide at least one minority fraction and sample size")
+    if len(params.minority_fractions) * len(params.sample_sizes) > MAX_SWEEP_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SWEEP_SCENARIOS} scenarios per sweep")
+    if any(not 0 < fraction <= 0.5 for fraction in params.minority_fractions):
+        raise HTTPException(status_code=400, detail="Minority fractions must be in (0, 0.5]")
+    if any(not MIN_SWEEP_SAMPLES <= n <= MAX_SWEEP_SAMPLES for n in params.sample_sizes):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Sample sizes must be between {MIN_SWEEP_SAMPLES} and {MAX_SWEEP_SAMPLES}"
+        )
+    if not 1 <= params.n_seeds <= MAX_SWEEP_SEEDS:
+        raise HTTPException(status_code=400, detail=f"n_seeds must be between 1 and {MAX_SWEEP_SEEDS}")
+    if not 0 < params.test_size < 1 or not 0 <= params.noise < 1:
+        raise HTTPException(status_code=400, detail="test_size must be in (0, 1) and noise in [0, 1)")
+
+def _scenario_key(params: ImbalanceSweepParams, fraction: float, n_samples: int) -> str:
+    # Сценарий кэшируется отдельно: пересекающиеся сетки переиспользуют общие ячейки
+    return make_key(
+        "imbalance-scenario", fraction, n_samples, params.n_seeds, params.noise,
+        params.test_size, params.random_state
+    )
+
+def _imbalance_scenario(params: ImbalanceSweepParams, fraction: float, n_samples: int) -> dict:
+    """
+    Метрики логистической регрессии на датасете с долей fraction класса 1
+
+    precision, recall и F1 считаются по редкому классу, baseline_accuracy -
+    точность модели, которая всегда отвечает мажоритарным классом.
+    """
+    runs = []
+    for seed in range(params.random_state, params.random_state + params.n_seeds):
+        checkpoint()
+        X, y = make_classification(
+            n_samples=n_samples, n_features=2, n_classes=2,
+            n_informative=2, n_redundant=0, n_clusters_per_class=1,
+            weights=[1 - fraction, fraction], flip_y=params.noise, random_state=seed
+        )
+        # Ячеек сетки больше, чем мест в кэше разбиений - считаем без него
+        train_idx, test_idx = train_test_indices(
+            y, make_key("imbalance-sweep", fraction, n_samples, params.noise, seed), seed,
+            test_size=params.test_size, cached=False
+        )
+        y_test = y[test_idx]
+        if len(np.unique(y[train_idx])) < 2:
+            # В train нет редкого класса - модель может отвечать только мажоритарным
+            y_pred = np.zeros_like(y_test)
+        else:
+            model = LogisticRegression(random_state=seed)
+            model.fit(X[train_idx], y[train_idx])
+            y_pred = model.predict(X[test_idx])
+        runs.append([
+            accuracy_score(y_test, y_pred),
+            precision_score(y_test, y_pred, zero_division=0),
+            recall_score(y_test, y_pred, zero_division=0),
+            f1_score(y_test, y_pred, zero_division=0),
+            1 - y_test.mean(),
+            y_test.sum()
+        ])
+    accuracy, precision, recall, f1, baseline, minority_test = np.mean(runs, axis=0)
+    return {
+        "minority_fraction": fraction,
+        "n_samples": n_samples,
+        "metrics": {
+            "accuracy": float(accuracy),
+            "precision": float(precision),
+            "recall": float(recall),
+            "f1": float(f1),
+            "baseline_accuracy": float(baseline)
+        },
+        # Среднее по сидам число объектов редкого класса в test
+        "minority_test_samples": float(minority_test)
+    }
+
+def _estimate_imbalance_sweep(params: ImbalanceSweepParams, scenarios: list) -> CostEstimate:
+    """Стоимость еще не посчитанных сценариев как ансамблей по n_seeds прогонов"""
+    estimate = CostEstimate()
+    for _, _, n_samples in scenarios:
+        single = ClassificationParams(n_samples=n_samples, n_features=2)
+        estimate = estimate + estimate_classification(single, "logistic", repeats=params.n_seeds)[1]
+    return estimate
+
+@router.post("/metrics-comparison/sweep")
+async def metrics_comparison_sweep(
+    params: ImbalanceSweepParams,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Метрики качества на сетке (доля редкого класса x размер датасета)
+
+    Все сценарии сетки ставятся в пул воркеров сразу, и по SSE каждый
+    приходит событием scenario, как только посчитан (порядок - по
+    готовности, row и column указывают ячейку сетки). Сценарии кэшируются,
+    поэтому повторный запрос той же сетки отдается без вычислений.
+    """
+    _check_imbalance_sweep(params)
+    fractions = sorted(set(params.minority_fractions), reverse=True)
+    sizes = sorted(set(params.sample_sizes))
+    grid = [
+        (row, column, _scenario_key(params, fraction, n_samples), fraction, n_samples)
+        for row, fraction in enumerate(fractions)
+        for column, n_samples in enumerate(sizes)
+    ]
+    cached = {key: scenario_cache.get(key) for _, _, key, _, _ in grid}
+    missing = [(key, fraction, n_samples) for _, _, key, fraction, n_samples in grid if cached[key] is None]
+    cost = _estimate_imbalance_sweep(params, missing)
+    admit(cost)
+
+    async def compute(key, fraction, n_samples):
+        scenario = await run_in_pool(_imbalance_scenario, params, fraction, n_samples)
+        scenario_cache.set(key, scenario)
+        return key, scenario
+
+    async def events():
+        yield _sse_event("start", {
+            "minority_fractions": fractions,
+            "sample_sizes": sizes,
+            "n_scenarios": len(grid),
+            "cached_scenarios": len(grid) - len(missing)
+        })
+        cells = {key: (row, column) for row, column, key, _, _ in grid}
+        for key, scenario in cached.items():
+            if scenario is not None:
+                row, column = cells[key]
+                yield _sse_event("scenario", {"row": row, "column": column, "cached": True, **scenario})
+
+        tasks = [asyncio.ensure_future(compute(*scenario)) for scenario in missing]
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=1.0, return_when=asyncio.FIRST_COMPLETED)
+                if await request.is_disconnected():
+                    return
+                for task in done:
+                    key, scenario = task.result()
+                    row, column = cells[key]
+                    yield _sse_event("scenario", {"row": row, "column": column, "cached": False, **scenario})
+            yield _sse_event("done", {"n_scenarios": len(grid)})
+        finally:
+            # Клиент ушел - сценарии, еще ждущие в очереди пула, не запустятся
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=cost.headers())
+
+# Кросс-валидация
+
+CLASSIFICATION_MODELS = ("logistic", "knn")
+REGRESSION_MODELS = ("linear_regression",)
+
+def _make_estimator(model_type: str, random_state: int, k: int = 5):
+    """Создает новую (необученную) модель заданного типа"""
+    if model_type == "logistic":
+        return LogisticRegression(random_state=random_state, solver='liblinear', max_iter=1000)
+    if model_type == "knn":
+        return KNeighborsClassifier(n_neighbors=k)
+    return LinearRegression()
+
+def _evaluate_fold(model_type: str, random_state: int, k: int, X, y, train_idx, test_idx) -> dict:
+    """Обучает модель на одном фолде и считает метрики на отложенной части"""
+    model = _make_estimator(model_type, random_state, k)
+
+    start = time.perf_counter()
+    model.fit(X[train_idx], y[train_idx])
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X[test_idx])
+    y_true = y[test_idx]
+    if model_type in REGRESSION_MODELS:
+        metrics = {
+            "mse": float(mean_squared_error(y_true, y_pred)),
+            "r2": float(r2_score(y_true, y_pred))
+        }
+    else:
+        metrics = {
+            "accuracy": float(accuracy_score(y_true, y_pred)),
+            "precision": float(precision_score(y_true, y_pred, average='weighted', zero_division=0)),
+            "recall": float(recall_score(y_true, y_pred, average='weighted', zero_division=0)),
+            "f1": float(f1_score(y_true, y_pred, average='weighted', zero_division=0))
+        }
+    score_time = time.perf_counter() - start
+
+    return {"metrics": metrics, "fit_time": fit_time, "score_time": score_time}
+
+def _check_cross_validation(params: CrossValidationParams):
+    if params.model_type not in CLASSIFICATION_MODELS + REGRESSION_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model type: {params.model_type}")
+    if not 2 <= params.n_splits <= 20:
+        raise HTTPException(status_code=400, detail="n_splits must be between 2 and 20")
+
+def _cross_validation_data(params: CrossValidationParams, db: Session, user: User):
+    """(параметры данных, сохраненный датасет или None) для кросс-валидации"""
+    if params.model_type in REGRESSION_MODELS:
+        return params.regression or LinearRegressionParams(slope=1.0, intercept=0.0), None
+    data_params = params.classification or ClassificationParams()
+    return data_params, _dataset_for(db, user, data_params)
+
+async def _cross_validation(params: CrossValidationParams, data_params, data=None,
+                            on_progress=None) -> CrossValidationResponse:
+    """
+    Кросс-валидация: фолды оцениваются параллельно в пуле воркеров
+
+    data_params и data - из _cross_validation_data. on_progress(доля)
+    вызывается после каждого завершенного фолда.
+    """
+    started = time.perf_counter()
+
+    # Генерируем данные
+    if params.model_type in REGRESSION_MODELS:
+        x, y = await run_in_pool(linear_regression_data, data_params)
+        X = x.reshape(-1, 1)
+        # Для регрессии стратификация по непрерывной цели невозможна
+        stratified = False
+    else:
+        X, y = data if data is not None else await run_in_pool(classification_data, data_params)
+        X = await run_in_pool(_preprocess, data_params, X)
+        stratified = params.stratified
+
+    # Разбиение берем из кэша, если этот датасет уже делили так же
+    try:
+        splits, splits_cached = await run_in_pool(
+            kfold_indices, y, _dataset_key(data_params), params.n_splits, stratified,
+            params.shuffle, data_params.random_state
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Оцениваем фолды параллельно в пуле воркеров
+    done = 0
+
+    async def evaluate(train_idx, test_idx):
+        nonlocal done
+        result = await run_in_pool(
+            _evaluate_fold, params.model_type, data_params.random_state, params.k,
+            X, y, train_idx, test_idx
+        )
+        done += 1
+        if on_progress is not None:
+            on_progress(done / len(splits))
+        return result
+
+    fold_results = await asyncio.gather(*[
+        evaluate(train_idx, test_idx) for train_idx, test_idx in splits
+    ])
+
+    folds = [
+        FoldResult(
+            fold=i + 1,
+            train_size=len(train_idx),
+            test_size=len(test_idx),
+            metrics=result["metrics"],
+            fit_time=result["fit_time"],
+            score_time=result["score_time"]
+        )
+        for i, ((train_idx, test_idx), result) in enumerate(zip(splits, fold_results))
+    ]
+
+    metric_names = folds[0].metrics.keys()
+    mean_metrics = {m: float(np.mean([f.metrics[m] for f in folds])) for m in metric_names}
+    std_metrics = {m: float(np.std([f.metrics[m] for f in folds])) for m in metric_names}
+
+    return CrossValidationResponse(
+        model_type=params.model_type,
+        n_splits=params.n_splits,
+        stratified=stratified,
+        folds=folds,
+        mean_metrics=mean_metrics,
+        std_metrics=std_metrics,
+        splits_cached=splits_cached,
+        total_time=time.perf_counter() - started
+    )
+
+@router.post("/cross-validation", response_model=CrossValidationResponse)
+async def cross_validation_simulator(
+    params: CrossValidationParams,
+    response: Response,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Симулятор кросс-валидации
+
+    Разбивает датасет на k фолдов (обычных или стратифицированных),
+    обучает модель на каждом фолде параллельно и возвращает метрики
+    по фолдам и агрегированные метрики.
+    """
+    _check_cross_validation(params)
+    data_params, data = _cross_validation_data(params, db, current_user)
+    cost = estimate_cross_validation(params, data_params, data)
+    admit(cost)
+    result = await _cross_validation(params, data_params, data)
+    response.headers.update(cost.headers(wall_seconds=result.total_time))
+    if figure:
+        # На фигуре только метрики фолдов (без времени обучения) - они заданы параметрами
+        result = await run_in_pool(
+            _with_figure, make_key("cross-validation", params), result,
+            figures.cross_validation_figure, by_params=True
+        )
+    return result
+
+# Кривая переобучения по степени полинома
+
+MAX_POLYNOMIAL_DEGREE = 20
+
+def _compute_polynomial_curve(params: PolynomialCurveParams) -> PolynomialCurveResponse:
+    """
+    Ошибки на train/test для степеней полинома 1..D за одно QR-разложение
+
+    Матрица Вандермонда расширяется по одному столбцу, новый столбец
+    ортогонализуется к уже построенным (Грам-Шмидт с повторной
+    ортогонализацией). Предсказания на train для степени d - накопленная
+    сумма проекций y на первые d+1 столбцов Q, а коэффициенты получаются
+    обратной подстановкой по верхнему левому блоку R.
+    """
+    x, y = linear_regression_data(params.data)
+
+    # Разбиваем на train/test тем же генератором
+    rng = np.random.default_rng(params.data.random_state)
+    order = rng.permutation(len(x))
+    n_test = max(1, int(round(len(x) * params.test_size)))
+    test_idx, train_idx = np.sort(order[:n_test]), np.sort(order[n_test:])
+    x_train, y_train = x[train_idx], y[train_idx]
+    x_test, y_test = x[test_idx], y[test_idx]
+
+    # Переводим x в [-1, 1], иначе степени x быстро теряют точность
+    center = (x.max() + x.min()) / 2
+    scale = (x.max() - x.min()) / 2 or 1.0
+    t_train = (x_train - center) / scale
+    t_test = (x_test - center) / scale
+    curve_x = np.linspace(x.min(), x.max(), params.n_curve_points)
+    t_curve = (curve_x - center) / scale
+
+    n_cols = params.max_degree + 1
+    Q = np.empty((len(t_train), n_cols))
+    R = np.zeros((n_cols, n_cols))
+    qty = np.empty(n_cols)
+
+    degrees = []
+    for j in range(n_cols):
+        # Добавляем столбец t^j и ортогонализуем его к предыдущим
+        v = t_train ** j
+        for _ in range(2):
+            coeffs = Q[:, :j].T @ v
+            v = v - Q[:, :j] @ coeffs
+            R[:j, j] += coeffs
+        R[j, j] = np.linalg.norm(v)
+        Q[:, j] = v / R[j, j]
+        qty[j] = Q[:, j] @ y_train
+
+        if j == 0:
+            continue
+        checkpoint()
+
+        # Коэффициенты полинома степени j
+        beta = solve_triangular(R[:j + 1, :j + 1], qty[:j + 1])
+        train_pred = Q[:, :j + 1] @ qty[:j + 1]
+        test_pred = np.vander(t_test, j + 1, increasing=True) @ beta
+        curve_y = np.vander(t_curve, j + 1, increasing=True) @ beta
+
+        degrees.append(PolynomialDegreeResult(
+            degree=j,
+            train_mse=float(np.mean((y_train - train_pred) ** 2)),
+            test_mse=float(np.mean((y_test - test_pred) ** 2)),
+            curve_y=curve_y.tolist()
+        ))
+
+    best_degree = min(degrees, key=lambda d: d.test_mse).degree
+
+    return PolynomialCurveResponse(
+        x_train=x_train.tolist(),
+        y_train=y_train.tolist(),
+        x_test=x_test.tolist(),
+        y_test=y_test.tolist(),
+        curve_x=curve_x.tolist(),
+        degrees=degrees,
+        best_degree=best_degree
+    )
+
+def _check_polynomial_curve(params: PolynomialCurveParams):
+    if not 1 <= params.max_degree <= MAX_POLYNOMIAL_DEGREE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"max_degree must be between 1 and {MAX_POLYNOMIAL_DEGREE}"
+        )
+    if not 0 < params.test_size < 1:
+        raise HTTPException(status_code=400, detail="test_size must be between 0 and 1")
+    n_train = params.data.n_points - max(1, int(round(params.data.n_points * params.test_size)))
+    if n_train <= params.max_degree:
+        raise HTTPException(status_code=400, detail="Not enough training points for max_degree")
+
+@router.post("/polynomial-degree-curve", response_model=PolynomialCurveResponse, dependencies=[Depends(_interactive)])
+async def polynomial_degree_curve(
+    params: PolynomialCurveParams,
+    request: Request,
+    response: Response,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Кривая недообучения/переобучения по степени полинома
+
+    Для данных симулятора линейной регрессии возвращает ошибки на train
+    и test и аппроксимирующие кривые для всех степеней от 1 до max_degree.
+    """
+    _check_polynomial_curve(params)
+    cost = estimate_polynomial_curve(params)
+    admit(cost)
+    key = make_key("polynomial-curve", params)
+    result, cpu, wall = await latest_wins.run(
+        (current_user.id, "polynomial-degree-curve"), request,
+        run_measured, result_cache.get_or_compute, key, lambda: _compute_polynomial_curve(params)
+    )
+    response.headers.update(cost.headers(cpu, wall))
+    if figure:
+        result = await run_in_pool(_with_figure, key, result, figures.polynomial_curve_figure)
+    return result
+
+# Обучение градиентным спуском (поток событий SSE)
+
+MAX_EPOCHS = 5000
+MAX_LEARNING_RATES = 20
+
+class _GradientDescentTrainer:
+    """
+    Градиентный спуск сразу для набора learning rate
+
+    Веса хранятся матрицей (признаки x learning rates), поэтому шаг для всех
+    learning rate - одно матричное умножение на эпоху (или мини-батч).
+    Все learning rate видят одинаковый порядок мини-батчей.
+    """
+
+    def __init__(self, X, y, learning_rates, logistic: bool, batch_size, random_state: int):
+        # Добавляем столбец единиц для свободного члена
+        self.X = np.column_stack([np.ones(len(X)), X])
+        self.y = y.astype(float)
+        self.lrs = np.asarray(learning_rates, dtype=float)
+        self.logistic = logistic
+        self.batch_size = batch_size or len(X)
+        self.rng = np.random.default_rng(random_state)
+        self.W = np.zeros((self.X.shape[1], len(self.lrs)))
+        self.epoch = 0
+
+    def _predict(self, X):
+        z = X @ self.W
+        if self.logistic:
+            return 1.0 / (1.0 + np.exp(-np.clip(z, -500, 500)))
+        return z
+
+    def loss(self):
+        pred = self._predict(self.X)
+        y = self.y[:, None]
+        if self.logistic:
+            pred = np.clip(pred, 1e-12, 1 - 1e-12)
+            return -np.mean(y * np.log(pred) + (1 - y) * np.log(1 - pred), axis=0)
+        return np.mean((pred - y) ** 2, axis=0)
+
+    def run_epochs(self, n_epochs: int):
+        """Выполняет n_epochs эпох, возвращает значения loss после каждой"""
+        losses = []
+        with np.errstate(over='ignore', invalid='ignore'):
+            for _ in range(n_epochs):
+                order = self.rng.permutation(len(self.X))
+                for start in range(0, len(order), self.batch_size):
+                    idx = order[start:start + self.batch_size]
+                    Xb = self.X[idx]
+                    residual = self._predict(Xb) - self.y[idx, None]
+                    # Градиент MSE содержит множитель 2, у log-loss его нет
+                    factor = 1.0 if self.logistic else 2.0
+                    grad = factor * Xb.T @ residual / len(idx)
+                    self.W -= grad * self.lrs[None, :]
+                self.epoch += 1
+                losses.append(self.loss())
+        return losses
+
+def _finite_or_none(values):
+    """NaN/inf (разошедшийся спуск) нельзя положить в JSON - заменяем на None"""
+    return [float(v) if np.isfinite(v) else None for v in np.ravel(values)]
+
+def _finite_float_or_none(value):
+    return float(value) if value is not None and np.isfinite(value) else None
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/gradient-descent/stream")
+async def gradient_descent_stream(
+    params: GradientDescentParams,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Потоковое обучение градиентным спуском
+
+    Обучает линейную или логистическую регрессию сразу для нескольких
+    learning rate и отправляет по SSE значения loss по эпохам и снимки
+    параметров каждые snapshot_stride эпох. Поток занимает воркеры надолго,
+    поэтому идет в полосу low, как и /linear-regression/stream.
+    """
+    if params.model_type not in ("linear_regression", "logistic"):
+        raise HTTPException(status_code=400, detail=f"Unknown model type: {params.model_type}")
+    if not params.learning_rates or len(params.learning_rates) > MAX_LEARNING_RATES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Provide between 1 and {MAX_LEARNING_RATES} learning rates"
+        )
+    if any(lr <= 0 for lr in params.learning_rates):
+        raise HTTPException(status_code=400, detail="Learning rates must be positive")
+    if not 1 <= params.n_epochs <= MAX_EPOCHS:
+        raise HTTPException(status_code=400, detail=f"n_epochs must be between 1 and {MAX_EPOCHS}")
+    if params.snapshot_stride < 1 or (params.batch_size is not None and params.batch_size < 1):
+        raise HTTPException(status_code=400, detail="snapshot_stride and batch_size must be positive")
+
+    logistic = params.model_type == "logistic"
+    if logistic:
+        data_params = params.classification or ClassificationParams()
+        data = _dataset_for(db, current_user, data_params)
+    else:
+        data_params = params.regression or LinearRegressionParams(slope=1.0, intercept=0.0)
+        data = None
+    # Стоимость всего потока: эпохи x learning rates x точки
+    cost = estimate_gradient_descent(params, data_params, data)
+    admit(cost)
+
+    if logistic:
+        X, y = data if data is not None else await run_in_pool(classification_data, data_params)
+        X = await run_in_pool(_preprocess, data_params, X)
+        if len(np.unique(y)) != 2:
+            raise HTTPException(status_code=400, detail="Logistic gradient descent supports 2 classes")
+    else:
+        x, y = await run_in_pool(linear_regression_data, data_params)
+        X = x.reshape(-1, 1)
+
+    trainer = _GradientDescentTrainer(
+        X, y, params.learning_rates, logistic, params.batch_size, data_params.random_state
+    )
+
+    async def events():
+        yield _sse_event("start", {
+            "model_type": params.model_type,
+            "learning_rates": params.learning_rates,
+            "n_epochs": params.n_epochs,
+            "loss": _finite_or_none(trainer.loss())
+        })
+        while trainer.epoch < params.n_epochs:
+            if await request.is_disconnected():
+                return
+            first_epoch = trainer.epoch + 1
+            n_epochs = min(params.snapshot_stride, params.n_epochs - trainer.epoch)
+            losses = await run_in_pool(trainer.run_epochs, n_epochs)
+            yield _sse_event("epoch", {
+                "epochs": list(range(first_epoch, trainer.epoch + 1)),
+                "loss": [_finite_or_none(loss) for loss in losses],
+                # Веса: [свободный член, коэффициенты...] для каждого learning rate
+                "weights": [_finite_or_none(w) for w in trainer.W.T]
+            })
+        yield _sse_event("done", {"epochs": trainer.epoch})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=cost.headers())
+
+# Потоковая регрессия: данные чанками, модель дообучается, память не растет с n_points
+
+MAX_STREAM_POINTS = 50_000_000
+MAX_STREAM_CHUNK = 1_000_000
+MAX_STREAM_SAMPLE_POINTS = 1000
+# x потока равномерен на [0, STREAM_X_RANGE]; модели учатся на z = x / 5 - 1 из [-1, 1]
+STREAM_X_RANGE = 10.0
+
+class _StreamingRegressionTrainer:
+    """
+    Онлайн линейная регрессия на потоке чанков
+
+    Каждый чанк сначала используется для оценки (prequential: ошибка на
+    еще не виденных точках), затем для обновления модели. SGD -
+    SGDRegressor.partial_fit, RLS - блочный рекурсивный МНК: копятся
+    X^T X и X^T y размера 2x2, так что память не зависит от n_points.
+    """
+
+    def __init__(self, params: StreamingRegressionParams):
+        self.params = params
+        self.rng = np.random.default_rng(params.random_state)
+        # Веса [свободный член, наклон] для признака z
+        self.w = np.zeros(2)
+        if params.method == "sgd":
+            self.model = SGDRegressor(
+                penalty=None, learning_rate="constant", eta0=params.learning_rate,
+                random_state=params.random_state
+            )
+        else:
+            # Маленькая регуляризация, чтобы система решалась и на первом чанке
+            self.A = 1e-6 * np.eye(2)
+            self.b = np.zeros(2)
+        self.seen = 0
+        self.chunks = 0
+        self.sse = 0.0
+        # Среднее и сумма квадратов отклонений y (формула Чана для объединения чанков)
+        self.y_mean = 0.0
+        self.y_m2 = 0.0
+        self.sample = ([], [])
+
+    def _scale(self, x):
+        half = STREAM_X_RANGE / 2
+        return (x - half) / half
+
+    def coefficients(self):
+        """(свободный член, наклон) в исходной шкале x"""
+        half = STREAM_X_RANGE / 2
+        slope = self.w[1] / half
+        return float(self.w[0] - self.w[1]), float(slope)
+
+    def _update(self, z, y):
+        if self.params.method == "sgd":
+            self.model.partial_fit(z[:, None], y)
+            self.w = np.array([self.model.intercept_[0], self.model.coef_[0]])
+        else:
+            Z = np.column_stack([np.ones(len(z)), z])
+            lam = self.params.forgetting_factor
+            self.A = lam * self.A + Z.T @ Z
+            self.b = lam * self.b + Z.T @ y
+            self.w = np.linalg.solve(self.A, self.b)
+
+    def run_chunks(self, n_chunks: int) -> float:
+        """Обрабатывает до n_chunks чанков, возвращает MSE на них (до обновления модели)"""
+        p = self.params
+        window_sse, window_n = 0.0, 0
+        for _ in range(n_chunks):
+            size = min(p.chunk_size, p.n_points - self.seen)
+            if size <= 0:
+                break
+            checkpoint()
+            x = self.rng.uniform(0, STREAM_X_RANGE, size)
+            y = p.slope * x + p.intercept + p.noise_level * self.rng.standard_normal(size)
+            z = self._scale(x)
+
+            err = y - (self.w[0] + self.w[1] * z)
+            chunk_sse = float(err @ err)
+            window_sse += chunk_sse
+            window_n += size
+            self.sse += chunk_sse
+
+            chunk_mean = float(y.mean())
+            chunk_m2 = float(((y - chunk_mean) ** 2).sum())
+            total = self.seen + size
+            delta = chunk_mean - self.y_mean
+            self.y_m2 += chunk_m2 + delta ** 2 * self.seen * size / total
+            self.y_mean += delta * size / total
+
+            self._update(z, y)
+            self.seen = total
+            self.chunks += 1
+
+            shown = min(p.sample_points, size)
+            idx = self.rng.choice(size, size=shown, replace=False) if shown < size else np.arange(size)
+            self.sample = (x[idx].tolist(), y[idx].tolist())
+        return window_sse / window_n if window_n else None
+
+    def state(self, window_mse) -> dict:
+        intercept, slope = self.coefficients()
+        metrics = {
+            "intercept": intercept,
+            "slope": slope,
+            "window_mse": window_mse,
+            "prequential_mse": self.sse / self.seen if self.seen else None,
+            "prequential_r2": 1 - self.sse / self.y_m2 if self.y_m2 > 0 else None
+        }
+        return {
+            "points_seen": self.seen,
+            "chunks": self.chunks,
+            # Разошедшийся SGD дает inf/NaN - в JSON они идут как None
+            **{name: _finite_float_or_none(value) for name, value in metrics.items()},
+            "sample": {"x": self.sample[0], "y": self.sample[1]}
+        }
+
+def _check_streaming_regression(params: StreamingRegressionParams):
+    if params.method not in ("sgd", "rls"):
+        raise HTTPException(status_code=400, detail=f"Unknown method: {params.method}")
+    if not 1 <= params.n_points <= MAX_STREAM_POINTS:
+        raise HTTPException(status_code=400, detail=f"n_points must be between 1 and {MAX_STREAM_POINTS}")
+    if not 1 <= params.chunk_size <= MAX_STREAM_CHUNK:
+        raise HTTPException(status_code=400, detail=f"chunk_size must be between 1 and {MAX_STREAM_CHUNK}")
+    if not 0 <= params.sample_points <= MAX_STREAM_SAMPLE_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"sample_points must be between 0 and {MAX_STREAM_SAMPLE_POINTS}"
+        )
+    if params.report_every < 1 or params.learning_rate <= 0:
+        raise HTTPException(status_code=400, detail="report_every and learning_rate must be positive")
+    if not 0 < params.forgetting_factor <= 1:
+        raise HTTPException(status_code=400, detail="forgetting_factor must be in (0, 1]")
+
+@router.post("/linear-regression/stream")
+async def linear_regression_stream(
+    params: StreamingRegressionParams,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Потоковая линейная регрессия на миллионах точек
+
+    Данные генерируются чанками по chunk_size точек, модель (SGD или RLS)
+    дообучается на каждом. Каждые report_every чанков по SSE приходит
+    событие state: текущие коэффициенты, MSE на последних чанках,
+    накопленные prequential MSE и R^2 и выборка точек последнего чанка.
+    """
+    _check_streaming_regression(params)
+    # Память постоянна, но CPU растет с n_points - оцениваем весь поток
+    cost = estimate_streaming_regression(params)
+    admit(cost)
+    trainer = _StreamingRegressionTrainer(params)
+
+    async def events():
+        yield _sse_event("start", {
+            "method": params.method,
+            "n_points": params.n_points,
+            "chunk_size": params.chunk_size
+        })
+        while trainer.seen < params.n_points:
+            if await request.is_disconnected():
+                return
+            window_mse = await run_in_pool(trainer.run_chunks, params.report_every)
+            yield _sse_event("state", trainer.state(window_mse))
+        state = trainer.state(None)
+        yield _sse_event("done", {
+            name: state[name] for name in ("points_seen", "intercept", "slope", "prequential_mse", "prequential_r2")
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=cost.headers())
+
+# Предсказания по уже обученной модели
+
+MAX_PREDICT_POINTS = 10000
+
+@router.post("/predict", response_model=PredictResponse, dependencies=[Depends(_interactive)])
+async def predict(
+    request: PredictRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Классифицировать точки обученной моделью из кэша
+
+    model_id возвращают симуляторы логистической регрессии, kNN и K-means.
+    Модель не переобучается, поэтому ответ приходит сразу (например,
+    для клика по графику).
+    """
+    entry = model_cache.get(request.model_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Model not found or expired, rerun the simulator")
+    if not request.points or len(request.points) > MAX_PREDICT_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Provide between 1 and {MAX_PREDICT_POINTS} points"
+        )
+
+    model = entry["model"]
+    points = np.asarray(request.points, dtype=float)
+    # Точки с графика PCA проекции переводим обратно в пространство признаков
+    projection = entry.get("projection")
+    if projection is not None and points.ndim == 2 and points.shape[1] == 2:
+        points = projection.inverse_transform(points)
+    if points.ndim != 2 or points.shape[1] != model.n_features_in_:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Each point must have {model.n_features_in_} features"
+        )
+
+    def _predict():
+        labels = model.predict(points)
+        probabilities = model.predict_proba(points) if hasattr(model, "predict_proba") else None
+        return labels, probabilities
+
+    # Через пул, как и остальные симуляторы: так стоимость попадает в учет пользователя
+    labels, probabilities = await run_in_pool(_predict)
+
+    return PredictResponse(
+        model_type=entry["model_type"],
+        labels=labels.tolist(),
+        probabilities=probabilities.tolist() if probabilities is not None else None
+    )
+
+# Предпросмотр предобработки признаков
+
+@router.post("/preprocessing/preview", response_model=PreprocessingPreviewResponse, dependencies=[Depends(_interactive)])
+async def preprocessing_preview(
+    request: PreprocessingPreviewRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Показать результат предобработки для датасета
+
+    Возвращает имена получившихся признаков, статистики каждого шага
+    и первые строки преобразованных данных. Ту же предобработку можно
+    передать в поле preprocessing параметров любого симулятора.
+    """
+    params = request.data
+    if params.preprocessing is None:
+        raise HTTPException(status_code=400, detail="preprocessing is required")
+
+    data = _dataset_for(db, current_user, params, need_labels=False)
+    admit(estimate_preprocessing(params, data))
+    X = data[0] if data is not None else (await run_in_pool(classification_data, params))[0]
+
+    pipeline = PreprocessingPipeline(params.preprocessing, _dataset_key(params))
+    try:
+        X_out, names = await run_in_pool(pipeline.transform, X)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    n_rows = max(0, min(request.n_rows, len(X_out)))
+    rows = [[float(v) if np.isfinite(v) else None for v in row] for row in X_out[:n_rows]]
+    return PreprocessingPreviewResponse(
+        n_samples=len(X_out),
+        feature_names=names,
+        statistics=pipeline.fitted,
+        rows=rows
+    )
+
+# Кластеризация по плотности (DBSCAN)
+
+NEIGHBOR_RADIUS_HEADROOM = 2.0
+KD_TREE_MAX_FEATURES = 15
+# Размер выборки для оценки числа ребер графа до его построения
+EDGE_ESTIMATE_SAMPLE = 1000
+NEIGHBOR_GRAPH_CACHE_BYTES = int(os.getenv("ML_NEIGHBOR_GRAPH_CACHE_MB", "256")) * 1024 * 1024
+
+def _graph_bytes(graph: dict) -> int:
+    return sum(graph[name].nbytes for name in ("indptr", "indices", "distances"))
+
+# Граф соседей датасета: строится один раз по KD/Ball-дереву и переиспользуется
+# для любых eps не больше радиуса, с которым он построен. Плотный граф растет
+# как n^2, поэтому кэш ограничен и по суммарному размеру
+neighbor_graph_cache = LRUCache(maxsize=16, max_bytes=NEIGHBOR_GRAPH_CACHE_BYTES, sizeof=_graph_bytes)
+
+def _neighbor_graph_key(data_params: ClusteringParams) -> str:
+    return make_key("neighbor-graph", _dataset_key(data_params), data_params.preprocessing)
+
+def _build_neighbor_graph(X, radius: float) -> dict:
+    """Соседи каждой точки в пределах radius, отсортированные по расстоянию (CSR)"""
+    tree_cls = KDTree if X.shape[1] <= KD_TREE_MAX_FEATURES else BallTree
+    tree = tree_cls(X)
+    neighbors, distances = tree.query_radius(X, r=radius, return_distance=True, sort_results=True)
+    lengths = np.fromiter((len(n) for n in neighbors), dtype=np.int64, count=len(neighbors))
+    index_dtype = np.int32 if len(X) < np.iinfo(np.int32).max else np.int64
+    return {
+        "radius": radius,
+        "indptr": np.concatenate([[0], np.cumsum(lengths)]),
+        "indices": np.concatenate(neighbors).astype(index_dtype),
+        "distances": np.concatenate(distances)
+    }
+
+def _estimate_graph_edges(params: DensityClusteringParams, data_params: ClusteringParams, data=None):
+    """
+    Ожидаемое число ребер графа соседей (радиус с запасом, радиус eps)
+
+    Доля пар ближе радиуса оценивается по случайной выборке точек и
+    переносится на все n^2 пар. (0, 0) - подходящий граф уже в кэше.
+    """
+    graph = neighbor_graph_cache.get(_neighbor_graph_key(data_params))
+    if graph is not None and graph["radius"] >= params.eps:
+        return 0, 0
+    X, _ = data if data is not None else clustering_data(data_params)
+    X = _preprocess(data_params, X)
+    n = len(X)
+    m = min(n, EDGE_ESTIMATE_SAMPLE)
+    rng = np.random.default_rng(data_params.random_state)
+    sample = X[rng.choice(n, size=m, replace=False)] if m < n else X
+    distances = pairwise_distances(sample)
+    pairs = max(m * (m - 1), 1)
+    edges = []
+    for radius in (params.eps * NEIGHBOR_RADIUS_HEADROOM, params.eps):
+        # Диагональ (расстояние до себя) не считаем - каждая точка и так сосед сама себе
+        share = (np.count_nonzero(distances <= radius) - m) / pairs
+        edges.append(int(n + share * n * (n - 1)))
+    return tuple(edges)
+
+def _density_labels(graph: dict, eps: float, min_samples: int):
+    """
+    Метки DBSCAN по готовому графу соседей
+
+    Ядровые точки - у которых не меньше min_samples соседей в радиусе eps
+    (включая саму точку); кластеры - компоненты связности ядровых точек;
+    граничные точки получают кластер ближайшего ядрового соседа, остальные - шум (-1).
+    """
+    indptr, indices, distances = graph["indptr"], graph["indices"], graph["distances"]
+    n = len(indptr) - 1
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+
+    within = distances <= eps
+    edge_rows, edge_cols = rows[within], indices[within]
+    core = np.bincount(edge_rows, minlength=n) >= min_samples
+
+    core_edges = core[edge_rows] & core[edge_cols]
+    adjacency = csr_matrix(
+        (np.ones(core_edges.sum()), (edge_rows[core_edges], edge_cols[core_edges])), shape=(n, n)
+    )
+    _, components = connected_components(adjacency, directed=False)
+
+    labels = np.full(n, -1, dtype=np.int64)
+    clusters, labels[core] = np.unique(components[core], return_inverse=True)
+
+    # Ребра внутри строки отсортированы по расстоянию - первое ребро к ядру самое близкое
+    border_edges = ~core[edge_rows] & core[edge_cols]
+    border_rows, border_cols = edge_rows[border_edges], edge_cols[border_edges]
+    first_rows, first_idx = np.unique(border_rows, return_index=True)
+    labels[first_rows] = labels[border_cols[first_idx]]
+
+    return labels, int(core.sum()), len(clusters)
+
+def _compute_density_clustering(params: DensityClusteringParams, data_params: ClusteringParams, data=None,
+                                silhouette_sample: int = None, exact_radius: bool = False):
+    X, _ = data if data is not None else clustering_data(data_params)
+    X = _preprocess(data_params, X)
+    checkpoint()
+
+    # Граф строится с запасом по радиусу, чтобы движение ползунка eps не требовало перестройки
+    # (без запаса, если admission понизил запрос из-за размера графа)
+    key = _neighbor_graph_key(data_params)
+    graph = neighbor_graph_cache.get(key)
+    graph_cached = graph is not None and graph["radius"] >= params.eps
+    if not graph_cached:
+        graph = _build_neighbor_graph(X, params.eps * (1.0 if exact_radius else NEIGHBOR_RADIUS_HEADROOM))
+        neighbor_graph_cache.set(key, graph)
+
+    labels, n_core, n_clusters = _density_labels(graph, params.eps, params.min_samples)
+    checkpoint()
+
+    # Силуэт считаем без шумовых точек и только если кластеров хотя бы два
+    silhouette = None
+    clustered = labels >= 0
+    if n_clusters >= 2 and clustered.sum() > n_clusters:
+        with config_context(working_memory=SILHOUETTE_WORKING_MEMORY_MB):
+            silhouette = float(silhouette_score(
+                X[clustered], labels[clustered],
+                sample_size=silhouette_sample, random_state=data_params.random_state
+            ))
+
+    # Прореживаем точки для графика с сохранением долей кластеров (и шума)
+    sampling = None
+    if data_params.max_display_points is not None and len(labels) > data_params.max_display_points:
+        rng = np.random.default_rng(data_params.random_state)
+        idx, omitted = stratified_indices(labels, data_params.max_display_points, rng)
+        sampling = DisplaySampling(
+            total_points=len(labels),
+            displayed_points=len(idx),
+            omitted_per_class=omitted
+        )
+        X_display, labels_display = X[idx], labels[idx]
+    else:
+        X_display, labels_display = X, labels
+
+    return DensityClusteringResponse(
+        x=np.asarray(X_display).tolist(),
+        labels=labels_display.tolist(),
+        n_clusters=n_clusters,
+        n_noise=int((labels == -1).sum()),
+        n_core=n_core,
+        silhouette_score=silhouette,
+        graph_cached=graph_cached,
+        sampling=sampling
+    )
+
+@router.post("/dbscan-clustering", response_model=DensityClusteringResponse, dependencies=[Depends(_interactive)])
+async def dbscan_clustering_simulator(
+    params: DensityClusteringParams,
+    request: Request,
+    response: Response,
+    figure: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Симулятор кластеризации по плотности (DBSCAN)
+
+    Граф соседей датасета строится один раз по пространственному индексу,
+    поэтому изменение eps и min_samples только пересчитывает метки.
+    """
+    if params.eps <= 0 or params.min_samples < 1:
+        raise HTTPException(status_code=400, detail="eps and min_samples must be positive")
+
+    data_params = params.data or ClusteringParams(dataset_shape="moons")
+    data = _dataset_for(db, current_user, data_params, need_labels=False)
+    # Сначала дешевая проверка по размеру датасета, затем - с оценкой числа ребер графа по выборке
+    admit(estimate_density_clustering(params, data_params, data)[1])
+    edges = await run_in_pool(_estimate_graph_edges, params, data_params, data)
+    data_params, cost = estimate_density_clustering(params, data_params, data, edges)
+    admit(cost)
+    result, cpu, wall = await latest_wins.run(
+        (current_user.id, "dbscan-clustering"), request,
+        run_measured, _compute_density_clustering, params, data_params, data, **cost.options
+    )
+    response.headers.update(cost.headers(cpu, wall))
+    if figure:
+        # Метки и прореживание заданы параметрами запроса (с учетом понижений)
+        result = await run_in_pool(
+            _with_figure, make_key("dbscan", params, data_params), result,
+            partial(figures.clustering_figure, title="Кластеризация DBSCAN"), by_params=True
+        )
+    return result
+
+@router.get("/scheduler/metrics", response_model=SchedulerMetrics)
+async def scheduler_metrics(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Состояние очереди воркеров
+
+    Для каждой полосы (high/low): сколько заданий ждет, у скольких
+    пользователей и сколько выполняется.
+    """
+    return SchedulerMetrics(
+        workers=scheduler.max_workers,
+        high_priority_burst=scheduler.high_burst,
+        lanes=scheduler.stats()
+    )
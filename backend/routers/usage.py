@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+
+from database import get_db
+from models import User, SimulatorUsage
+from schemas import UsageRow, UsageReport, UserUsage
+from routers.auth import get_current_user
+from usage import usage_meter, is_admin, USER_CPU_QUOTA_SECONDS, USER_QUOTA_WINDOW_SECONDS
+
+router = APIRouter()
+
+def _usage_rows(db: Session, since: datetime, user_id: int = None) -> list:
+    """Использование по (пользователь, эндпоинт) с момента since, самые затратные первыми"""
+    cpu = func.sum(SimulatorUsage.cpu_seconds)
+    query = db.query(
+        SimulatorUsage.user_id,
+        User.email,
+        SimulatorUsage.endpoint,
+        func.sum(SimulatorUsage.calls),
+        cpu,
+        func.sum(SimulatorUsage.wall_seconds),
+        func.max(SimulatorUsage.peak_memory_bytes)
+    ).outerjoin(User, User.id == SimulatorUsage.user_id).filter(
+        SimulatorUsage.period_start >= since.replace(second=0, microsecond=0)
+    )
+    if user_id is not None:
+        query = query.filter(SimulatorUsage.user_id == user_id)
+    rows = query.group_by(
+        SimulatorUsage.user_id, User.email, SimulatorUsage.endpoint
+    ).order_by(cpu.desc()).all()
+    return [
+        UsageRow(
+            user_id=user_id, email=email, endpoint=endpoint, calls=calls,
+            cpu_seconds=round(cpu_seconds, 3), wall_seconds=round(wall_seconds, 3),
+            peak_memory_mb=round(peak / 1024 / 1024, 1)
+        )
+        for user_id, email, endpoint, calls, cpu_seconds, wall_seconds, peak in rows
+    ]
+
+@router.get("/report", response_model=UsageReport)
+def usage_report(
+    hours: float = 24,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Отчет об использовании симуляторов по пользователям и эндпоинтам
+
+    Доступен администраторам (ML_ADMIN_EMAILS). Пик памяти - максимум
+    по вызовам; при параллельных заданиях это оценка сверху.
+    """
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if hours <= 0:
+        raise HTTPException(status_code=400, detail="hours must be positive")
+    # Сначала сохраняем еще не сброшенный агрегат, чтобы отчет был полным
+    usage_meter.flush()
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return UsageReport(since=since, rows=_usage_rows(db, since))
+
+@router.get("/me", response_model=UserUsage)
+def my_usage(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Использование симуляторов текущим пользователем за окно квоты"""
+    usage_meter.flush()
+    since = datetime.utcnow() - timedelta(seconds=USER_QUOTA_WINDOW_SECONDS)
+    endpoints = _usage_rows(db, since, current_user.id)
+    return UserUsage(
+        cpu_seconds=round(sum(row.cpu_seconds for row in endpoints), 3),
+        cpu_quota_seconds=USER_CPU_QUOTA_SECONDS if USER_CPU_QUOTA_SECONDS > 0 else None,
+        window_seconds=USER_QUOTA_WINDOW_SECONDS,
+        endpoints=endpoints
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Any, Optional, List, Dict, Literal
 from datetime import datetime
 
 # User schemas
@@ -105,6 +105,7 @@ class LinearRegressionParams(BaseModel):
     intercept: float
     noise_level: float = 0.1
     n_points: int = 50
+    random_state: int = 42
 
 class LinearRegressionResponse(BaseModel):
     x: List[float]
@@ -112,6 +113,19 @@ class LinearRegressionResponse(BaseModel):
     predicted_y: List[float]
     mse: float
     r2: float
+    # Готовая Plotly фигура (если запрошена параметром figure)
+    figure: Optional[Dict[str, Any]] = None
+
+# Preprocessing schemas
+class PreprocessingStep(BaseModel):
+    op: Literal["impute", "standard_scale", "minmax_scale", "one_hot"]
+    columns: Optional[List[int]] = None  # None - все столбцы
+    strategy: Literal["mean", "median", "most_frequent", "constant"] = "mean"  # Для impute
+    fill_value: float = 0.0
+
+class PreprocessingSpec(BaseModel):
+    steps: List[PreprocessingStep] = []
+    columns: Optional[List[int]] = None  # Какие признаки подать в модель (None - все)
 
 # Classification schemas
 class ClassificationParams(BaseModel):
@@ -120,6 +134,30 @@ class ClassificationParams(BaseModel):
     n_classes: int = 2
     noise: float = 0.1
     random_state: int = 42
+    # Сколько точек максимум отдавать для графика (метрики считаются по всем)
+    max_display_points: Optional[int] = None
+    # Сохраненный датасет вместо генерации нового
+    dataset_id: Optional[str] = None
+    # Предобработка признаков перед обучением
+    preprocessing: Optional[PreprocessingSpec] = None
+    # Проекция на плоскость для графика, если признаков больше двух
+    projection: Optional[Literal["pca"]] = None
+    # Стратифицированное разбиение на train/test (доли классов сохраняются)
+    stratify: bool = True
+
+# Информация о прореживании точек для графика
+class DisplaySampling(BaseModel):
+    total_points: int
+    displayed_points: int
+    omitted_per_class: Dict[int, int]
+    omitted_train: int = 0
+    omitted_test: int = 0
+
+class ProjectionInfo(BaseModel):
+    method: str
+    components: List[List[float]]
+    mean: List[float]
+    explained_variance_ratio: List[float]
 
 class ClassificationResponse(BaseModel):
     x: List[List[float]]
@@ -134,19 +172,271 @@ class ClassificationResponse(BaseModel):
     recall: float
     f1: float
     decision_boundary: Optional[List[List[float]]] = None
+    # Отрезки [x1, y1, x2, y2] точной границы (kNN с k=1)
+    boundary_segments: Optional[List[List[float]]] = None
     probabilities: Optional[List[List[float]]] = None
+    sampling: Optional[DisplaySampling] = None
+    model_id: Optional[str] = None
+    projection: Optional[ProjectionInfo] = None
+    # Готовая Plotly фигура (если запрошена параметром figure)
+    figure: Optional[Dict[str, Any]] = None
 
 # Clustering schemas
 class ClusteringParams(BaseModel):
     n_samples: int = 300
     n_features: int = 2
     n_clusters: int = 3
+    # Сколько центров у сгенерированных данных (None - совпадает с n_clusters)
+    n_centers: Optional[int] = None
     cluster_std: float = 1.0
     random_state: int = 42
+    # Начинать K-means с центроидов прошлого запуска на этом датасете
+    warm_start: bool = True
+    # Форма кластеров: blobs (выпуклые), moons и circles (невыпуклые, 2 кластера)
+    dataset_shape: Literal["blobs", "moons", "circles"] = "blobs"
+    max_display_points: Optional[int] = None
+    dataset_id: Optional[str] = None
+    preprocessing: Optional[PreprocessingSpec] = None
 
 class ClusteringResponse(BaseModel):
     x: List[List[float]]
     labels: List[int]
     centroids: List[List[float]]
     silhouette_score: float
-    wcss: float
\ No newline at end of file
+    wcss: float
+    sampling: Optional[DisplaySampling] = None
+    model_id: Optional[str] = None
+    warm_started: bool = False
+    n_iter: Optional[int] = None
+    # Готовая Plotly фигура (если запрошена параметром figure)
+    figure: Optional[Dict[str, Any]] = None
+
+# Ensemble schemas
+class MetricDistribution(BaseModel):
+    mean: float
+    std: float
+    min: float
+    q05: float
+    q25: float
+    median: float
+    q75: float
+    q95: float
+    max: float
+
+class EnsembleResponse(BaseModel):
+    n_seeds: int
+    seeds: List[int]
+    # Распределение каждой метрики по прогонам и значения по сидам (в порядке seeds)
+    metrics: Dict[str, MetricDistribution]
+    values: Dict[str, List[float]]
+    # Готовая Plotly фигура (если запрошена параметром figure)
+    figure: Optional[Dict[str, Any]] = None
+
+# Metrics comparison sweep schemas
+class ImbalanceSweepParams(BaseModel):
+    # Доли редкого класса (класс 1) и размеры датасетов: сетка - все их сочетания
+    minority_fractions: List[float] = [0.5, 0.3, 0.2, 0.1, 0.05]
+    sample_sizes: List[int] = [100, 200, 500, 1000, 5000]
+    n_seeds: int = 3  # Метрики сценария усредняются по сидам
+    noise: float = 0.01  # Доля перепутанных меток
+    test_size: float = 0.25
+    random_state: int = 42
+
+# Cross-validation schemas
+class CrossValidationParams(BaseModel):
+    model_type: str = "logistic"  # logistic, knn, linear_regression
+    n_splits: int = 5
+    stratified: bool = True
+    shuffle: bool = True
+    k: int = 5  # Количество соседей для knn
+    classification: Optional[ClassificationParams] = None
+    regression: Optional[LinearRegressionParams] = None
+
+class FoldResult(BaseModel):
+    fold: int
+    train_size: int
+    test_size: int
+    metrics: Dict[str, float]
+    fit_time: float
+    score_time: float
+
+class CrossValidationResponse(BaseModel):
+    model_type: str
+    n_splits: int
+    stratified: bool
+    folds: List[FoldResult]
+    mean_metrics: Dict[str, float]
+    std_metrics: Dict[str, float]
+    splits_cached: bool
+    total_time: float
+    # Готовая Plotly фигура (если запрошена параметром figure)
+    figure: Optional[Dict[str, Any]] = None
+
+# Polynomial degree curve schemas
+class PolynomialCurveParams(BaseModel):
+    data: LinearRegressionParams
+    max_degree: int = 10
+    test_size: float = 0.3
+    n_curve_points: int = 100
+
+class PolynomialDegreeResult(BaseModel):
+    degree: int
+    train_mse: float
+    test_mse: float
+    curve_y: List[float]
+
+class PolynomialCurveResponse(BaseModel):
+    x_train: List[float]
+    y_train: List[float]
+    x_test: List[float]
+    y_test: List[float]
+    curve_x: List[float]
+    degrees: List[PolynomialDegreeResult]
+    best_degree: int
+    # Готовая Plotly фигура (если запрошена параметром figure)
+    figure: Optional[Dict[str, Any]] = None
+
+# Gradient descent schemas
+class GradientDescentParams(BaseModel):
+    model_type: str = "linear_regression"  # linear_regression, logistic
+    learning_rates: List[float] = [0.001, 0.01, 0.05]
+    n_epochs: int = 100
+    batch_size: Optional[int] = None  # None - полный батч
+    snapshot_stride: int = 1
+    regression: Optional[LinearRegressionParams] = None
+    classification: Optional[ClassificationParams] = None
+
+class StreamingRegressionParams(BaseModel):
+    slope: float = 2.0
+    intercept: float = 1.0
+    noise_level: float = 1.0
+    n_points: int = 1000000
+    chunk_size: int = 10000
+    method: str = "rls"  # rls, sgd
+    learning_rate: float = 0.01  # Шаг SGD
+    forgetting_factor: float = 1.0  # Забывание RLS на чанк (1 - помнить все)
+    report_every: int = 10  # Чанков между событиями
+    sample_points: int = 200  # Точек последнего чанка в событии (для графика)
+    random_state: int = 42
+
+# Dataset schemas
+class DatasetInfo(BaseModel):
+    id: str
+    kind: str
+    n_samples: int
+    n_features: int
+    size_bytes: int
+    params: Optional[str] = None
+    created_at: Optional[datetime] = None
+    last_accessed_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class ColumnSummary(BaseModel):
+    name: str
+    dtype: str  # integer, float, categorical, empty
+    count: int
+    missing: int
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    histogram: Optional[Dict[str, List[float]]] = None
+    top_values: Optional[Dict[str, int]] = None
+
+class DatasetUploadResponse(BaseModel):
+    dataset: DatasetInfo
+    n_rows: int
+    # Строки без значения целевого столбца (в датасет не попали)
+    dropped_rows: int = 0
+    feature_columns: List[str]
+    target_column: Optional[str] = None
+    classes: List[str] = []
+    columns: List[ColumnSummary]
+
+# Predict schemas
+class PredictRequest(BaseModel):
+    model_id: str
+    points: List[List[float]]
+
+class PredictResponse(BaseModel):
+    model_type: str
+    labels: List[int]
+    probabilities: Optional[List[List[float]]] = None
+
+class PreprocessingPreviewRequest(BaseModel):
+    data: ClassificationParams
+    n_rows: int = 10
+
+class PreprocessingPreviewResponse(BaseModel):
+    n_samples: int
+    feature_names: List[str]
+    statistics: Dict[str, List[Dict[str, object]]]
+    rows: List[List[Optional[float]]]
+
+# Density clustering schemas
+class DensityClusteringParams(BaseModel):
+    eps: float = 0.5
+    min_samples: int = 5
+    data: Optional[ClusteringParams] = None
+
+class DensityClusteringResponse(BaseModel):
+    x: List[List[float]]
+    labels: List[int]
+    n_clusters: int
+    n_noise: int
+    n_core: int
+    silhouette_score: Optional[float] = None
+    graph_cached: bool
+    sampling: Optional[DisplaySampling] = None
+    # Готовая Plotly фигура (если запрошена параметром figure)
+    figure: Optional[Dict[str, Any]] = None
+
+# Scheduler metrics schemas
+class SchedulerLaneStats(BaseModel):
+    queued: int
+    users: int
+    running: int
+
+class SchedulerMetrics(BaseModel):
+    workers: int
+    high_priority_burst: int
+    lanes: Dict[str, SchedulerLaneStats]
+
+# Simulation job schemas
+class JobInfo(BaseModel):
+    id: str
+    kind: str
+    status: str
+    progress: float
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    # Результат симулятора (когда status == "done")
+    result: Optional[Any] = None
+    
+    class Config:
+        from_attributes = True
+
+# Simulator usage schemas
+class UsageRow(BaseModel):
+    user_id: int
+    email: Optional[str] = None
+    endpoint: str
+    calls: int
+    cpu_seconds: float
+    wall_seconds: float
+    peak_memory_mb: float
+
+class UsageReport(BaseModel):
+    since: datetime
+    rows: List[UsageRow]
+
+class UserUsage(BaseModel):
+    cpu_seconds: float
+    # Квота CPU за окно (None - без ограничений)
+    cpu_quota_seconds: Optional[float] = None
+    window_seconds: float
+    endpoints: List[UsageRow]
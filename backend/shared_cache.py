@@ -0,0 +1,208 @@
+"""
+Общий для процессов кэш массивов в shared memory
+
+При нескольких воркерах uvicorn каждый процесс генерировал бы свою копию
+популярных датасетов. Здесь массивы записываются один раз в сегмент
+multiprocessing.shared_memory, а небольшой индексный файл (JSON) хранит,
+в каком сегменте и по какому смещению лежит каждый массив.
+
+Читатели не берут блокировок: индекс заменяется атомарно (os.replace),
+поэтому всегда читается целиком, а сегмент, удаленный писателем после
+чтения индекса, просто дает промах. Писатели сериализуются через flock
+на файле рядом с индексом. Уже открытые массивы остаются валидными и
+после удаления сегмента из индекса - память освобождается, когда их
+закроют все процессы.
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+
+from ml_cache import LRUCache
+
+try:
+    import fcntl
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Windows: общий кэш отключается, остается кэш процесса
+    fcntl = None
+    shared_memory = None
+
+SHARED_CACHE_ENABLED = os.getenv("ML_SHARED_CACHE", "1") == "1"
+SHARED_CACHE_DIR = os.getenv("ML_SHARED_CACHE_DIR", "./shared_cache")
+SHARED_CACHE_BYTES = int(os.getenv("ML_SHARED_CACHE_MB", "256")) * 1024 * 1024
+# Мелкие массивы быстрее сгенерировать заново, чем открывать сегмент
+SHARED_CACHE_MIN_BYTES = int(os.getenv("ML_SHARED_CACHE_MIN_KB", "64")) * 1024
+
+_ALIGNMENT = 64
+
+
+if shared_memory is not None:
+    class _Segment(shared_memory.SharedMemory):
+        """
+        Сегмент, который не закрывается сборщиком мусора
+
+        На буфер ссылаются numpy массивы, а close() при живых ссылках
+        падает с BufferError - mmap освободится сам вместе с массивами.
+        """
+
+        def __del__(self):
+            pass
+
+
+def _open_segment(name: str, create: bool = False, size: int = 0):
+    segment = _Segment(name=name, create=create, size=size)
+    # Временем жизни сегментов управляет индекс: без этого resource_tracker
+    # удалил бы сегмент при выходе процесса, который его создал или открыл
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def _unlink(name: str):
+    try:
+        segment = _open_segment(name)
+    except FileNotFoundError:
+        return
+    segment.unlink()
+    segment.close()
+
+
+class SharedArrayCache:
+    """Кэш наборов numpy массивов (например, X и y) по ключу, общий для процессов хоста"""
+
+    def __init__(self, root: str = SHARED_CACHE_DIR, max_bytes: int = SHARED_CACHE_BYTES,
+                 min_bytes: int = SHARED_CACHE_MIN_BYTES,
+                 enabled: bool = SHARED_CACHE_ENABLED and shared_memory is not None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self.enabled = enabled
+        self._index_path = os.path.join(root, "index.json")
+        self._lock_path = os.path.join(root, "index.lock")
+        # Разобранный индекс и stat файла, по которому он прочитан
+        self._index = ({}, None)
+        # Уже открытые в этом процессе массивы: повторные запросы не трогают индекс
+        self._local = LRUCache(maxsize=32)
+
+    def _read_index(self) -> dict:
+        try:
+            stat = os.stat(self._index_path)
+        except FileNotFoundError:
+            return {}
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        index, cached_version = self._index
+        if cached_version != version:
+            with open(self._index_path) as f:
+                index = json.load(f)
+            self._index = (index, version)
+        return index
+
+    def _write_index(self, index: dict):
+        tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _attach(self, entry: dict):
+        """Массивы записи индекса (None, если сегмент уже удален)"""
+        try:
+            segment = _open_segment(entry["segment"])
+        except FileNotFoundError:
+            return None
+        arrays = []
+        for dtype, shape, offset in entry["arrays"]:
+            array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=segment.buf, offset=offset)
+            # Сегмент общий для всех процессов - меняющий массив код испортил бы данные соседям
+            array.flags.writeable = False
+            arrays.append(array)
+        return tuple(arrays)
+
+    def get(self, key: str):
+        """Кортеж массивов по ключу или None"""
+        arrays = self._local.get(key)
+        if arrays is not None or not self.enabled:
+            return arrays
+        entry = self._read_index().get(key)
+        if entry is None:
+            return None
+        arrays = self._attach(entry)
+        if arrays is not None:
+            self._local.set(key, arrays)
+        return arrays
+
+    def _publish(self, key: str, arrays: tuple):
+        """Записывает массивы в новый сегмент и добавляет его в индекс"""
+        offsets, size = [], 0
+        for array in arrays:
+            offsets.append(size)
+            size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        name = f"mlb_{uuid.uuid4().hex[:20]}"
+        segment = _open_segment(name, create=True, size=max(size, 1))
+        try:
+            for array, offset in zip(arrays, offsets):
+                np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf, offset=offset)[...] = array
+            entry = {
+                "segment": name,
+                "arrays": [[array.dtype.str, list(array.shape), offset] for array, offset in zip(arrays, offsets)],
+                "size": size,
+                "created": time.time()
+            }
+
+            os.makedirs(self.root, exist_ok=True)
+            with open(self._lock_path, "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                index = dict(self._read_index())
+                existing = index.get(key)
+                if existing is not None:
+                    # Другой процесс успел раньше - берем его копию, если сегмент жив
+                    attached = self._attach(existing)
+                    if attached is not None:
+                        segment.unlink()
+                        return attached
+                    del index[key]
+                index[key] = entry
+                # Вытесняем самые старые записи, пока не уложимся в лимит
+                total = sum(item["size"] for item in index.values())
+                for old_key in sorted(index, key=lambda k: index[k]["created"]):
+                    if total <= self.max_bytes or old_key == key:
+                        continue
+                    total -= index[old_key]["size"]
+                    _unlink(index.pop(old_key)["segment"])
+                self._write_index(index)
+        except BaseException:
+            segment.unlink()
+            raise
+        finally:
+            # Запись закончена; читатели (и этот процесс) открывают сегмент заново
+            segment.close()
+        return self._attach(entry)
+
+    def get_or_create(self, key: str, create):
+        """
+        Массивы из общего кэша или create() с публикацией результата
+
+        create() возвращает кортеж numpy массивов. Маленькие результаты
+        (меньше min_bytes) в shared memory не попадают.
+        """
+        key = hashlib.sha1(key.encode()).hexdigest()
+        arrays = self.get(key)
+        if arrays is not None:
+            return arrays
+        arrays = tuple(np.ascontiguousarray(array) for array in create())
+        if not self.enabled or sum(array.nbytes for array in arrays) < self.min_bytes:
+            return arrays
+        try:
+            shared = self._publish(key, arrays)
+        except OSError as e:
+            # Нет места в /dev/shm или прав на каталог - работаем без общего кэша
+            print(f"Ошибка при записи в общий кэш датасетов: {e}")
+            return arrays
+        if shared is None:
+            return arrays
+        self._local.set(key, shared)
+        return shared
+
+
+shared_arrays = SharedArrayCache()
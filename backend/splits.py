@@ -0,0 +1,103 @@
+"""
+Разбиение данных на обучение и проверку для ML симуляторов
+
+Все симуляторы и эндпоинты со сравнением моделей делят данные здесь:
+разбиение возвращается индексами, а не копиями массивов, и кэшируется
+по датасету и сиду, поэтому одинаковые запросы не пересчитывают одну
+и ту же перестановку. По умолчанию разбиение стратифицировано -
+на несбалансированных данных доля редкого класса в train и test та же,
+что и во всем датасете.
+"""
+import numpy as np
+from sklearn.model_selection import train_test_split, KFold, StratifiedKFold
+
+from ml_cache import LRUCache, make_key
+
+TEST_SIZE = 0.3
+# Индексы больших датасетов не кэшируем: перестановка дешевле обучения, а память нужнее
+SPLIT_CACHE_MAX_SAMPLES = 200_000
+
+split_cache = LRUCache(maxsize=128)
+
+
+def _index_dtype(n: int):
+    return np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+
+def _readonly(*arrays):
+    # Индексы из кэша общие для запросов - менять их на месте нельзя
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays
+
+
+def _can_stratify(y, n_test: int) -> bool:
+    """Стратификация возможна, если в каждом классе хотя бы 2 объекта и test вмещает все классы"""
+    _, counts = np.unique(y, return_counts=True)
+    return counts.min() >= 2 and len(counts) <= n_test <= len(y) - len(counts)
+
+
+def _cached(key, n: int, compute, cached: bool = True):
+    """(значение, взято ли оно из кэша)"""
+    if not cached or n > SPLIT_CACHE_MAX_SAMPLES:
+        return compute(), False
+    value = split_cache.get(key)
+    if value is not None:
+        return value, True
+    value = compute()
+    split_cache.set(key, value)
+    return value, False
+
+
+def train_test_indices(y, dataset_key: str, random_state: int, stratified: bool = True,
+                       test_size: float = TEST_SIZE, cached: bool = True):
+    """
+    Индексы (train, test) для датасета
+
+    dataset_key однозначно определяет датасет (параметры генерации или id
+    сохраненного). Если стратифицировать нельзя (слишком редкий класс),
+    разбиение делается без стратификации. cached=False - не класть
+    разбиение в кэш (одноразовые датасеты сеток сценариев не должны
+    вытеснять разбиения интерактивных симуляторов).
+    """
+    y = np.asarray(y)
+    n = len(y)
+    key = make_key("train-test", dataset_key, n, test_size, stratified, random_state)
+
+    def compute():
+        indices = np.arange(n, dtype=_index_dtype(n))
+        n_test = int(np.ceil(test_size * n))
+        stratify = y if stratified and _can_stratify(y, n_test) else None
+        train_idx, test_idx = train_test_split(
+            indices, test_size=test_size, random_state=random_state, stratify=stratify
+        )
+        return _readonly(train_idx, test_idx)
+
+    return _cached(key, n, compute, cached)[0]
+
+
+def kfold_indices(y, dataset_key: str, n_splits: int, stratified: bool, shuffle: bool,
+                  random_state: int):
+    """
+    Индексы (train, test) для каждого фолда кросс-валидации
+
+    Возвращает (фолды, взяты ли они из кэша). ValueError от sklearn
+    (например, фолдов больше, чем объектов класса) пробрасывается.
+    """
+    y = np.asarray(y)
+    n = len(y)
+    random_state = random_state if shuffle else None
+    key = make_key("kfold", dataset_key, n, n_splits, stratified, shuffle, random_state)
+
+    def compute():
+        if stratified:
+            splitter = StratifiedKFold(n_splits=n_splits, shuffle=shuffle, random_state=random_state)
+        else:
+            splitter = KFold(n_splits=n_splits, shuffle=shuffle, random_state=random_state)
+        dtype = _index_dtype(n)
+        return [
+            _readonly(train_idx.astype(dtype), test_idx.astype(dtype))
+            for train_idx, test_idx in splitter.split(np.zeros((n, 1)), y)
+        ]
+
+    return _cached(key, n, compute)
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Пути к SQLite, датасетам, заданиям и дисковому кэшу относительные, а модули
+# бэкенда открывают их при импорте - переходим во временную папку заранее
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="ml-course-tests-"))
+os.environ.setdefault("ML_SHARED_CACHE", "0")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient приложения от имени тестового пользователя"""
+    from fastapi.testclient import TestClient
+
+    import main
+    from database import SessionLocal
+    from models import User
+    from routers.auth import get_current_user
+
+    db = SessionLocal()
+    user = User(email="student@example.com", hashed_password="x", full_name="Student")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+
+    main.app.dependency_overrides[get_current_user] = lambda: user
+    with TestClient(main.app) as test_client:
+        yield test_client
+    main.app.dependency_overrides.clear()
@@ -0,0 +1,50 @@
+import pytest
+
+import figures
+from routers.ml_simulator import figure_cache
+
+SMALL_CLASSIFICATION = {"n_samples": 100, "random_state": 7}
+SMALL_CLUSTERING = {"n_samples": 100, "random_state": 7}
+
+
+@pytest.mark.parametrize("method, url, body", [
+    ("post", "/api/ml/linear-regression/interactive?slope=2&intercept=1", None),
+    ("get", "/api/ml/metrics-comparison", None),
+    ("post", "/api/ml/linear-regression/batch", [{"slope": 1, "intercept": 0}, {"slope": 2, "intercept": 1}]),
+    ("post", "/api/ml/logistic-regression/batch", [SMALL_CLASSIFICATION]),
+    ("post", "/api/ml/knn-classification/batch", [SMALL_CLASSIFICATION]),
+    ("post", "/api/ml/kmeans-clustering/batch", [SMALL_CLUSTERING]),
+    ("post", "/api/ml/logistic-regression/ensemble?n_seeds=3", SMALL_CLASSIFICATION),
+    ("post", "/api/ml/knn-classification/ensemble?n_seeds=3", SMALL_CLASSIFICATION),
+    ("post", "/api/ml/kmeans-clustering/ensemble?n_seeds=3", SMALL_CLUSTERING),
+])
+def test_endpoint_returns_figure(client, method, url, body):
+    separator = "&" if "?" in url else "?"
+    response = client.request(method, f"{url}{separator}figure=true", json=body)
+    assert response.status_code == 200
+    results = response.json()
+    for result in results if isinstance(results, list) else [results]:
+        assert result["figure"]["data"]
+
+
+@pytest.mark.parametrize("url, body, builder", [
+    ("/api/ml/dbscan-clustering", {"eps": 0.3, "data": {"n_samples": 200, "dataset_shape": "moons"}},
+     "clustering_figure"),
+    ("/api/ml/cross-validation", {"model_type": "logistic", "n_splits": 3,
+                                  "classification": SMALL_CLASSIFICATION}, "cross_validation_figure"),
+])
+def test_uncached_results_reuse_cached_figure(client, monkeypatch, url, body, builder):
+    figure_cache.clear()
+    calls = []
+    build = getattr(figures, builder)
+
+    def counting_build(*args, **kwargs):
+        calls.append(1)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(figures, builder, counting_build)
+    first = client.post(f"{url}?figure=true", json=body)
+    second = client.post(f"{url}?figure=true", json=body)
+    assert first.status_code == second.status_code == 200
+    assert first.json()["figure"] == second.json()["figure"]
+    assert len(calls) == 1
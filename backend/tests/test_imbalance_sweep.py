@@ -0,0 +1,20 @@
+from routers.ml_simulator import result_cache
+from splits import split_cache
+
+
+def test_sweep_does_not_evict_interactive_caches(client):
+    split_cache.clear()
+    result_cache.clear()
+    classifier = client.post("/api/ml/logistic-regression", json={"n_samples": 120, "random_state": 17})
+    assert classifier.status_code == 200
+    cached_splits, cached_results = len(split_cache), len(result_cache)
+
+    response = client.post("/api/ml/metrics-comparison/sweep", json={
+        "minority_fractions": [0.5, 0.2, 0.1], "sample_sizes": [100, 200], "n_seeds": 2,
+        "random_state": 17
+    })
+    assert response.status_code == 200
+    assert "event: done" in response.text
+    # Ячейки сетки не попали ни в кэш разбиений, ни в кэш результатов симуляторов
+    assert len(split_cache) == cached_splits
+    assert len(result_cache) == cached_results
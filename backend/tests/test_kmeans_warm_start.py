@@ -0,0 +1,32 @@
+from routers.ml_simulator import centroid_cache, result_cache
+
+# Тело запроса, которое по умолчанию отправляет KMeansClusteringSimulator.tsx
+DEFAULT_REQUEST = {
+    "n_samples": 300,
+    "n_features": 2,
+    "n_clusters": 3,
+    "n_centers": 3,
+    "cluster_std": 1.0,
+    "random_state": 42,
+}
+
+
+def test_changing_n_clusters_warm_starts_on_same_data(client):
+    centroid_cache.clear()
+    result_cache.clear()
+
+    first = client.post("/api/ml/kmeans-clustering", json=DEFAULT_REQUEST)
+    assert first.status_code == 200
+    assert first.json()["warm_started"] is False
+
+    # Студент сдвигает ползунок числа кластеров на ±1
+    for n_clusters in (4, 2):
+        response = client.post(
+            "/api/ml/kmeans-clustering", json={**DEFAULT_REQUEST, "n_clusters": n_clusters}
+        )
+        assert response.status_code == 200
+        body = response.json()
+        # Датасет тот же, меняется только число кластеров
+        assert body["x"] == first.json()["x"]
+        assert len(body["centroids"]) == n_clusters
+        assert body["warm_started"] is True
@@ -0,0 +1,15 @@
+def test_oversized_stream_is_rejected_before_streaming(client):
+    response = client.post("/api/ml/linear-regression/stream", json={
+        "method": "sgd", "n_points": 50_000_000, "chunk_size": 1000
+    })
+    assert response.status_code == 413
+
+
+def test_admitted_stream_reports_estimate(client):
+    response = client.post("/api/ml/linear-regression/stream", json={
+        "n_points": 20_000, "chunk_size": 1000, "report_every": 5, "sample_points": 10
+    })
+    assert response.status_code == 200
+    assert float(response.headers["X-Cost-Estimated-CPU"]) > 0
+    assert response.text.count("event: state") == 4
+    assert "event: done" in response.text
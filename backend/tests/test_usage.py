@@ -0,0 +1,26 @@
+def _endpoint_usage(client, endpoint: str) -> dict:
+    rows = client.get("/api/ml/usage/me").json()["endpoints"]
+    return next((row for row in rows if row["endpoint"] == endpoint), {"calls": 0, "cpu_seconds": 0.0})
+
+
+def test_cross_validation_is_one_call_with_fold_cpu(client):
+    before = _endpoint_usage(client, "/api/ml/cross-validation")
+    response = client.post("/api/ml/cross-validation", json={
+        "model_type": "knn", "n_splits": 8, "classification": {"n_samples": 2000, "random_state": 11}
+    })
+    assert response.status_code == 200
+    after = _endpoint_usage(client, "/api/ml/cross-validation")
+    # Фолды считаются отдельными заданиями пула, но вызов - один
+    assert after["calls"] - before["calls"] == 1
+    assert after["cpu_seconds"] > before["cpu_seconds"]
+
+
+def test_cached_ensemble_is_still_a_call(client):
+    url = "/api/ml/logistic-regression/ensemble?n_seeds=3"
+    body = {"n_samples": 100, "random_state": 13}
+    before = _endpoint_usage(client, "/api/ml/logistic-regression/ensemble")
+    # Второй ответ берется из кэша в event loop, без заданий пула
+    for _ in range(2):
+        assert client.post(url, json=body).status_code == 200
+    after = _endpoint_usage(client, "/api/ml/logistic-regression/ensemble")
+    assert after["calls"] - before["calls"] == 2
@@ -0,0 +1,297 @@
+"""
+Учет ресурсов ML симуляторов по пользователям
+
+Каждый запрос /api/ml/* - один вызов в агрегате в памяти (пользователь,
+эндпоинт, минута): UsageMiddleware записывает его wall время до
+последнего байта ответа (с потоком SSE), а задания пула воркеров,
+запущенные запросом, добавляют к этой же записи CPU время своего потока
+и пиковую память. Ответы из кэша тоже учитываются как вызовы. Задания,
+которые продолжают работать после ответа (фоновые задания), дописывают
+свой CPU в агрегат отдельно, без нового вызова. Агрегат периодически
+сбрасывается в таблицу simulator_usage, по которой считаются скользящие
+квоты и отчет для администраторов.
+
+Пиковая память - прирост RSS процесса за время задания: пока идут
+задания, фоновый поток раз в MEMORY_SAMPLE_SECONDS читает RSS
+(tracemalloc точнее, но замедляет numpy/sklearn в разы). Потоки делят
+одну кучу, поэтому при параллельных заданиях пик включает и чужие
+выделения (оценка сверху), а короткие всплески между замерами теряются.
+"""
+import atexit
+import contextvars
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import SimulatorUsage
+
+TRACK_MEMORY = os.getenv("ML_TRACK_MEMORY", "1") == "1"
+MEMORY_SAMPLE_SECONDS = float(os.getenv("ML_MEMORY_SAMPLE_SECONDS", "0.02"))
+USAGE_FLUSH_SECONDS = float(os.getenv("ML_USAGE_FLUSH_SECONDS", "30"))
+# Скользящая квота CPU на пользователя (0 - без ограничений)
+USER_CPU_QUOTA_SECONDS = float(os.getenv("ML_USER_CPU_QUOTA_SECONDS", "600"))
+USER_QUOTA_WINDOW_SECONDS = float(os.getenv("ML_USER_QUOTA_WINDOW_SECONDS", "3600"))
+ADMIN_EMAILS = {
+    email.strip().lower() for email in os.getenv("ML_ADMIN_EMAILS", "").split(",") if email.strip()
+}
+
+
+def _period(moment: datetime) -> datetime:
+    return moment.replace(second=0, microsecond=0)
+
+
+def _rss() -> int:
+    """Текущий RSS процесса в байтах (0, если /proc недоступен)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class _Measurement:
+    def __init__(self):
+        self.base = 0
+        self.peak = 0
+
+
+class RequestUsage:
+    """Стоимость одного запроса: его задания пула копят CPU и пик памяти до записи в агрегат"""
+
+    def __init__(self):
+        self.user_id = None
+        self.endpoint = None
+        self.cpu = 0.0
+        self.peak = 0
+        self.recorded = False
+
+
+# Запрос, к которому относятся задания пула (задается UsageMiddleware)
+_current_request = contextvars.ContextVar("ml_request_usage", default=None)
+
+
+def current_request():
+    return _current_request.get()
+
+
+class UsageMeter:
+    """Агрегат использования ресурсов с периодическим сбросом в БД"""
+
+    def __init__(self, track_memory: bool = TRACK_MEMORY, flush_seconds: float = USAGE_FLUSH_SECONDS):
+        self.track_memory = track_memory
+        self._lock = threading.Condition()
+        # (пользователь, эндпоинт, минута) -> [вызовы, CPU, wall, пик памяти]
+        self._totals = {}
+        # Задания, для которых сейчас считается пиковая память
+        self._measuring = set()
+        if track_memory:
+            threading.Thread(target=self._sample_loop, name="ml-usage-memory", daemon=True).start()
+        if flush_seconds > 0:
+            threading.Thread(
+                target=self._flush_loop, args=(flush_seconds,), name="ml-usage-flush", daemon=True
+            ).start()
+
+    def measure(self, request: RequestUsage, job):
+        """
+        Выполняет job() и добавляет его CPU и пиковую память к запросу request
+
+        Если запрос уже записан (задание пережило ответ), CPU сразу
+        добавляется к агрегату пользователя без нового вызова.
+        """
+        if request is None:
+            return job()
+        measurement = self._start_memory()
+        cpu_started = time.thread_time()
+        try:
+            return job()
+        finally:
+            cpu = time.thread_time() - cpu_started
+            peak = self._stop_memory(measurement)
+            with self._lock:
+                if request.recorded:
+                    self._add(request.user_id, request.endpoint, 0, cpu, 0.0, peak)
+                else:
+                    request.cpu += cpu
+                    request.peak = max(request.peak, peak)
+
+    def start_request(self) -> RequestUsage:
+        """Начинает учет запроса: задания пула в этом контексте относятся к нему"""
+        request = RequestUsage()
+        _current_request.set(request)
+        return request
+
+    def finish_request(self, request: RequestUsage, wall: float):
+        """Записывает запрос в агрегат: один вызов, его wall время и CPU его заданий"""
+        with self._lock:
+            request.recorded = True
+            if request.user_id is not None:
+                self._add(request.user_id, request.endpoint, 1, request.cpu, wall, request.peak)
+
+    def _add(self, user_id, endpoint: str, calls: int, cpu: float, wall: float, peak: int):
+        totals = self._totals.setdefault((user_id, endpoint, _period(datetime.utcnow())), [0, 0.0, 0.0, 0])
+        totals[0] += calls
+        totals[1] += cpu
+        totals[2] += wall
+        totals[3] = max(totals[3], peak)
+
+    def _record_rss(self):
+        rss = _rss()
+        for measurement in self._measuring:
+            measurement.peak = max(measurement.peak, rss - measurement.base)
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                while not self._measuring:
+                    self._lock.wait()
+                self._record_rss()
+            time.sleep(MEMORY_SAMPLE_SECONDS)
+
+    def _start_memory(self):
+        if not self.track_memory:
+            return None
+        measurement = _Measurement()
+        measurement.base = _rss()
+        with self._lock:
+            self._measuring.add(measurement)
+            self._lock.notify()
+        return measurement
+
+    def _stop_memory(self, measurement) -> int:
+        if measurement is None:
+            return 0
+        with self._lock:
+            self._record_rss()
+            self._measuring.discard(measurement)
+        return measurement.peak
+
+    def _flush_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Ошибка при сохранении статистики симуляторов: {e}")
+
+    def flush(self):
+        """Переносит накопленный агрегат в таблицу simulator_usage"""
+        with self._lock:
+            totals, self._totals = self._totals, {}
+        if not totals:
+            return
+        db = SessionLocal()
+        try:
+            for (user_id, endpoint, period), (calls, cpu, wall, peak) in totals.items():
+                row = db.query(SimulatorUsage).filter(
+                    SimulatorUsage.user_id == user_id,
+                    SimulatorUsage.endpoint == endpoint,
+                    SimulatorUsage.period_start == period
+                ).first()
+                if row is None:
+                    row = SimulatorUsage(
+                        user_id=user_id, endpoint=endpoint, period_start=period,
+                        calls=0, cpu_seconds=0.0, wall_seconds=0.0, peak_memory_bytes=0
+                    )
+                    db.add(row)
+                row.calls += calls
+                row.cpu_seconds += cpu
+                row.wall_seconds += wall
+                row.peak_memory_bytes = max(row.peak_memory_bytes, peak)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Не теряем статистику: вернем ее в агрегат до следующей попытки
+            with self._lock:
+                for key, values in totals.items():
+                    current = self._totals.setdefault(key, [0, 0.0, 0.0, 0])
+                    current[0] += values[0]
+                    current[1] += values[1]
+                    current[2] += values[2]
+                    current[3] = max(current[3], values[3])
+            raise
+        finally:
+            db.close()
+
+    def cpu_used(self, db: Session, user_id: int, since: datetime) -> float:
+        """CPU секунды пользователя с момента since: из БД и еще не сброшенные"""
+        stored = db.query(func.sum(SimulatorUsage.cpu_seconds)).filter(
+            SimulatorUsage.user_id == user_id,
+            SimulatorUsage.period_start >= _period(since)
+        ).scalar() or 0.0
+        with self._lock:
+            pending = sum(
+                values[1] for (uid, _, period), values in self._totals.items()
+                if uid == user_id and period >= _period(since)
+            )
+        return stored + pending
+
+    def check_quota(self, db: Session, user_id: int):
+        """HTTPException 429, если пользователь исчерпал скользящую квоту CPU"""
+        if USER_CPU_QUOTA_SECONDS <= 0:
+            return
+        since = datetime.utcnow() - timedelta(seconds=USER_QUOTA_WINDOW_SECONDS)
+        used = self.cpu_used(db, user_id, since)
+        if used >= USER_CPU_QUOTA_SECONDS:
+            raise HTTPException(
+                status_code=429,
+                detail=(
+                    f"Simulator CPU quota exceeded: {used:.0f} of {USER_CPU_QUOTA_SECONDS:.0f} s "
+                    f"in the last {USER_QUOTA_WINDOW_SECONDS / 60:.0f} min"
+                ),
+                # Статистика хранится поминутно - через минуту окно сдвинется
+                headers={"Retry-After": "60"}
+            )
+
+
+class UsageMiddleware:
+    """
+    Учет каждого запроса с путем под prefix
+
+    ASGI middleware, а не зависимость: приложение возвращает управление
+    только после отправки всего ответа, поэтому wall время потоковых
+    ответов считается целиком. Пользователя и эндпоинт задают зависимости
+    роутеров (set_job_context); запросы без пользователя не учитываются.
+    """
+
+    def __init__(self, app, prefix: str = "/api/ml/"):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        request = usage_meter.start_request()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            usage_meter.finish_request(request, time.perf_counter() - started)
+
+
+def endpoint_of(request) -> str:
+    """Шаблон пути эндпоинта с префиксом роутера (без значений параметров пути)"""
+    path = request.url.path
+    route = request.scope.get("route")
+    if route is None:
+        return path
+    # Путь маршрута задан относительно роутера - префикс берем из URL
+    rendered = route.path_format.format(**request.path_params)
+    if path.endswith(rendered):
+        return path[:len(path) - len(rendered)] + route.path
+    return route.path
+
+
+def is_admin(user) -> bool:
+    return user.email is not None and user.email.lower() in ADMIN_EMAILS
+
+
+usage_meter = UsageMeter()
+# Несброшенный агрегат сохраняем при остановке воркера
+atexit.register(usage_meter.flush)
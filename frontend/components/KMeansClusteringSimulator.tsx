@@ -23,6 +23,9 @@ interface SimulatorParams {
   n_samples: number
   n_features: number
   n_clusters: number
+  // Число центров в сгенерированных данных: отдельно от n_clusters, чтобы
+  // смена числа кластеров не меняла датасет и K-means стартовал с прошлых центроидов
+  n_centers: number
   cluster_std: number
   random_state: number
 }
@@ -33,6 +36,7 @@ export default function KMeansClusteringSimulator() {
     n_samples: 300,
     n_features: 2,
     n_clusters: 3,
+    n_centers: 3,
     cluster_std: 1.0,
     random_state: 42
   })
@@ -56,6 +60,11 @@ export default function KMeansClusteringSimulator() {
         body: JSON.stringify(params)
       })
 
+      // 409 и 499: запрос вытеснен более новым (движение слайдера) или отменен - это не ошибка
+      if (response.status === 409 || response.status === 499) {
+        return
+      }
+
       if (!response.ok) {
         throw new Error('Ошибка загрузки данных')
       }
@@ -79,6 +88,7 @@ export default function KMeansClusteringSimulator() {
       n_samples: 300,
       n_features: 2,
       n_clusters: 3,
+      n_centers: 3,
       cluster_std: 1.0,
       random_state: 42
     })
@@ -275,7 +285,7 @@ export default function KMeansClusteringSimulator() {
           </button>
         </div>
 
-        <div className="grid md:grid-cols-3 gap-4">
+        <div className="grid md:grid-cols-4 gap-4">
           <div>
             <label className="block text-sm font-medium text-gray-700 mb-2">
               Количество кластеров
@@ -292,6 +302,22 @@ export default function KMeansClusteringSimulator() {
             <span className="text-sm text-gray-600">{params.n_clusters}</span>
           </div>
 
+          <div>
+            <label className="block text-sm font-medium text-gray-700 mb-2">
+              Центров в данных
+            </label>
+            <input
+              type="range"
+              min="2"
+              max="6"
+              step="1"
+              value={params.n_centers}
+              onChange={(e) => handleParamChange('n_centers', parseInt(e.target.value))}
+              className="w-full"
+            />
+            <span className="text-sm text-gray-600">{params.n_centers}</span>
+          </div>
+
           <div>
             <label className="block text-sm font-medium text-gray-700 mb-2">
               Разброс кластеров
@@ -61,6 +61,11 @@ export default function KNNClassificationSimulator() {
         body: JSON.stringify({ k, ...params })
       })
 
+      // 409 и 499: запрос вытеснен более новым (движение слайдера) или отменен - это не ошибка
+      if (response.status === 409 || response.status === 499) {
+        return
+      }
+
       if (!response.ok) {
         throw new Error('Ошибка загрузки данных')
       }
@@ -61,6 +61,11 @@ export default function LogisticRegressionSimulator() {
         body: JSON.stringify(params)
       })
 
+      // 409 и 499: запрос вытеснен более новым (движение слайдера) или отменен - это не ошибка
+      if (response.status === 409 || response.status === 499) {
+        return
+      }
+
       if (!response.ok) {
         throw new Error('Ошибка загрузки данных')
       }